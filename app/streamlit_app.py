@@ -15,6 +15,7 @@ sys.path.insert(0, str(project_root))
 
 from src.game.game_flow import GameFlow
 from src.visualization.visualizer import GameVisualizer
+from src.utils.config import get_player_setup, load_config
 from src.utils.helpers import format_game_log
 
 
@@ -50,15 +51,26 @@ def main():
         use_memory = st.checkbox("启用记忆管理", value=True)
         max_rounds = st.slider("最大轮数", 1, 20, 10)
         
-        # 玩家设置
+        # 玩家设置（默认值读取 config/game_config.yaml）
         st.subheader("玩家设置")
-        default_players = ["Alice", "Bob", "Charlie", "David", "Eve"]
+        config = load_config()
+        default_players, default_werewolves = get_player_setup(config)
+        lobby_config = (config.get("game") or {}).get("lobby") or {}
         player_input = st.text_area(
             "玩家名称（每行一个）",
             value="\n".join(default_players),
             height=100
         )
         players = [p.strip() for p in player_input.split("\n") if p.strip()]
+        max_werewolves = max(1, (len(players) - 1) // 2)
+        num_werewolves = st.number_input(
+            "狼人数量",
+            min_value=1,
+            max_value=max_werewolves,
+            value=min(default_werewolves, max_werewolves)
+        )
+        digest_size = lobby_config.get("digest_size")
+        chunk_size = lobby_config.get("chunk_size")
     
     # 主界面
     tab1, tab2, tab3, tab4 = st.tabs(["🎮 运行游戏", "📊 游戏日志", "💭 思考链追踪", "💰 成本分析"])
@@ -79,11 +91,15 @@ def main():
             with st.spinner("游戏进行中..."):
                 try:
                     game = GameFlow(
-                        players=players[:5],  # 只取前5个
+                        players=players,
                         api_key=api_key,
                         base_url=base_url if api_type == "DeepSeek" else None,
                         use_rag=use_rag,
-                        use_memory=use_memory
+                        use_memory=use_memory,
+                        num_werewolves=int(num_werewolves),
+                        digest_size=digest_size,
+                        chunk_size=chunk_size,
+                        async_mode=chunk_size is not None and len(players) > chunk_size
                     )
                     
                     result = game.run(max_rounds=max_rounds, save_log=True)
@@ -0,0 +1,83 @@
+"""
+批量运行狼人杀游戏，统计胜率
+"""
+
+import argparse
+from dotenv import load_dotenv
+from src.game.batch_runner import BatchRunner
+from src.utils.config import get_player_setup, load_config
+
+# 加载环境变量
+load_dotenv()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="批量运行狼人杀游戏，统计胜率")
+    parser.add_argument("-n", "--games", type=int, default=100, help="对局数")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="工作进程数")
+    parser.add_argument("-o", "--output", default="./logs/batch.jsonl",
+                        help="结果 JSONL 文件（已存在时跳过其中已完成的对局）")
+    parser.add_argument("--seed", type=int, default=0, help="第 i 局使用 seed + i 作为随机种子")
+    parser.add_argument("--players", nargs="+", help="玩家名称（默认读取 game.players 配置）")
+    parser.add_argument("--werewolves", type=int, help="狼人数量（默认读取 game.players 配置）")
+    parser.add_argument("--max-rounds", type=int, default=10, help="每局最大轮数")
+    parser.add_argument("--backend", choices=["openai", "stub"], default="openai", help="LLM 后端")
+    parser.add_argument("--no-rag", action="store_true", help="关闭 RAG")
+    parser.add_argument("--verbose", action="store_true", help="显示每局游戏的输出")
+    args = parser.parse_args()
+    
+    # 读取 config/game_config.yaml
+    config = load_config()
+    players, num_werewolves = get_player_setup(config)
+    players = args.players or players
+    num_werewolves = args.werewolves or num_werewolves
+    game_config = config.get("game") or {}
+    lobby_config = game_config.get("lobby") or {}
+    chunk_size = lobby_config.get("chunk_size")
+    discussion_config = game_config.get("discussion") or {}
+    discussion_mode = discussion_config.get("mode", "sequential")
+    
+    runner = BatchRunner(
+        num_games=args.games,
+        output_path=args.output,
+        players=players,
+        workers=args.workers,
+        base_seed=args.seed,
+        max_rounds=args.max_rounds,
+        game_options={
+            "llm_backend": args.backend,
+            "use_rag": not args.no_rag,
+            "prompt_budget": config.get("prompt_budget"),
+            "llm_config": config.get("llm"),
+            "discussion_mode": discussion_mode,
+            "rebuttal": discussion_config.get("rebuttal", False),
+            "pipelined_discussion": discussion_config.get("pipelined", False),
+            "num_werewolves": num_werewolves,
+            "digest_size": lobby_config.get("digest_size"),
+            "chunk_size": chunk_size,
+            "async_mode": discussion_mode == "simultaneous" or (chunk_size is not None and len(players) > chunk_size)
+        },
+        rate_limit=config.get("rate_limit"),
+        resilience=config.get("resilience"),
+        http_client=config.get("http_client"),
+        quiet=not args.verbose
+    )
+    report = runner.run()
+    
+    # 打印汇总
+    print("\n" + "="*50)
+    print(f"批量对局结果（{report['games']} 局，失败 {report['failed']} 局）")
+    print("="*50)
+    for side, stats in report["win_rates"].items():
+        print(f"  {side}: {stats['rate']:.1%}（95% CI {stats['ci_low']:.1%} - {stats['ci_high']:.1%}）")
+    print(f"  平均轮数: {report['rounds']['mean']:.2f}")
+    print(f"  每局 Token: 均值 {report['tokens_per_game']['mean']:,.0f}, p90 {report['tokens_per_game']['p90']:,.0f}")
+    latency = report["call_latency"]
+    print(f"  调用延迟: p50 {latency['p50']:.2f}s, p90 {latency['p90']:.2f}s, p99 {latency['p99']:.2f}s")
+    print(f"  报告: {runner.report_path}")
+    print("="*50)
+
+
+if __name__ == "__main__":
+    main()
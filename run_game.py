@@ -2,9 +2,16 @@
 运行狼人杀游戏的示例脚本
 """
 
+import argparse
 import os
 from dotenv import load_dotenv
+from src.game.checkpoint import create_checkpointer
 from src.game.game_flow import GameFlow
+from src.llm.cassette import Cassette
+from src.llm.client_pool import configure_client_pool
+from src.llm.rate_limiter import RateLimiter
+from src.llm.resilience import ResiliencePolicy
+from src.utils.config import get_player_setup, load_config
 
 # 加载环境变量
 load_dotenv()
@@ -12,18 +19,66 @@ load_dotenv()
 
 def main():
     """主函数"""
-    # 玩家列表
-    players = ["Alice", "Bob", "Charlie", "David", "Eve"]
+    parser = argparse.ArgumentParser(description="运行狼人杀游戏")
+    parser.add_argument("--resume", metavar="GAME_ID", help="从检查点续跑指定对局")
+    parser.add_argument("--record", metavar="PATH", help="录制对局（种子、角色和所有 LLM / 嵌入调用结果）到录像文件")
+    parser.add_argument("--replay", metavar="PATH", help="离线回放录像文件中的对局（使用录制时的游戏设置）")
+    args = parser.parse_args()
+    
+    if args.replay:
+        replay(args.replay)
+        return
+    
+    # 读取 config/game_config.yaml
+    config = load_config()
+    if config.get("http_client"):
+        configure_client_pool(**config["http_client"])
+    
+    # 玩家列表和狼人数量
+    players, num_werewolves = get_player_setup(config)
+    game_config = config.get("game") or {}
+    lobby_config = game_config.get("lobby") or {}
+    chunk_size = lobby_config.get("chunk_size")
+    
+    # 检查点存储
+    checkpoint_config = config.get("checkpoint") or {}
+    checkpointer = None
+    if checkpoint_config.get("enabled", False):
+        checkpointer = create_checkpointer(
+            checkpoint_config.get("path"),
+            keep_last=checkpoint_config.get("keep_last")
+        )
+    
+    # 发言模式（同时发言或大房间时使用异步节点并发调用）
+    discussion_config = game_config.get("discussion") or {}
+    discussion_mode = discussion_config.get("mode", "sequential")
     
     # 创建游戏
     game = GameFlow(
         players=players,
         use_rag=True,      # 启用 RAG 增强推理
-        use_memory=True    # 启用记忆管理
+        use_memory=True,   # 启用记忆管理
+        prompt_budget=config.get("prompt_budget"),
+        rate_limiter=RateLimiter.from_config(config.get("rate_limit")),
+        resilience=ResiliencePolicy.from_config(config.get("resilience")),
+        llm_config=config.get("llm"),
+        checkpointer=checkpointer,
+        discussion_mode=discussion_mode,
+        rebuttal=discussion_config.get("rebuttal", False),
+        pipelined_discussion=discussion_config.get("pipelined", False),
+        num_werewolves=num_werewolves,
+        digest_size=lobby_config.get("digest_size"),
+        chunk_size=chunk_size,
+        async_mode=discussion_mode == "simultaneous" or (chunk_size is not None and len(players) > chunk_size),
+        cassette=Cassette.record(args.record) if args.record else None
     )
     
-    # 运行游戏
-    result = game.run(max_rounds=10, save_log=True)
+    # 运行游戏（或从检查点续跑）
+    if args.resume:
+        result = game.resume(args.resume, save_log=True)
+    else:
+        print(f"对局 ID: {game.game_id}")
+        result = game.run(max_rounds=10, save_log=True)
     
     # 打印结果
     print("\n" + "="*50)
@@ -37,6 +92,34 @@ def main():
     print(f"  总调用次数: {cost_summary.get('total_calls', 0)}")
     print(f"  总 Token 数: {cost_summary.get('total_tokens', 0):,}")
     print(f"  平均延迟: {cost_summary.get('average_latency', 0):.2f}s")
+    print(f"  提示词缓存命中率: {cost_summary.get('prompt_cache', {}).get('hit_ratio', 0):.1%}")
+    for route, usage in cost_summary.get('route_usage', {}).items():
+        print(f"  路由 {route}: {usage['calls']} 次调用, {usage['total_tokens']:,} tokens, "
+              f"平均延迟 {usage['average_latency']:.2f}s")
+    pipeline_stats = result.get('pipeline_stats')
+    if pipeline_stats:
+        stages = ", ".join(
+            f"{stage} {stats['occupancy']:.0%}" for stage, stats in pipeline_stats['stages'].items()
+        )
+        print(f"  发言流水线占用率: {stages}（关键路径 {pipeline_stats['critical_stage']}）")
+    print("="*50)
+
+
+def replay(path: str):
+    """回放录像：不访问网络，检查游戏历史和思考链是否与录制时一致"""
+    cassette = Cassette.replay(path)
+    game = GameFlow(**cassette.game_options(), cassette=cassette)
+    result = game.run(max_rounds=cassette.meta.get("max_rounds", 10), save_log=True)
+    
+    stats = result["cassette_stats"]
+    print("\n" + "="*50)
+    print("回放结果")
+    print("="*50)
+    print(f"获胜方: {result['winner']}")
+    print(f"总轮数: {result['rounds']}")
+    print(f"  回放 LLM 调用: {stats['llm_replayed']}，嵌入调用: {stats['embeddings_replayed']}")
+    print(f"  未命中: {stats['misses']}，未使用的录制结果: {stats['unused']}")
+    print(f"  与录制时一致: {'是' if stats['transcript_match'] else '否'}")
     print("="*50)
 
 
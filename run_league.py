@@ -0,0 +1,71 @@
+"""
+运行联赛：在不同的 Agent 配置（性格 × 模型 × RAG / 记忆设置）之间对决，计算 Elo / TrueSkill 评分
+"""
+
+import argparse
+from dotenv import load_dotenv
+from src.game.league import League
+from src.utils.config import get_player_setup, load_config
+
+# 加载环境变量
+load_dotenv()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="在不同的 Agent 配置之间运行联赛，计算 Elo / TrueSkill 评分")
+    parser.add_argument("-m", "--matchups", type=int, help="对决数（每场两局，默认读取 league.matchups）")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="工作进程数")
+    parser.add_argument("-o", "--output", default="./logs/league.jsonl",
+                        help="对局记录 JSONL 文件（已存在时续跑；评分写入 <文件名>.ratings.json）")
+    parser.add_argument("--schedule", choices=["round_robin", "swiss"], help="调度方式（默认读取 league.schedule）")
+    parser.add_argument("--seed", type=int, default=0, help="第 i 场对决使用 seed + i 作为随机种子")
+    parser.add_argument("--max-rounds", type=int, default=10, help="每局最大轮数")
+    parser.add_argument("--backend", choices=["openai", "stub"], default="openai", help="LLM 后端")
+    parser.add_argument("--verbose", action="store_true", help="显示每局游戏的输出")
+    args = parser.parse_args()
+    
+    # 读取 config/game_config.yaml
+    config = load_config()
+    league_config = config.get("league") or {}
+    players, num_werewolves = get_player_setup(config)
+    
+    league = League(
+        configs=league_config.get("configs") or {},
+        num_matchups=args.matchups or league_config.get("matchups", 30),
+        output_path=args.output,
+        schedule=args.schedule or league_config.get("schedule", "round_robin"),
+        elo_k=league_config.get("elo_k", 24),
+        draw_probability=league_config.get("draw_probability", 0.1),
+        players=players,
+        workers=args.workers,
+        base_seed=args.seed,
+        max_rounds=args.max_rounds,
+        game_options={
+            "llm_backend": args.backend,
+            "prompt_budget": config.get("prompt_budget"),
+            "llm_config": config.get("llm"),
+            "num_werewolves": num_werewolves
+        },
+        rate_limit=config.get("rate_limit"),
+        resilience=config.get("resilience"),
+        http_client=config.get("http_client"),
+        quiet=not args.verbose,
+        response_cache_path=league_config.get("response_cache")
+    )
+    report = league.run()
+    
+    # 打印排行榜
+    print("\n" + "="*50)
+    print(f"联赛结果（{report['games']} 局）")
+    print("="*50)
+    for rank, row in enumerate(report["leaderboard"], 1):
+        print(f"  {rank}. {row['name']}: Elo {row['elo']:.0f}, TrueSkill {row['mu']:.1f} ± {row['sigma']:.1f}"
+              f"（{row['wins']} 胜 {row['draws']} 平 {row['losses']} 负）")
+    print(f"  评分: {league.ratings_path}")
+    print(f"  报告: {league.report_path}")
+    print("="*50)
+
+
+if __name__ == "__main__":
+    main()
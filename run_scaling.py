@@ -0,0 +1,95 @@
+"""
+大房间扩展性基准：玩家人数从 5 增加到 50 时每轮的 token 数和耗时
+每个人数分别用完整视图和大房间模式（摘要视图 + 分批并发）各运行一局
+"""
+
+import argparse
+import io
+import json
+import time
+from contextlib import redirect_stdout
+from dotenv import load_dotenv
+from src.game.game_flow import GameFlow
+from src.utils.config import load_config
+
+# 加载环境变量
+load_dotenv()
+
+
+def run_lobby(num_players: int, args, config: dict, digest_size, chunk_size) -> dict:
+    """运行一局并返回每轮平均的调用数、token 数和耗时"""
+    players = [f"P{seat}" for seat in range(1, num_players + 1)]
+    num_werewolves = max(1, round(num_players * args.werewolf_ratio))
+    large_lobby = digest_size is not None
+    game = GameFlow(
+        players=players,
+        llm_backend=args.backend,
+        stub_options={"latency": args.latency},
+        seed=args.seed,
+        use_rag=not args.no_rag,
+        prompt_budget=config.get("prompt_budget"),
+        llm_config=config.get("llm"),
+        num_werewolves=num_werewolves,
+        digest_size=digest_size,
+        chunk_size=chunk_size,
+        async_mode=large_lobby
+    )
+
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        result = game.run(max_rounds=args.rounds, save_log=False)
+    elapsed = time.perf_counter() - start
+
+    rounds = max(result["rounds"], 1)
+    cost_summary = result["cost_summary"]
+    calls = cost_summary.get("total_calls", 0)
+    prompt_tokens = game.cost_tracker.get_prompt_tokens()
+    return {
+        "players": num_players,
+        "werewolves": num_werewolves,
+        "mode": "large_lobby" if large_lobby else "full_view",
+        "rounds": result["rounds"],
+        "calls_per_round": calls / rounds,
+        "tokens_per_round": cost_summary.get("total_tokens", 0) / rounds,
+        "prompt_tokens_per_call": prompt_tokens / calls if calls else 0.0,
+        "seconds_per_round": elapsed / rounds
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="大房间扩展性基准：每轮 token 数和耗时随玩家人数的变化")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 8, 12, 20, 30, 50], help="玩家人数")
+    parser.add_argument("--rounds", type=int, default=2, help="每局最大轮数")
+    parser.add_argument("--werewolf-ratio", type=float, default=0.3, help="狼人占比（至少 1 名）")
+    parser.add_argument("--backend", choices=["openai", "stub"], default="stub", help="LLM 后端")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub 后端每次调用的模拟延迟（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--no-rag", action="store_true", help="关闭 RAG")
+    parser.add_argument("-o", "--output", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    # 大房间模式的参数读取 config/game_config.yaml 的 game.lobby 段
+    config = load_config()
+    lobby_config = (config.get("game") or {}).get("lobby") or {}
+    digest_size = lobby_config.get("digest_size") or 8
+    chunk_size = lobby_config.get("chunk_size") or 10
+
+    print(f"{'人数':>4} {'狼人':>4} {'模式':<12} {'调用/轮':>8} {'token/轮':>10} {'prompt/调用':>11} {'秒/轮':>7}")
+    results = []
+    for num_players in args.sizes:
+        for lobby_digest, lobby_chunk in ((None, None), (digest_size, chunk_size)):
+            stats = run_lobby(num_players, args, config, lobby_digest, lobby_chunk)
+            results.append(stats)
+            print(f"{stats['players']:>4} {stats['werewolves']:>4} {stats['mode']:<12} "
+                  f"{stats['calls_per_round']:>8.1f} {stats['tokens_per_round']:>10,.0f} "
+                  f"{stats['prompt_tokens_per_call']:>11,.0f} {stats['seconds_per_round']:>7.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"digest_size": digest_size, "chunk_size": chunk_size, "results": results},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ Agent 模块：包含玩家 Agent 和主持人 Agent
 from .player_agent import PlayerAgent
 from .moderator_agent import ModeratorAgent
 from .role_templates import RoleTemplate
+from .output_parser import ParseResult, parse_decision, match_player
 
-__all__ = ["PlayerAgent", "ModeratorAgent", "RoleTemplate"]
+__all__ = ["PlayerAgent", "ModeratorAgent", "RoleTemplate", "ParseResult", "parse_decision", "match_player"]
 
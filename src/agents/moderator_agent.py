@@ -3,84 +3,159 @@
 负责协调游戏流程，确保阶段正确流转
 """
 
-from typing import Dict, List, Any, Optional
+import asyncio
+from typing import Dict, List, Any, Optional, Tuple
 from langchain_openai import ChatOpenAI
+from langchain.schema import BaseMessage, HumanMessage, SystemMessage
+
+from .output_parser import DECISION_KEYS, extract_json, is_abstention, is_parsable_json, match_player
+from .player_agent import PlayerAgent
+from .role_templates import Role, RoleTemplate
+from ..llm.llm_caller import LLMCaller
+from ..llm.rate_limiter import RateLimiter
+from ..llm.resilience import ResiliencePolicy
+from ..llm.response_cache import ResponseCache
+from ..utils.cost_tracker import CostTracker
+
+
+# 主持人事件在事件日志中的类型；具体事件名（night_start 等）作为 token 保存在事件数据中
+MODERATOR_EVENT = "moderator"
+
+
+def format_announcement(event_type: str, data: Dict) -> str:
+    """
+    根据事件数据生成主持人公告（日志中不保存公告文本，查看时重新生成）
+    
+    Args:
+        event_type: 主持人事件类型
+        data: 事件数据
+        
+    Returns:
+        公告文本（没有公告的事件为空字符串）
+    """
+    if event_type == "night_start":
+        return f"🌙 第 {data['round']} 轮夜晚开始。所有玩家请闭眼。"
+    if event_type == "day_start":
+        if data["deaths"]:
+            return f"☀️ 天亮了！昨晚死亡的玩家是：{'、'.join(data['deaths'])}。"
+        return f"☀️ 天亮了！昨晚是平安夜，没有玩家死亡。"
+    if event_type == "discussion_start":
+        return f"🗣️ 现在开始第 {data['round']} 轮发言环节。请玩家按顺序发言：{', '.join(data['players'])}"
+    if event_type == "voting_start":
+        return f"🗳️ 现在开始投票环节。请所有存活玩家投票：{', '.join(data['players'])}"
+    if event_type == "voting_result":
+        vote_details = ", ".join([f"{player}: {count}票" for player, count in data["votes"].items()])
+        return f"📊 投票结果：{vote_details}。玩家 {data['executed']} 被处决。"
+    if event_type == "game_end":
+        return f"🎮 游戏结束！{data['winner']} 获胜！原因：{data['reason']}"
+    return ""
+
+
+def _moderator_entry(log, event) -> Dict:
+    """把事件日志中的主持人事件解码为 game_log 条目"""
+    event_type, data = log.token(event[3][0]), event[3][1]
+    announcement = format_announcement(event_type, data)
+    return {
+        "type": event_type,
+        "data": {**data, "announcement": announcement} if announcement else data
+    }
 
 
 class ModeratorAgent:
     """主持人 Agent - 协调游戏流程"""
     
-    def __init__(self, llm: Optional[ChatOpenAI] = None):
+    def __init__(
+        self,
+        llm: Optional[ChatOpenAI] = None,
+        cost_tracker: Optional[CostTracker] = None,
+        response_cache: Optional[ResponseCache] = None,
+        streaming: bool = False,
+        rate_limiter: Optional[RateLimiter] = None,
+        resilience: Optional[ResiliencePolicy] = None,
+        route: Optional[str] = None,
+        event_log=None,
+        max_batch_size: Optional[int] = None
+    ):
         """
         初始化主持人 Agent
         
         Args:
-            llm: LLM 实例（可选，用于智能判断）
+            llm: LLM 实例（可选，用于智能判断和批量决策）
+            cost_tracker: 成本追踪器
+            response_cache: LLM 响应缓存（可选）
+            streaming: 是否流式调用（JSON 数组完整后立即终止生成）
+            rate_limiter: 共享限流器（可选）
+            resilience: 超时 / 重试 / 对冲策略（可选）
+            route: llm 对应的模型路由名（用于按路由统计）
+            event_log: 游戏事件日志（EventLog，通常为 GameState.events；不提供时单独创建）
+            max_batch_size: 每个批量请求最多包含的玩家数（大房间中同一角色的玩家再分成多个请求；None 表示不限制）
         """
+        if max_batch_size is not None and max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
         self.llm = llm
-        self.game_log: List[Dict] = []
+        self.cost_tracker = cost_tracker
+        self.max_batch_size = max_batch_size
+        self.caller = LLMCaller(
+            llm,
+            cost_tracker,
+            response_cache,
+            streaming=streaming,
+            name="moderator",
+            rate_limiter=rate_limiter,
+            resilience=resilience,
+            route=route,
+            stream_arrays=True,
+            stream_validator=is_parsable_json
+        ) if llm else None
+        if event_log is None:
+            # 延迟导入：game 包依赖 agents 包
+            from ..game.event_log import EventLog
+            event_log = EventLog()
+        self.event_log = event_log
+    
+    @property
+    def game_log(self):
+        """主持人日志（从事件日志按需解码的只读视图）"""
+        return self.event_log.view(MODERATOR_EVENT, (MODERATOR_EVENT,), _moderator_entry)
     
     def announce_night(self, round_num: int) -> str:
         """宣布夜晚开始"""
-        announcement = f"🌙 第 {round_num} 轮夜晚开始。所有玩家请闭眼。"
-        self.log_event("night_start", {"round": round_num, "announcement": announcement})
-        return announcement
+        return self.log_event("night_start", {"round": round_num})
     
     def announce_day(self, round_num: int, deaths: List[str]) -> str:
         """宣布天亮"""
-        if deaths:
-            death_list = "、".join(deaths)
-            announcement = f"☀️ 天亮了！昨晚死亡的玩家是：{death_list}。"
-        else:
-            announcement = f"☀️ 天亮了！昨晚是平安夜，没有玩家死亡。"
-        
-        self.log_event("day_start", {
+        return self.log_event("day_start", {
             "round": round_num,
-            "deaths": deaths,
-            "announcement": announcement
+            "deaths": list(deaths)
         })
-        return announcement
     
     def announce_discussion(self, round_num: int, alive_players: List[str]) -> str:
         """宣布发言环节开始"""
-        announcement = f"🗣️ 现在开始第 {round_num} 轮发言环节。请玩家按顺序发言：{', '.join(alive_players)}"
-        self.log_event("discussion_start", {
+        return self.log_event("discussion_start", {
             "round": round_num,
-            "players": alive_players,
-            "announcement": announcement
+            "players": list(alive_players)
         })
-        return announcement
     
     def announce_voting(self, round_num: int, alive_players: List[str]) -> str:
         """宣布投票环节开始"""
-        announcement = f"🗳️ 现在开始投票环节。请所有存活玩家投票：{', '.join(alive_players)}"
-        self.log_event("voting_start", {
+        return self.log_event("voting_start", {
             "round": round_num,
-            "players": alive_players,
-            "announcement": announcement
+            "players": list(alive_players)
         })
-        return announcement
     
     def announce_voting_result(self, votes: Dict[str, int], executed: str) -> str:
         """宣布投票结果"""
-        vote_details = ", ".join([f"{player}: {count}票" for player, count in votes.items()])
-        announcement = f"📊 投票结果：{vote_details}。玩家 {executed} 被处决。"
-        self.log_event("voting_result", {
+        return self.log_event("voting_result", {
             "votes": votes,
-            "executed": executed,
-            "announcement": announcement
+            "executed": executed
         })
-        return announcement
     
     def announce_game_end(self, winner: str, reason: str) -> str:
         """宣布游戏结束"""
-        announcement = f"🎮 游戏结束！{winner} 获胜！原因：{reason}"
-        self.log_event("game_end", {
+        return self.log_event("game_end", {
             "winner": winner,
-            "reason": reason,
-            "announcement": announcement
+            "reason": reason
         })
-        return announcement
     
     def check_game_end(self, game_state: Dict) -> tuple[bool, str, str]:
         """
@@ -89,35 +164,196 @@ class ModeratorAgent:
         Returns:
             (is_end, winner, reason)
         """
-        alive_players = game_state.get("alive_players", [])
-        player_roles = game_state.get("player_roles", {})
+        # 与游戏流程使用同一套胜负规则（延迟导入：game 包依赖 agents 包）
+        from ..game.game_logic import GameLogic
+        return GameLogic.check_win_condition(game_state)
+    
+    def batch_decide(
+        self,
+        agents: List[PlayerAgent],
+        phase: str,
+        game_state: Dict
+    ) -> List[Dict]:
+        """
+        批量决策：每个角色分组只发起一次 LLM 请求（设置了 max_batch_size 时每组最多 max_batch_size 名玩家）
         
-        # 统计存活角色
-        alive_werewolves = sum(1 for p in alive_players if player_roles.get(p) == "werewolf")
-        alive_villagers = sum(1 for p in alive_players if player_roles.get(p) == "villager")
+        不同角色的玩家掌握的私有信息不同（狼人知道同伴身份），
+        因此按角色分组，每组单独请求，私有信息不会跨组泄露。
+        解析失败或缺失的玩家（包括整组请求失败时）会回退为单独调用。
         
-        # 检查胜利条件
-        if alive_werewolves == 0:
-            return True, "村民", "所有狼人已被处决"
-        elif alive_werewolves >= alive_villagers:
-            return True, "狼人", "狼人数量大于等于村民数量"
-        elif len(alive_players) <= 2:
-            # 如果只剩2人，且还有狼人，狼人获胜
-            if alive_werewolves > 0:
-                return True, "狼人", "存活玩家过少，狼人获胜"
-            else:
-                return True, "村民", "存活玩家过少，但无狼人，村民获胜"
+        Args:
+            agents: 需要决策的玩家 Agent 列表
+            phase: 阶段（night_action 或 voting）
+            game_state: 当前游戏状态
+            
+        Returns:
+            与 agents 顺序一致的决策结果列表
+        """
+        results: Dict[str, Dict] = {}
+        for role, group in self._group_by_role(agents):
+            try:
+                content = self.caller.invoke(
+                    self._build_batch_messages(role, group, phase, game_state),
+                    phase=f"batch_{phase}"
+                )
+            except Exception as e:
+                print(f"⚠️ 批量决策请求失败，回退为单独调用: {type(e).__name__}: {e}")
+                content = ""
+            decisions = self._parse_batch_response(content, group, phase, game_state)
+            for agent in group:
+                results[agent.name] = self._apply_or_fallback(agent, phase, game_state, decisions)
         
-        return False, "", ""
+        self.log_event("batch_decision", {
+            "phase": phase,
+            "round": game_state.get("round", 0),
+            "players": [agent.name for agent in agents]
+        })
+        return [results[agent.name] for agent in agents]
     
-    def log_event(self, event_type: str, data: Dict):
-        """记录事件"""
-        self.game_log.append({
-            "type": event_type,
-            "data": data
+    async def abatch_decide(
+        self,
+        agents: List[PlayerAgent],
+        phase: str,
+        game_state: Dict
+    ) -> List[Dict]:
+        """批量决策的异步版本：各角色分组的请求并发执行"""
+        groups = self._group_by_role(agents)
+        contents = await asyncio.gather(*(
+            self.caller.ainvoke(
+                self._build_batch_messages(role, group, phase, game_state),
+                phase=f"batch_{phase}"
+            )
+            for role, group in groups
+        ), return_exceptions=True)
+        
+        results: Dict[str, Dict] = {}
+        fallbacks = []
+        for (_, group), content in zip(groups, contents):
+            if isinstance(content, Exception):
+                print(f"⚠️ 批量决策请求失败，回退为单独调用: {type(content).__name__}: {content}")
+                content = ""
+            decisions = self._parse_batch_response(content, group, phase, game_state)
+            for agent in group:
+                if agent.name in decisions:
+                    results[agent.name] = agent.apply_batch_decision(phase, decisions[agent.name])
+                else:
+                    fallbacks.append(agent)
+        
+        # 批量结果中缺失的玩家并发单独调用
+        fallback_results = await asyncio.gather(*(
+            agent.anight_action(game_state) if phase == "night_action" else agent.avote(game_state)
+            for agent in fallbacks
+        ))
+        for agent, result in zip(fallbacks, fallback_results):
+            results[agent.name] = result
+        
+        self.log_event("batch_decision", {
+            "phase": phase,
+            "round": game_state.get("round", 0),
+            "players": [agent.name for agent in agents]
         })
+        return [results[agent.name] for agent in agents]
+    
+    def _group_by_role(self, agents: List[PlayerAgent]) -> List[Tuple[Role, List[PlayerAgent]]]:
+        """按角色分组，保证私有信息只在同一角色内共享；超过 max_batch_size 的分组再按顺序切分"""
+        by_role: Dict[Role, List[PlayerAgent]] = {}
+        for agent in agents:
+            by_role.setdefault(agent.role, []).append(agent)
+        
+        groups = []
+        for role, members in by_role.items():
+            size = self.max_batch_size or len(members)
+            groups.extend((role, members[start:start + size]) for start in range(0, len(members), size))
+        return groups
+    
+    @staticmethod
+    def _build_batch_messages(
+        role: Role,
+        group: List[PlayerAgent],
+        phase: str,
+        game_state: Dict
+    ) -> List[BaseMessage]:
+        """构建一个角色分组的批量决策消息"""
+        private_contexts = {agent.name: agent.get_private_context() for agent in group}
+        return [
+            SystemMessage(content=RoleTemplate.get_batch_system_prompt(role)),
+            HumanMessage(content=RoleTemplate.get_batch_decision_prompt(
+                role, phase, game_state, private_contexts
+            ))
+        ]
+    
+    def _parse_batch_response(
+        self,
+        content: str,
+        group: List[PlayerAgent],
+        phase: str,
+        game_state: Dict
+    ) -> Dict[str, Dict]:
+        """
+        解析 JSON 数组回复为 {player: decision}
+        
+        玩家名称和目标名称都做模糊匹配；投票为 null 的项视为弃权，目标无法识别的项不采用（随后回退为单独调用）
+        """
+        parsed = extract_json(content)
+        items = parsed.data if isinstance(parsed.data, list) else []
+        key = DECISION_KEYS[phase]
+        members = [agent.name for agent in group]
+        alive_players = game_state.get("alive_players", [])
+        
+        decisions = {}
+        repaired = parsed.repaired
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            player = match_player(item.get("player"), members)
+            if player is not None and is_abstention(phase, item):
+                repaired = repaired or player != item.get("player")
+                decisions[player] = {**item, "player": player, key: None}
+                continue
+            target = match_player(item.get(key), alive_players)
+            if player is None or target is None:
+                continue
+            repaired = repaired or player != item.get("player") or target != item.get(key)
+            decisions[player] = {**item, "player": player, key: target}
+        
+        if self.cost_tracker:
+            self.cost_tracker.record_parse(
+                phase=f"batch_{phase}",
+                ok=len(decisions) == len(members),
+                repaired=repaired
+            )
+        return decisions
+    
+    @staticmethod
+    def _apply_or_fallback(
+        agent: PlayerAgent,
+        phase: str,
+        game_state: Dict,
+        decisions: Dict[str, Dict]
+    ) -> Dict:
+        """使用批量结果；缺失时回退为单独调用"""
+        if agent.name in decisions:
+            return agent.apply_batch_decision(phase, decisions[agent.name])
+        if phase == "night_action":
+            return agent.night_action(game_state)
+        return agent.vote(game_state)
+    
+    def log_event(self, event_type: str, data: Dict) -> str:
+        """
+        记录事件到事件日志
+        
+        Returns:
+            事件对应的公告文本
+        """
+        self.event_log.append(
+            MODERATOR_EVENT,
+            data.get("round", -1),
+            None,
+            (self.event_log.intern(event_type), data)
+        )
+        return format_announcement(event_type, data)
     
     def get_game_log(self) -> List[Dict]:
         """获取游戏日志"""
-        return self.game_log
+        return list(self.game_log)
 
@@ -0,0 +1,313 @@
+"""
+结构化输出解析器
+从 LLM 回复中提取 JSON 决策：容忍代码块、尾逗号和中文标点，
+对玩家名称做模糊匹配，并支持短键名的紧凑输出格式
+"""
+
+import difflib
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from ..llm.json_stream import IncrementalJSONScanner
+
+
+# 紧凑输出格式的短键名
+SHORT_KEYS = {
+    "p": "player",
+    "t": "target",
+    "v": "vote",
+    "s": "speech",
+    "u": "suspicion",
+    "r": "reasoning",
+    "e": "evidence",
+    "c": "confidence"
+}
+
+# 各阶段必须给出的决策字段
+DECISION_KEYS = {
+    "night_action": "target",
+    "voting": "vote",
+    "discussion": "speech"
+}
+
+# 结构位置上的全角标点
+_FULLWIDTH_STRUCTURE = {
+    "：": ":",
+    "，": ",",
+    "｛": "{",
+    "｝": "}",
+    "［": "[",
+    "］": "]"
+}
+
+# 字段抽取时按此顺序查找键名（固定顺序，先长键名后短键名，结果不受哈希种子影响）
+_FIELD_NAMES = tuple(SHORT_KEYS.values()) + tuple(SHORT_KEYS.keys())
+
+# 投票时表示弃权的取值（JSON null 或字段抽取得到的同义文本）
+_ABSTAIN_VALUES = {"null", "none", "弃权"}
+
+_FENCE_PATTERN = re.compile(r"```(?:json|JSON)?")
+_PLAYER_PREFIX_PATTERN = re.compile(r"^(玩家|player)\s*", re.IGNORECASE)
+
+
+@dataclass
+class ParseResult:
+    """解析结果"""
+    data: Any = None  # 解析得到的 dict 或 list
+    ok: bool = False  # 是否得到了有效的决策
+    repaired: bool = False  # 是否经过了本地修复
+    error: str = ""
+    notes: List[str] = field(default_factory=list)
+
+
+def extract_json(content: str) -> ParseResult:
+    """
+    从回复中提取第一个 JSON 对象或数组，必要时进行本地修复
+
+    Args:
+        content: LLM 回复文本
+
+    Returns:
+        解析结果（data 为 dict 或 list）
+    """
+    if not content:
+        return ParseResult(error="回复为空")
+
+    text = _FENCE_PATTERN.sub("", content)
+    candidate = _first_json_block(text)
+    if candidate is None:
+        return ParseResult(error="回复中没有 JSON")
+
+    # 依次尝试：原文 -> 结构标点修复 -> 中文引号修复 -> 单引号修复
+    attempts = [
+        ("raw", candidate),
+        ("punctuation", _normalize_structure(candidate)),
+        ("quotes", _normalize_structure(candidate.replace("“", '"').replace("”", '"'))),
+    ]
+    if '"' not in candidate:
+        attempts.append(("single_quotes", _normalize_structure(candidate.replace("'", '"'))))
+
+    last_error = ""
+    for name, text_variant in attempts:
+        try:
+            data = json.loads(_python_literals(text_variant) if name != "raw" else text_variant)
+        except json.JSONDecodeError as e:
+            last_error = str(e)
+            continue
+        return ParseResult(data=_expand_keys(data), ok=True, repaired=name != "raw", notes=[name])
+
+    return ParseResult(error=f"JSON 解析失败: {last_error}")
+
+
+def is_parsable_json(text: str) -> bool:
+    """流式调用停止生成前的校验：候选 JSON 文本能否被 extract_json 解析"""
+    return extract_json(text).ok
+
+
+def is_abstention(phase: str, data: Dict[str, Any]) -> bool:
+    """
+    判断决策是否为明确的弃权（仅投票阶段：决策字段存在且为 null）
+
+    Args:
+        phase: 阶段
+        data: 解析得到的决策
+
+    Returns:
+        是否弃权
+    """
+    key = DECISION_KEYS[phase]
+    if phase != "voting" or key not in data:
+        return False
+    value = data[key]
+    return value is None or (isinstance(value, str) and value.strip().casefold() in _ABSTAIN_VALUES)
+
+
+def parse_decision(content: str, phase: str, alive_players: List[str]) -> ParseResult:
+    """
+    解析单个玩家的决策
+
+    Args:
+        content: LLM 回复文本
+        phase: 阶段（night_action / discussion / voting）
+        alive_players: 存活玩家列表（用于名称匹配）
+
+    Returns:
+        解析结果；ok 为 False 时表示需要重新询问（投票时明确的 null 视为弃权，不重新询问）
+    """
+    key = DECISION_KEYS[phase]
+    result = extract_json(content)
+
+    data = result.data if isinstance(result.data, dict) else None
+    if data is None:
+        # JSON 完全无法解析时，尝试按字段名直接抽取
+        data = _extract_fields(content)
+        if data:
+            result = ParseResult(data=data, repaired=True, notes=["fields"])
+
+    if not data:
+        if phase == "discussion" and content:
+            # 发言可以直接使用原文
+            return ParseResult(
+                data={"speech": content.strip(), "suspicion": None, "reasoning": ""},
+                ok=True,
+                repaired=True,
+                notes=["raw_speech"]
+            )
+        # 纯文本回复中只提到一名存活玩家时，直接采用
+        target = match_player(content, alive_players)
+        if target is not None:
+            return ParseResult(
+                data={key: target, "reasoning": content.strip()},
+                ok=True,
+                repaired=True,
+                notes=["free_text"]
+            )
+        error = result.error or "缺少决策字段"
+        return ParseResult(data={key: None, "reasoning": f"解析错误: {error}"}, error=error)
+
+    if phase == "discussion":
+        if not data.get("speech"):
+            data["speech"] = content.strip()
+            result.repaired = True
+        data["suspicion"] = match_player(data.get("suspicion"), alive_players)
+        result.data = data
+        result.ok = True
+        return result
+
+    if is_abstention(phase, data):
+        data[key] = None
+        result.data = data
+        result.ok = True
+        result.notes.append("abstain")
+        return result
+
+    raw_target = data.get(key)
+    target = match_player(raw_target, alive_players)
+    if target is not None and target != raw_target:
+        result.repaired = True
+        result.notes.append("fuzzy_name")
+    data[key] = target
+    result.data = data
+    result.ok = target is not None
+    if not result.ok:
+        result.error = f"无法识别的玩家名称: {raw_target}" if raw_target is not None else f"缺少决策字段: {key}"
+    return result
+
+
+def match_player(name: Any, candidates: List[str]) -> Optional[str]:
+    """
+    将 LLM 给出的玩家名称模糊匹配到候选玩家
+
+    Args:
+        name: LLM 给出的名称
+        candidates: 候选玩家列表
+
+    Returns:
+        匹配到的玩家名称，无法匹配时返回 None
+    """
+    if not name or not isinstance(name, str) or not candidates:
+        return None
+
+    cleaned = name.strip().strip("\"'“”‘’「」【】[]()（）。.")
+    cleaned = _PLAYER_PREFIX_PATTERN.sub("", cleaned).strip()
+    if not cleaned:
+        return None
+
+    if cleaned in candidates:
+        return cleaned
+
+    lowered = {candidate.casefold(): candidate for candidate in candidates}
+    if cleaned.casefold() in lowered:
+        return lowered[cleaned.casefold()]
+
+    # 回复中包含唯一一个候选名称，如 “我投 Bob”
+    contained = [c for c in candidates if c.casefold() in cleaned.casefold()]
+    if len(contained) == 1:
+        return contained[0]
+
+    # 名称是某个候选的唯一前缀，如 “Char”
+    prefixed = [c for c in candidates if c.casefold().startswith(cleaned.casefold())]
+    if len(prefixed) == 1:
+        return prefixed[0]
+
+    close = difflib.get_close_matches(cleaned.casefold(), list(lowered.keys()), n=1, cutoff=0.6)
+    if close:
+        return lowered[close[0]]
+    return None
+
+
+def _first_json_block(text: str) -> Optional[str]:
+    """提取第一个顶层 JSON 块；未闭合时返回从起始位置到结尾的文本"""
+    scanner = IncrementalJSONScanner()
+    scanner.feed(text.replace("｛", "{").replace("｝", "}").replace("［", "[").replace("］", "]"))
+    if scanner.start is None:
+        return None
+    if scanner.complete:
+        return text[scanner.start:scanner.end]
+    return text[scanner.start:]
+
+
+def _normalize_structure(text: str) -> str:
+    """在 JSON 字符串之外替换全角标点，并删除尾逗号"""
+    output = []
+    in_string = False
+    escape = False
+    for ch in text:
+        if in_string:
+            output.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+            output.append(ch)
+            continue
+
+        ch = _FULLWIDTH_STRUCTURE.get(ch, ch)
+        if ch in "}]":
+            # 删除尾逗号
+            while output and output[-1].isspace():
+                output.pop()
+            if output and output[-1] == ",":
+                output.pop()
+        output.append(ch)
+
+    return "".join(output)
+
+
+def _python_literals(text: str) -> str:
+    """将字符串之外的 Python 字面量替换为 JSON 字面量"""
+    return re.sub(
+        r'("(?:[^"\\]|\\.)*")|\bNone\b|\bTrue\b|\bFalse\b',
+        lambda m: m.group(1) or {"None": "null", "True": "true", "False": "false"}[m.group(0)],
+        text
+    )
+
+
+def _expand_keys(data: Any) -> Any:
+    """将短键名展开为完整键名"""
+    if isinstance(data, list):
+        return [_expand_keys(item) for item in data]
+    if isinstance(data, dict):
+        return {SHORT_KEYS.get(k, k): v for k, v in data.items()}
+    return data
+
+
+def _extract_fields(content: str) -> Dict[str, str]:
+    """按字段名逐个抽取值（最后的本地修复手段；长键名和短键名同时出现时取长键名的值）"""
+    fields = {}
+    for name in _FIELD_NAMES:
+        match = re.search(
+            rf'["“]?\b{name}\b["”]?\s*[:：]\s*["“]?([^"”,，}}\n]+)',
+            content
+        )
+        if match:
+            fields.setdefault(SHORT_KEYS.get(name, name), match.group(1).strip())
+    return fields
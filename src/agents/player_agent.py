@@ -2,14 +2,20 @@
 玩家 Agent 实现
 """
 
-import json
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage, SystemMessage
-from langchain.callbacks import get_openai_callback
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
 
+from .output_parser import DECISION_KEYS, ParseResult, is_parsable_json, parse_decision
 from .role_templates import Role, Personality, RoleTemplate
+from ..llm.client_pool import ClientPool, get_client_pool
+from ..llm.llm_caller import LLMCaller
+from ..llm.model_router import ModelRouter
+from ..llm.rate_limiter import RateLimiter
+from ..llm.resilience import ResiliencePolicy
+from ..llm.response_cache import ResponseCache
 from ..utils.cost_tracker import CostTracker
+from ..utils.prompt_budget import PromptAssembler
 
 
 class PlayerAgent:
@@ -23,7 +29,17 @@ class PlayerAgent:
         llm: Optional[ChatOpenAI] = None,
         api_key: Optional[str] = None,
         base_url: Optional[str] = None,
-        cost_tracker: Optional[CostTracker] = None
+        cost_tracker: Optional[CostTracker] = None,
+        response_cache: Optional[ResponseCache] = None,
+        streaming: bool = False,
+        compact_output: bool = False,
+        max_reasks: int = 1,
+        prompt_assembler: Optional[PromptAssembler] = None,
+        client_pool: Optional[ClientPool] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        resilience: Optional[ResiliencePolicy] = None,
+        model_router: Optional[ModelRouter] = None,
+        use_memory: bool = True
     ):
         """
         初始化玩家 Agent
@@ -32,33 +48,70 @@ class PlayerAgent:
             name: 玩家名称
             role: 角色类型
             personality: 性格类型
-            llm: LLM 实例（可选）
+            llm: LLM 实例（可选，提供时所有阶段都使用它，不做路由）
             api_key: API Key（如果未提供 llm）
             base_url: API Base URL（用于 DeepSeek 等）
             cost_tracker: 成本追踪器
+            response_cache: LLM 响应缓存（可选，可在多个 Agent / 多局游戏间共享）
+            streaming: 是否流式调用（JSON 决策完整后立即终止生成）
+            compact_output: 是否要求短键名的紧凑 JSON 输出（减少 completion token）
+            max_reasks: 本地修复失败时最多重新询问的次数
+            prompt_assembler: 提示词 token 预算（可选，裁剪记忆、RAG 证据和本轮发言）
+            client_pool: LLM 客户端池（未提供 llm 时从中获取共享实例，默认使用进程级客户端池）
+            rate_limiter: 共享限流器（可选，限制 RPM / TPM 和并发）
+            resilience: 超时 / 重试 / 对冲策略（可选，由它负责重试时关闭 SDK 自带的重试）
+            model_router: 按阶段的模型路由（可选，未提供 llm 时使用；支持便宜模型到强模型的级联）
+            use_memory: 是否记录个人记忆（关闭时提示词中的记忆始终为“暂无记忆”）
         """
         self.name = name
         self.role = role
         self.personality = personality
         self.cost_tracker = cost_tracker or CostTracker()
+        self.compact_output = compact_output
+        self.max_reasks = max_reasks
+        self.prompt_assembler = prompt_assembler
+        self.use_memory = use_memory
         
-        # 初始化 LLM
-        if llm is None:
+        self.model_router = model_router if llm is None else None
+        
+        # 初始化 LLM（相同配置的 Agent 共享同一个实例和连接池）
+        if self.model_router is not None:
+            llm = self.model_router.get_model(self.model_router.default_route)
+        elif llm is None:
+            client_pool = client_pool or get_client_pool()
+            llm_options = {"max_retries": 0} if resilience else {}
             if base_url:
-                self.llm = ChatOpenAI(
+                llm = client_pool.get_chat_model(
                     model="deepseek-chat",
                     api_key=api_key,
                     base_url=base_url,
-                    temperature=0.7
+                    temperature=0.7,
+                    **llm_options
                 )
             else:
-                self.llm = ChatOpenAI(
+                llm = client_pool.get_chat_model(
                     model="gpt-3.5-turbo",
                     api_key=api_key,
-                    temperature=0.7
+                    temperature=0.7,
+                    **llm_options
                 )
-        else:
-            self.llm = llm
+        self._caller_options = {
+            "cost_tracker": self.cost_tracker,
+            "response_cache": response_cache,
+            "streaming": streaming,
+            "name": name,
+            "rate_limiter": rate_limiter,
+            "resilience": resilience,
+            "stream_validator": is_parsable_json
+        }
+        self.caller = LLMCaller(
+            llm,
+            route=self.model_router.default_route if self.model_router else None,
+            **self._caller_options
+        )
+        self._route_callers: Dict[str, LLMCaller] = {}
+        if self.model_router is not None:
+            self._route_callers[self.model_router.default_route] = self.caller
         
         # 获取角色提示词
         self.system_prompt = RoleTemplate.get_role_prompt(role, personality, name)
@@ -67,21 +120,89 @@ class PlayerAgent:
         self.memory: List[Dict] = []
         self.thoughts: List[Dict] = []
     
+    @property
+    def llm(self):
+        """当前使用的 LLM 实例"""
+        return self.caller.llm
+    
+    @llm.setter
+    def llm(self, llm):
+        """替换 LLM 实例（之后所有阶段都使用该实例，不再路由）"""
+        self.caller.llm = llm
+        self.model_router = None
+    
     def add_memory(self, event: Dict):
         """添加记忆"""
-        self.memory.append(event)
+        if self.use_memory:
+            self.memory.append(event)
     
     def get_memory_summary(self) -> str:
         """获取记忆摘要"""
-        if not self.memory:
+        return self._format_memory([mem.get("content", "") for mem in self.memory[-10:]])  # 最近10条记忆
+    
+    @staticmethod
+    def _format_memory(contents: List[str]) -> str:
+        """将记忆内容格式化为摘要"""
+        if not contents:
             return "暂无记忆"
         
         summary = "历史记忆：\n"
-        for i, mem in enumerate(self.memory[-10:], 1):  # 最近10条记忆
-            summary += f"{i}. {mem.get('content', '')}\n"
+        for i, content in enumerate(contents, 1):
+            summary += f"{i}. {content}\n"
         
         return summary
     
+    def _fit_prompt(
+        self,
+        phase: str,
+        game_state: Dict,
+        rag_context: Optional[str] = None
+    ) -> Tuple[Dict, Optional[str], str]:
+        """
+        按 token 预算裁剪记忆、RAG 证据和本轮发言
+        
+        Args:
+            phase: 阶段（night_action、discussion 或 voting）
+            game_state: 当前游戏状态
+            rag_context: RAG 检索结果
+            
+        Returns:
+            (裁剪后的游戏状态, 裁剪后的 RAG 上下文, 记忆摘要)
+        """
+        if self.prompt_assembler is None:
+            return game_state, rag_context, self.get_memory_summary()
+        
+        # 投票和反驳环节的提示词包含本轮发言记录
+        with_speeches = phase == "voting" or bool(game_state.get("rebuttal"))
+        logs = list(game_state.get("discussion_logs", [])) if with_speeches else []
+        
+        # 各分节按价值从高到低排列：越近的记忆和发言越重要
+        sections = {"memory": [mem.get("content", "") for mem in reversed(self.memory)]}
+        if rag_context:
+            sections["rag"] = [rag_context]
+        if logs:
+            sections["speeches"] = [RoleTemplate.get_speech_text(log) for log in reversed(logs)]
+        
+        # 不可裁剪的部分：系统提示词、阶段说明和不含发言的公共局势
+        base_state = {**game_state, "discussion_logs": []}
+        if phase == "night_action":
+            fixed_prompt = RoleTemplate.get_night_action_prompt(self.role, base_state, self.compact_output)
+        elif phase == "voting":
+            fixed_prompt = RoleTemplate.get_voting_prompt(self.role, base_state, self.compact_output)
+        else:
+            fixed_prompt = RoleTemplate.get_discussion_prompt(self.role, base_state, "", self.compact_output)
+        fitted = self.prompt_assembler.assemble(phase, self.system_prompt + fixed_prompt, sections)
+        
+        if with_speeches:
+            kept_logs = [
+                {**log, "speech": speech}
+                for log, speech in zip(reversed(logs), fitted.get("speeches", []))
+            ]
+            game_state = {**game_state, "discussion_logs": list(reversed(kept_logs))}
+        rag_context = fitted["rag"][0] if fitted.get("rag") else None
+        memory_summary = self._format_memory(list(reversed(fitted["memory"])))
+        return game_state, rag_context, memory_summary
+    
     def night_action(self, game_state: Dict) -> Dict[str, Any]:
         """
         夜晚行动（仅狼人）
@@ -95,49 +216,258 @@ class PlayerAgent:
         if self.role != Role.WEREWOLF:
             return {"action": "sleep", "target": None}
         
-        prompt = RoleTemplate.get_night_action_prompt(self.role, game_state)
+        messages, thought = self._prepare_night_action(game_state)
+        action_result = self._decide("night_action", messages, game_state)
+        return self._conclude_night_action(action_result, thought)
+    
+    async def anight_action(self, game_state: Dict) -> Dict[str, Any]:
+        """夜晚行动的异步版本（基于 ainvoke）"""
+        if self.role != Role.WEREWOLF:
+            return {"action": "sleep", "target": None}
+        
+        messages, thought = self._prepare_night_action(game_state)
+        action_result = await self._adecide("night_action", messages, game_state)
+        return self._conclude_night_action(action_result, thought)
+    
+    def discuss(self, game_state: Dict, rag_context: Optional[str] = None) -> Dict[str, Any]:
+        """
+        发言环节
+        
+        Args:
+            game_state: 当前游戏状态
+            rag_context: RAG 检索到的相关历史发言
+            
+        Returns:
+            发言结果
+        """
+        messages, thought = self._prepare_discussion(game_state, rag_context)
+        speech_result = self._decide("discussion", messages, game_state)
+        return self._conclude_discussion(speech_result, thought, game_state)
+    
+    async def adiscuss(self, game_state: Dict, rag_context: Optional[str] = None) -> Dict[str, Any]:
+        """发言环节的异步版本（基于 ainvoke）"""
+        messages, thought = self._prepare_discussion(game_state, rag_context)
+        speech_result = await self._adecide("discussion", messages, game_state)
+        return self._conclude_discussion(speech_result, thought, game_state)
+    
+    def vote(self, game_state: Dict) -> Dict[str, Any]:
+        """
+        投票环节
+        
+        Args:
+            game_state: 当前游戏状态
+            
+        Returns:
+            投票结果
+        """
+        messages, thought = self._prepare_vote(game_state)
+        vote_result = self._decide("voting", messages, game_state)
+        return self._conclude_vote(vote_result, thought)
+    
+    async def avote(self, game_state: Dict) -> Dict[str, Any]:
+        """投票环节的异步版本（基于 ainvoke）"""
+        messages, thought = self._prepare_vote(game_state)
+        vote_result = await self._adecide("voting", messages, game_state)
+        return self._conclude_vote(vote_result, thought)
+    
+    def _route_for(self, phase: str) -> Optional[str]:
+        """阶段对应的模型路由（未配置路由时为 None）"""
+        return self.model_router.route_for(phase) if self.model_router else None
+    
+    def _caller_for(self, route: Optional[str]) -> LLMCaller:
+        """获取某条路由的调用器（按需创建）"""
+        if self.model_router is None or route is None:
+            return self.caller
+        caller = self._route_callers.get(route)
+        if caller is None:
+            caller = LLMCaller(self.model_router.get_model(route), route=route, **self._caller_options)
+            self._route_callers[route] = caller
+        return caller
+    
+    def _invoke_llm(
+        self,
+        messages: List[BaseMessage],
+        phase: Optional[str] = None,
+        route: Optional[str] = None
+    ) -> str:
+        """同步调用 LLM（route 为 None 时使用阶段对应的路由）"""
+        return self._caller_for(route or self._route_for(phase)).invoke(messages, phase)
+    
+    async def _ainvoke_llm(
+        self,
+        messages: List[BaseMessage],
+        phase: Optional[str] = None,
+        route: Optional[str] = None
+    ) -> str:
+        """异步调用 LLM"""
+        return await self._caller_for(route or self._route_for(phase)).ainvoke(messages, phase)
+    
+    def _escalation_for(self, phase: str, route: Optional[str], result: ParseResult) -> Optional[str]:
+        """便宜模型的结果需要升级时返回目标路由，并记录一次升级"""
+        if self.model_router is None or route is None:
+            return None
+        target = self.model_router.escalation_for(phase, route)
+        if target is None or not self.model_router.should_escalate(result):
+            return None
+        self.cost_tracker.record_escalation(phase, route, target)
+        return target
+    
+    def _decide(self, phase: str, messages: List[BaseMessage], game_state: Dict) -> Dict:
+        """
+        调用 LLM 并解析决策；本地修复失败时带上解析错误定向重问
+        
+        Args:
+            phase: 阶段
+            messages: 本次调用的消息
+            game_state: 当前游戏状态
+            
+        Returns:
+            解析后的决策（无法解析时决策字段为 None，LLM 调用失败时为兜底决策）
+        """
+        route = self._route_for(phase)
+        try:
+            content = self._invoke_llm(messages, phase, route)
+        except Exception as e:
+            return self._fallback_decision(phase, e)
+        result = self._parse_decision(phase, content, game_state)
+        
+        # 级联：便宜模型的结果不可用或置信度低时，用更强的模型重新决策
+        target = self._escalation_for(phase, route, result)
+        if target is not None:
+            try:
+                escalated = self._invoke_llm(messages, phase, target)
+            except Exception:
+                escalated = None
+            if escalated is not None:
+                route, content = target, escalated
+                result = self._parse_decision(phase, content, game_state)
+        
+        reasks = 0
+        while not result.ok and reasks < self.max_reasks:
+            reasks += 1
+            try:
+                content = self._invoke_llm(
+                    self._reask_messages(phase, messages, content, game_state), phase, route
+                )
+            except Exception:
+                break
+            result = self._parse_decision(phase, content, game_state)
+        
+        self._record_parse(phase, result, reasks)
+        return result.data
+    
+    async def _adecide(self, phase: str, messages: List[BaseMessage], game_state: Dict) -> Dict:
+        """_decide 的异步版本"""
+        route = self._route_for(phase)
+        try:
+            content = await self._ainvoke_llm(messages, phase, route)
+        except Exception as e:
+            return self._fallback_decision(phase, e)
+        result = self._parse_decision(phase, content, game_state)
+        
+        target = self._escalation_for(phase, route, result)
+        if target is not None:
+            try:
+                escalated = await self._ainvoke_llm(messages, phase, target)
+            except Exception:
+                escalated = None
+            if escalated is not None:
+                route, content = target, escalated
+                result = self._parse_decision(phase, content, game_state)
+        
+        reasks = 0
+        while not result.ok and reasks < self.max_reasks:
+            reasks += 1
+            try:
+                content = await self._ainvoke_llm(
+                    self._reask_messages(phase, messages, content, game_state), phase, route
+                )
+            except Exception:
+                break
+            result = self._parse_decision(phase, content, game_state)
+        
+        self._record_parse(phase, result, reasks)
+        return result.data
+    
+    def _fallback_decision(self, phase: str, error: Exception) -> Dict:
+        """
+        LLM 调用失败（重试耗尽或不可重试）时的兜底决策，保证一局游戏不会因单次调用中断
+        
+        夜晚行动和投票弃权（目标为 None），发言使用中性的固定发言。
+        """
+        print(f"⚠️ {self.name} 的 {phase} 调用失败，使用兜底决策: {type(error).__name__}: {error}")
+        self.cost_tracker.record_parse(phase=phase, ok=False, repaired=False, fallback=True)
+        reasoning = f"LLM 调用失败，使用兜底决策: {type(error).__name__}"
+        if phase == "discussion":
+            return {"speech": "我暂时没有新的发现，先听听大家的意见。", "suspicion": None, "reasoning": reasoning}
+        return {DECISION_KEYS[phase]: None, "reasoning": reasoning}
+    
+    @staticmethod
+    def _parse_decision(phase: str, content: str, game_state: Dict) -> ParseResult:
+        """解析回复（玩家名称按存活玩家做模糊匹配）"""
+        return parse_decision(content, phase, game_state.get("alive_players", []))
+    
+    def _reask_messages(
+        self,
+        phase: str,
+        messages: List[BaseMessage],
+        content: str,
+        game_state: Dict
+    ) -> List[BaseMessage]:
+        """在原对话后追加上一条回复和重问提示"""
+        reask_prompt = RoleTemplate.get_reask_prompt(
+            phase,
+            game_state.get("alive_players", []),
+            self.compact_output
+        )
+        return messages + [AIMessage(content=content), HumanMessage(content=reask_prompt)]
+    
+    def _record_parse(self, phase: str, result: ParseResult, reasks: int):
+        """向成本追踪器报告解析结果"""
+        self.cost_tracker.record_parse(
+            phase=phase,
+            ok=result.ok,
+            repaired=result.repaired,
+            reasks=reasks
+        )
+    
+    def _begin_thought(self, phase: str) -> Dict:
+        """记录某个阶段开始时的思考过程"""
+        if phase == "night_action":
+            text = f"作为{self.role.value}，我需要选择夜晚的目标"
+        elif phase == "discussion":
+            text = "分析当前局势，准备发言"
+        else:
+            text = "分析发言，决定投票目标"
         
-        # 记录思考过程
         thought = {
-            "phase": "night_action",
+            "phase": phase,
             "player": self.name,
-            "thought": f"作为{self.role.value}，我需要选择夜晚的目标"
+            "thought": text
         }
         self.thoughts.append(thought)
+        return thought
+    
+    def _prepare_night_action(self, game_state: Dict) -> Tuple[List[BaseMessage], Dict]:
+        """构建夜晚行动的消息并记录思考过程"""
+        game_state, _, memory_summary = self._fit_prompt("night_action", game_state)
+        prompt = RoleTemplate.get_night_action_prompt(self.role, game_state, self.compact_output)
+        
+        # 添加记忆上下文（每次调用都可能变化，放在最后以保留稳定前缀）
+        if memory_summary:
+            prompt = f"{prompt}\n\n{memory_summary}"
+        
+        # 记录思考过程
+        thought = self._begin_thought("night_action")
         
-        # 调用 LLM
         messages = [
             SystemMessage(content=self.system_prompt),
             HumanMessage(content=prompt)
         ]
-        
-        with get_openai_callback() as cb:
-            response = self.llm.invoke(messages)
-            
-            # 记录成本
-            if self.cost_tracker:
-                self.cost_tracker.record_call(
-                    model=self.llm.model_name,
-                    tokens=cb.total_tokens,
-                    prompt_tokens=cb.prompt_tokens,
-                    completion_tokens=cb.completion_tokens
-                )
-        
-        # 解析响应
-        try:
-            content = response.content
-            # 尝试提取 JSON
-            if "{" in content and "}" in content:
-                json_start = content.find("{")
-                json_end = content.rfind("}") + 1
-                json_str = content[json_start:json_end]
-                action_result = json.loads(json_str)
-            else:
-                # 如果无法解析 JSON，使用默认值
-                action_result = {"target": None, "reasoning": content}
-        except Exception as e:
-            action_result = {"target": None, "reasoning": f"解析错误: {str(e)}"}
-        
+        return messages, thought
+    
+    def _conclude_night_action(self, action_result: Dict, thought: Dict) -> Dict[str, Any]:
+        """根据解析后的夜晚决策记录观察"""
         # 记录观察
         observation = {
             "phase": "night_action",
@@ -156,71 +486,35 @@ class PlayerAgent:
             "observation": observation
         }
     
-    def discuss(self, game_state: Dict, rag_context: Optional[str] = None) -> Dict[str, Any]:
-        """
-        发言环节
-        
-        Args:
-            game_state: 当前游戏状态
-            rag_context: RAG 检索到的相关历史发言
-            
-        Returns:
-            发言结果
-        """
-        prompt = RoleTemplate.get_discussion_prompt(self.role, game_state, rag_context or "")
+    def _prepare_discussion(
+        self,
+        game_state: Dict,
+        rag_context: Optional[str]
+    ) -> Tuple[List[BaseMessage], Dict]:
+        """构建发言环节的消息并记录思考过程"""
+        game_state, rag_context, memory_summary = self._fit_prompt("discussion", game_state, rag_context)
+        prompt = RoleTemplate.get_discussion_prompt(
+            self.role,
+            game_state,
+            rag_context or "",
+            self.compact_output
+        )
         
-        # 添加记忆上下文
-        memory_summary = self.get_memory_summary()
+        # 添加记忆上下文（每次调用都可能变化，放在最后以保留稳定前缀）
         if memory_summary:
-            prompt = f"{memory_summary}\n\n{prompt}"
+            prompt = f"{prompt}\n\n{memory_summary}"
         
         # 记录思考过程
-        thought = {
-            "phase": "discussion",
-            "player": self.name,
-            "thought": f"分析当前局势，准备发言"
-        }
-        self.thoughts.append(thought)
+        thought = self._begin_thought("discussion")
         
-        # 调用 LLM
         messages = [
             SystemMessage(content=self.system_prompt),
             HumanMessage(content=prompt)
         ]
-        
-        with get_openai_callback() as cb:
-            response = self.llm.invoke(messages)
-            
-            # 记录成本
-            if self.cost_tracker:
-                self.cost_tracker.record_call(
-                    model=self.llm.model_name,
-                    tokens=cb.total_tokens,
-                    prompt_tokens=cb.prompt_tokens,
-                    completion_tokens=cb.completion_tokens
-                )
-        
-        # 解析响应
-        try:
-            content = response.content
-            if "{" in content and "}" in content:
-                json_start = content.find("{")
-                json_end = content.rfind("}") + 1
-                json_str = content[json_start:json_end]
-                speech_result = json.loads(json_str)
-            else:
-                speech_result = {
-                    "speech": content,
-                    "suspicion": None,
-                    "reasoning": ""
-                }
-        except Exception as e:
-            speech_result = {
-                "speech": content,
-                "suspicion": None,
-                "reasoning": f"解析错误: {str(e)}"
-            }
-        
+        return messages, thought
+    
+    def _conclude_discussion(self, speech_result: Dict, thought: Dict, game_state: Dict) -> Dict[str, Any]:
+        """根据解析后的发言记录观察并写入记忆"""
         # 记录观察
         observation = {
             "phase": "discussion",
@@ -246,62 +540,26 @@ class PlayerAgent:
             "observation": observation
         }
     
-    def vote(self, game_state: Dict) -> Dict[str, Any]:
-        """
-        投票环节
-        
-        Args:
-            game_state: 当前游戏状态
-            
-        Returns:
-            投票结果
-        """
-        prompt = RoleTemplate.get_voting_prompt(self.role, game_state)
+    def _prepare_vote(self, game_state: Dict) -> Tuple[List[BaseMessage], Dict]:
+        """构建投票环节的消息并记录思考过程"""
+        game_state, _, memory_summary = self._fit_prompt("voting", game_state)
+        prompt = RoleTemplate.get_voting_prompt(self.role, game_state, self.compact_output)
         
-        # 添加记忆上下文
-        memory_summary = self.get_memory_summary()
+        # 添加记忆上下文（每次调用都可能变化，放在最后以保留稳定前缀）
         if memory_summary:
-            prompt = f"{memory_summary}\n\n{prompt}"
+            prompt = f"{prompt}\n\n{memory_summary}"
         
         # 记录思考过程
-        thought = {
-            "phase": "voting",
-            "player": self.name,
-            "thought": f"分析发言，决定投票目标"
-        }
-        self.thoughts.append(thought)
+        thought = self._begin_thought("voting")
         
-        # 调用 LLM
         messages = [
             SystemMessage(content=self.system_prompt),
             HumanMessage(content=prompt)
         ]
-        
-        with get_openai_callback() as cb:
-            response = self.llm.invoke(messages)
-            
-            # 记录成本
-            if self.cost_tracker:
-                self.cost_tracker.record_call(
-                    model=self.llm.model_name,
-                    tokens=cb.total_tokens,
-                    prompt_tokens=cb.prompt_tokens,
-                    completion_tokens=cb.completion_tokens
-                )
-        
-        # 解析响应
-        try:
-            content = response.content
-            if "{" in content and "}" in content:
-                json_start = content.find("{")
-                json_end = content.rfind("}") + 1
-                json_str = content[json_start:json_end]
-                vote_result = json.loads(json_str)
-            else:
-                vote_result = {"vote": None, "reasoning": content}
-        except Exception as e:
-            vote_result = {"vote": None, "reasoning": f"解析错误: {str(e)}"}
-        
+        return messages, thought
+    
+    def _conclude_vote(self, vote_result: Dict, thought: Dict) -> Dict[str, Any]:
+        """根据解析后的投票决策记录观察"""
         # 记录观察
         observation = {
             "phase": "voting",
@@ -318,10 +576,40 @@ class PlayerAgent:
             "observation": observation
         }
     
+    def get_private_context(self) -> str:
+        """获取只属于该玩家的私有上下文（性格和记忆），用于批量决策"""
+        personality_trait = RoleTemplate.PERSONALITY_TRAITS[self.personality]
+        return f"{personality_trait}\n\n{self.get_memory_summary()}"
+    
+    def apply_batch_decision(self, phase: str, decision: Dict) -> Dict[str, Any]:
+        """
+        接受主持人批量决策中属于自己的那一项
+        
+        Args:
+            phase: 阶段（night_action 或 voting）
+            decision: 该玩家的决策 {"target"/"vote": ..., "reasoning": ...}
+            
+        Returns:
+            与 night_action / vote 相同格式的结果
+        """
+        thought = self._begin_thought(phase)
+        if phase == "night_action":
+            return self._conclude_night_action(decision, thought)
+        return self._conclude_vote(decision, thought)
+    
     def get_thoughts(self) -> List[Dict]:
         """获取思考链"""
         return self.thoughts
     
+    def snapshot(self) -> Dict[str, List[Dict]]:
+        """导出记忆和思考链（用于检查点）"""
+        return {"memory": list(self.memory), "thoughts": list(self.thoughts)}
+    
+    def restore(self, data: Dict[str, List[Dict]]):
+        """从 snapshot 导出的数据恢复记忆和思考链"""
+        self.memory = list(data.get("memory", []))
+        self.thoughts = list(data.get("thoughts", []))
+    
     def reset_thoughts(self):
         """重置思考链（新一局游戏）"""
         self.thoughts = []
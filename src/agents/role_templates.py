@@ -25,7 +25,20 @@ class Personality(Enum):
 
 
 class RoleTemplate:
-    """角色模板管理器"""
+    """
+    角色模板管理器
+    
+    提示词按“稳定前缀优先”组织，以便命中服务端的提示词前缀缓存：
+    游戏规则 -> 角色说明 -> 性格 -> 玩家身份（系统提示词），
+    阶段说明和输出格式 -> 本轮公共局势 -> 本次调用的增量（记忆、RAG 检索结果）
+    """
+    
+    # 所有玩家共用的游戏规则（放在最前面，可在所有玩家之间共享缓存前缀）
+    GAME_RULES = """这是一局狼人杀游戏。游戏规则：
+1. 游戏分为夜晚和白天，循环进行
+2. 夜晚狼人共同选择一名玩家杀死，村民无法行动
+3. 白天所有存活玩家依次发言，随后投票处决一名玩家，平票时在得票最多的玩家中随机处决一名
+4. 所有狼人被处决时村民获胜；存活的狼人数量不少于存活的村民数量时狼人获胜"""
     
     # 基础角色提示词
     BASE_ROLE_PROMPTS = {
@@ -81,6 +94,119 @@ class RoleTemplate:
 - 通过观察而非直接推理来做出判断"""
     }
     
+    # 各阶段的固定说明（同一角色的所有玩家、所有轮次都相同）
+    PHASE_INSTRUCTIONS = {
+        ("night_action", Role.WEREWOLF): """【夜晚行动】
+请选择你要杀死的目标。考虑以下因素：
+1. 哪些村民最有可能在白天威胁到狼人
+2. 哪些村民的分析能力最强
+3. 杀死谁能让狼人更容易获胜""",
+        ("discussion", Role.WEREWOLF): """【白天发言】
+作为狼人，你需要：
+1. 伪装成村民，分析局势
+2. 可以怀疑其他玩家，但要谨慎
+3. 避免暴露自己的身份
+4. 可以尝试误导村民投票给其他村民""",
+        ("discussion", Role.VILLAGER): """【白天发言】
+作为村民，你需要：
+1. 分析当前局势，找出可疑的玩家
+2. 基于发言逻辑和投票行为进行推理
+3. 与其他村民合作，但保持独立思考
+4. 提供有价值的观察和分析""",
+        ("voting", Role.WEREWOLF): """【投票】
+作为狼人，你需要：
+1. 投票给一个村民，试图处决他
+2. 选择最有可能被其他玩家怀疑的目标
+3. 或者投票给可能威胁到狼人的村民""",
+        ("voting", Role.VILLAGER): """【投票】
+作为村民，你需要：
+1. 基于发言和推理，投票给最可疑的玩家
+2. 选择你认为最可能是狼人的玩家"""
+    }
+    
+    # 同时发言后的反驳环节（追加在公共局势之后）
+    REBUTTAL_INSTRUCTION = "【反驳环节】所有玩家已同时发言完毕。请针对上面其他玩家的发言简短回应或反驳（一两句话），不要重复自己已经说过的内容。"
+    
+    # 完整输出格式
+    RESPONSE_FORMATS = {
+        ("night_action", Role.WEREWOLF): """{
+    "target": "玩家名称",
+    "reasoning": "选择理由"
+}""",
+        ("discussion", Role.WEREWOLF): """{
+    "speech": "你的发言内容",
+    "suspicion": "你怀疑的玩家（可选）",
+    "reasoning": "你的推理过程"
+}""",
+        ("discussion", Role.VILLAGER): """{
+    "speech": "你的发言内容",
+    "suspicion": "你怀疑的玩家",
+    "reasoning": "你的推理过程",
+    "evidence": "你观察到的证据"
+}""",
+        ("voting", Role.WEREWOLF): """{
+    "vote": "你要投票的玩家名称",
+    "reasoning": "投票理由"
+}""",
+        ("voting", Role.VILLAGER): """{
+    "vote": "你要投票的玩家名称",
+    "reasoning": "投票理由"
+}"""
+    }
+    
+    # 紧凑输出格式（短键名，减少 completion token）
+    COMPACT_FORMATS = {
+        "night_action": '{"t": "目标玩家名称", "r": "理由（不超过20字）"}',
+        "discussion": '{"s": "你的发言内容", "u": "你怀疑的玩家", "r": "推理（不超过30字）"}',
+        "voting": '{"v": "投票的玩家名称", "r": "理由（不超过20字）"}'
+    }
+    
+    @classmethod
+    def get_response_format(cls, phase: str, role: Role, compact: bool = False) -> str:
+        """
+        获取回复格式说明
+        
+        Args:
+            phase: 阶段
+            role: 角色类型
+            compact: 是否使用短键名的紧凑格式
+            
+        Returns:
+            回复格式说明
+        """
+        if compact:
+            return f"请只输出一行紧凑 JSON（使用短键名），不要输出其他内容：\n{cls.COMPACT_FORMATS[phase]}"
+        return f"请以 JSON 格式回复：\n{cls.RESPONSE_FORMATS[(phase, role)]}"
+    
+    @classmethod
+    def get_reask_prompt(cls, phase: str, alive_players: List[str], compact: bool = False) -> str:
+        """
+        获取定向重问的提示词（本地修复失败时使用）
+        
+        Args:
+            phase: 阶段
+            alive_players: 可选择的玩家
+            compact: 是否使用短键名的紧凑格式
+            
+        Returns:
+            重问提示词
+        """
+        if phase == "night_action":
+            key = "t" if compact else "target"
+        elif phase == "voting":
+            key = "v" if compact else "vote"
+        else:
+            key = "s" if compact else "speech"
+        reasoning_key = "r" if compact else "reasoning"
+        
+        if phase == "discussion":
+            value = "你的发言内容"
+        else:
+            value = f"从以下玩家中选择一名：{', '.join(alive_players)}"
+        
+        return f"""你上一条回复无法解析为有效的决策。请只回复一个 JSON 对象，不要输出任何其他内容，玩家名称必须与列表完全一致：
+{{"{key}": "{value}", "{reasoning_key}": "简短理由"}}"""
+    
     @classmethod
     def get_role_prompt(cls, role: Role, personality: Personality, player_name: str) -> str:
         """
@@ -97,54 +223,135 @@ class RoleTemplate:
         base_prompt = cls.BASE_ROLE_PROMPTS[role]
         personality_trait = cls.PERSONALITY_TRAITS[personality]
         
-        prompt = f"""你是玩家 {player_name}。
+        # 共享程度从高到低：规则（所有玩家）-> 角色 -> 性格 -> 玩家名称
+        prompt = f"""{cls.GAME_RULES}
 
 {base_prompt}
 
 {personality_trait}
 
-请始终记住你的身份和性格特征，在游戏中保持一致的行为模式。"""
+你是玩家 {player_name}。请始终记住你的身份和性格特征，在游戏中保持一致的行为模式。"""
         
         return prompt
     
     @classmethod
-    def get_night_action_prompt(cls, role: Role, game_state: Dict) -> str:
+    def get_phase_instructions(cls, role: Role, phase: str, compact: bool = False) -> str:
+        """
+        获取阶段说明和输出格式（不含任何局势信息，可跨轮次命中前缀缓存）
+        
+        Args:
+            role: 角色类型
+            phase: 阶段（night_action / discussion / voting）
+            compact: 是否要求紧凑输出格式
+            
+        Returns:
+            阶段说明
+        """
+        return f"{cls.PHASE_INSTRUCTIONS[(phase, role)]}\n\n{cls.get_response_format(phase, role, compact)}"
+    
+    @classmethod
+    def get_public_context(cls, role: Role, phase: str, game_state: Dict) -> str:
+        """
+        获取本轮的公共局势（同一轮同一阶段内对所有同角色玩家相同）
+        
+        Args:
+            role: 角色类型
+            phase: 阶段（night_action / discussion / voting）
+            game_state: 当前游戏状态
+            
+        Returns:
+            公共局势描述
+        """
+        # 大房间模式下只列出与该玩家相关的摘要玩家
+        listed_players = game_state.get("digest_players", game_state.get("alive_players", []))
+        
+        if phase == "night_action":
+            villagers = [p for p in listed_players if game_state.get("player_roles", {}).get(p) == Role.VILLAGER.value]
+            return f"""现在是夜晚，狼人行动时间。
+
+{cls.format_alive_players(game_state)}
+存活的村民：{', '.join(villagers) if villagers else '无'}"""
+        
+        if phase == "discussion":
+            current_round = game_state.get("round", 1)
+            deaths = game_state.get("last_night_deaths", [])
+            context = f"""现在是第 {current_round} 轮白天发言环节。
+
+{cls.format_alive_players(game_state)}"""
+            if deaths:
+                context += f"\n昨晚死亡的玩家：{', '.join(deaths)}"
+            if game_state.get("rebuttal"):
+                context += f"\n\n本轮发言记录：{cls.format_speeches(game_state)}\n\n{cls.REBUTTAL_INSTRUCTION}"
+            return context
+        
+        return f"""现在是投票环节。
+
+{cls.format_alive_players(game_state)}
+
+本轮发言记录：{cls.format_speeches(game_state)}"""
+    
+    @staticmethod
+    def format_alive_players(game_state: Dict) -> str:
+        """存活玩家行；大房间模式下只列出摘要中的玩家，并注明存活总人数"""
+        alive_players = game_state.get("alive_players", [])
+        digest_players = game_state.get("digest_players")
+        if digest_players is None:
+            return f"当前存活的玩家：{', '.join(alive_players)}"
+        return (
+            f"当前存活的玩家：{', '.join(digest_players)}\n"
+            f"（共 {len(alive_players)} 名存活玩家，这里只列出与你最相关的 {len(digest_players)} 名其他玩家及其发言）"
+        )
+    
+    @classmethod
+    def format_speeches(cls, game_state: Dict) -> str:
+        """本轮发言记录（状态中的 discussion_logs 即本轮的全部发言），每条一行；同一玩家的第二次发言标注为反驳"""
+        speakers = set()
+        lines = []
+        for log in game_state.get("discussion_logs", []):
+            player = log.get("player")
+            label = f"{player}（反驳）" if player in speakers else player
+            speakers.add(player)
+            lines.append(f"\n- {label}: {cls.get_speech_text(log)}")
+        return "".join(lines)
+    
+    @staticmethod
+    def get_speech_text(log: Dict) -> str:
+        """获取发言记录中的发言文本（记录中可能保存的是完整的发言结果）"""
+        speech = log.get("speech")
+        if isinstance(speech, dict):
+            speech = speech.get("speech", "")
+        return str(speech or "")
+    
+    @classmethod
+    def get_night_action_prompt(cls, role: Role, game_state: Dict, compact: bool = False) -> str:
         """
         获取夜晚行动的提示词
         
         Args:
             role: 角色类型
             game_state: 当前游戏状态
+            compact: 是否要求紧凑输出格式
             
         Returns:
             夜晚行动提示词
         """
         if role == Role.WEREWOLF:
-            alive_players = game_state.get("alive_players", [])
-            villagers = [p for p in alive_players if game_state.get("player_roles", {}).get(p) == Role.VILLAGER.value]
-            
-            prompt = f"""现在是夜晚，狼人行动时间。
+            prompt = f"""{cls.get_phase_instructions(role, "night_action", compact)}
 
-当前存活的玩家：{', '.join(alive_players)}
-存活的村民：{', '.join(villagers) if villagers else '无'}
-
-请选择你要杀死的目标。考虑以下因素：
-1. 哪些村民最有可能在白天威胁到狼人
-2. 哪些村民的分析能力最强
-3. 杀死谁能让狼人更容易获胜
-
-请以 JSON 格式回复：
-{{
-    "target": "玩家名称",
-    "reasoning": "选择理由"
-}}"""
+{cls.get_public_context(role, "night_action", game_state)}"""
         else:
             prompt = "现在是夜晚，村民在睡觉，无法行动。"
         
         return prompt
     
     @classmethod
-    def get_discussion_prompt(cls, role: Role, game_state: Dict, memory_context: str = "") -> str:
+    def get_discussion_prompt(
+        cls,
+        role: Role,
+        game_state: Dict,
+        memory_context: str = "",
+        compact: bool = False
+    ) -> str:
         """
         获取发言环节的提示词
         
@@ -152,104 +359,110 @@ class RoleTemplate:
             role: 角色类型
             game_state: 当前游戏状态
             memory_context: 记忆上下文（RAG 检索结果）
+            compact: 是否要求紧凑输出格式
             
         Returns:
             发言提示词
         """
-        alive_players = game_state.get("alive_players", [])
-        current_round = game_state.get("round", 1)
-        deaths = game_state.get("last_night_deaths", [])
-        
-        prompt = f"""现在是第 {current_round} 轮白天发言环节。
+        prompt = f"""{cls.get_phase_instructions(role, "discussion", compact)}
 
-当前存活的玩家：{', '.join(alive_players)}
-"""
-        
-        if deaths:
-            prompt += f"昨晚死亡的玩家：{', '.join(deaths)}\n"
+{cls.get_public_context(role, "discussion", game_state)}"""
         
+        # 检索结果每次调用都不同，放在最后
         if memory_context:
-            prompt += f"\n相关历史发言：\n{memory_context}\n"
-        
-        if role == Role.WEREWOLF:
-            prompt += """
-作为狼人，你需要：
-1. 伪装成村民，分析局势
-2. 可以怀疑其他玩家，但要谨慎
-3. 避免暴露自己的身份
-4. 可以尝试误导村民投票给其他村民
-
-请以 JSON 格式回复：
-{
-    "speech": "你的发言内容",
-    "suspicion": "你怀疑的玩家（可选）",
-    "reasoning": "你的推理过程"
-}"""
-        else:
-            prompt += """
-作为村民，你需要：
-1. 分析当前局势，找出可疑的玩家
-2. 基于发言逻辑和投票行为进行推理
-3. 与其他村民合作，但保持独立思考
-4. 提供有价值的观察和分析
-
-请以 JSON 格式回复：
-{
-    "speech": "你的发言内容",
-    "suspicion": "你怀疑的玩家",
-    "reasoning": "你的推理过程",
-    "evidence": "你观察到的证据"
-}"""
+            prompt += f"\n\n相关历史发言：\n{memory_context}"
         
         return prompt
     
     @classmethod
-    def get_voting_prompt(cls, role: Role, game_state: Dict) -> str:
+    def get_voting_prompt(cls, role: Role, game_state: Dict, compact: bool = False) -> str:
         """
         获取投票环节的提示词
         
         Args:
             role: 角色类型
             game_state: 当前游戏状态
+            compact: 是否要求紧凑输出格式
             
         Returns:
             投票提示词
         """
-        alive_players = game_state.get("alive_players", [])
-        discussion_logs = game_state.get("discussion_logs", [])
+        prompt = f"""{cls.get_phase_instructions(role, "voting", compact)}
+
+{cls.get_public_context(role, "voting", game_state)}"""
         
-        prompt = f"""现在是投票环节。
+        return prompt
+    
+    @classmethod
+    def get_batch_system_prompt(cls, role: Role) -> str:
+        """
+        获取批量决策的系统提示词（同一角色的多名玩家共用一份角色说明）
+        
+        Args:
+            role: 角色类型
+            
+        Returns:
+            批量决策系统提示词
+        """
+        role_name = "狼人" if role == Role.WEREWOLF else "村民"
+        return f"""{cls.GAME_RULES}
 
-当前存活的玩家：{', '.join(alive_players)}
+你是狼人杀游戏的决策助手，需要分别代表多名{role_name}玩家做出决策。
 
-本轮发言记录：
-"""
-        for log in discussion_logs[-len(alive_players):]:
-            prompt += f"- {log.get('player')}: {log.get('speech')}\n"
-        
-        if role == Role.WEREWOLF:
-            prompt += """
-作为狼人，你需要：
-1. 投票给一个村民，试图处决他
-2. 选择最有可能被其他玩家怀疑的目标
-3. 或者投票给可能威胁到狼人的村民
+这些玩家共同的角色说明如下（其中的“你”指每一名玩家）：
+{cls.BASE_ROLE_PROMPTS[role]}
 
-请以 JSON 格式回复：
-{
-    "vote": "你要投票的玩家名称",
-    "reasoning": "投票理由"
-}"""
+每名玩家都有自己的性格和私有记忆，请严格只根据该玩家自己的信息为其做出决策，保持各自的行为模式。"""
+    
+    @classmethod
+    def get_batch_decision_prompt(
+        cls,
+        role: Role,
+        phase: str,
+        game_state: Dict,
+        private_contexts: Dict[str, str]
+    ) -> str:
+        """
+        获取批量决策的提示词：公共上下文只出现一次，每名玩家一个私有分节
+        
+        Args:
+            role: 角色类型（同一批次的玩家角色必须相同）
+            phase: 阶段（night_action 或 voting）
+            game_state: 当前游戏状态
+            private_contexts: 各玩家的私有上下文 {player: context}
+            
+        Returns:
+            批量决策提示词，要求以 JSON 数组回复
+        """
+        members = list(private_contexts.keys())
+        
+        if phase == "night_action":
+            decision_key = "target"
+            decision_desc = "要杀死的目标玩家名称"
         else:
-            prompt += """
-作为村民，你需要：
-1. 基于发言和推理，投票给最可疑的玩家
-2. 选择你认为最可能是狼人的玩家
+            decision_key = "vote"
+            decision_desc = "要投票的玩家名称"
+        
+        # 固定说明在前，公共局势居中，各玩家的私有信息在最后
+        prompt = f"""{cls.PHASE_INSTRUCTIONS[(phase, role)]}
 
-请以 JSON 格式回复：
-{
-    "vote": "你要投票的玩家名称",
-    "reasoning": "投票理由"
-}"""
+请为每名玩家分别做出决策，以 JSON 数组格式回复，每名玩家一项：
+[
+    {{
+        "player": "玩家名称",
+        "{decision_key}": "{decision_desc}",
+        "reasoning": "该玩家的理由"
+    }}
+]
+
+{cls.get_public_context(role, phase, game_state)}
+
+需要决策的玩家：{', '.join(members)}
+
+以下是每名玩家的私有信息，只能用于该玩家自己的决策：
+"""
+        for player, context in private_contexts.items():
+            prompt += f"\n### 玩家 {player}\n{context}\n"
         
         return prompt
 
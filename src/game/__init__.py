@@ -5,5 +5,16 @@
 from .game_state import GameState
 from .game_flow import GameFlow
 from .game_logic import GameLogic
+from .compact_core import CompactGame
+from .event_log import EventLog
+from .discussion_pipeline import DiscussionPipeline
+from .decision_ledger import DecisionLedger
+from .checkpoint import SqliteCheckpointSaver, create_checkpointer
+from .batch_runner import BatchRunner, wilson_interval
+from .league import League, LeagueRatings, TrueSkill
 
-__all__ = ["GameState", "GameFlow", "GameLogic"]
+__all__ = [
+    "GameState", "GameFlow", "GameLogic", "DecisionLedger", "SqliteCheckpointSaver", "create_checkpointer",
+    "BatchRunner", "wilson_interval", "CompactGame", "EventLog", "DiscussionPipeline",
+    "League", "LeagueRatings", "TrueSkill"
+]
@@ -0,0 +1,411 @@
+"""
+批量对局
+多进程并发运行 N 局游戏（每局使用确定的随机种子分配角色），用胜率评估提示词和性格设定的改动。
+每局结束后立即把结果追加到 JSONL 文件并更新汇总报告；中断后用同一个输出文件重新运行会跳过已完成的对局
+"""
+
+import io
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext, redirect_stdout
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..llm.client_pool import configure_client_pool
+from ..llm.rate_limiter import RateLimiter
+from ..llm.resilience import ResiliencePolicy
+from ..llm.response_cache import ResponseCache
+from ..utils.cost_tracker import CostTracker, LatencyHistogram
+from .game_flow import GameFlow
+
+
+DEFAULT_PLAYERS = ["Alice", "Bob", "Charlie", "David", "Eve"]
+
+# 达到最大轮数仍未分胜负的对局
+DRAW = "平局"
+
+# GameState.check_win 判定的获胜方
+WINNERS = ("狼人", "村民")
+
+
+def wilson_interval(successes: int, total: int, z: float = 1.96) -> Tuple[float, float]:
+    """
+    二项比例的 Wilson 置信区间（样本少或比例接近 0 / 1 时比正态近似更可靠）
+
+    Args:
+        successes: 成功次数
+        total: 总次数
+        z: 正态分位数（1.96 对应 95% 置信度）
+
+    Returns:
+        (下界, 上界)；total 为 0 时返回 (0, 1)
+    """
+    if total <= 0:
+        return 0.0, 1.0
+    p = successes / total
+    denominator = 1 + z * z / total
+    center = (p + z * z / (2 * total)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def distribution(values: Iterable[float]) -> Dict[str, float]:
+    """一组数值的均值、分位数和极值"""
+    values = sorted(values)
+    if not values:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p90": 0.0, "p99": 0.0, "min": 0.0, "max": 0.0}
+
+    def percentile(q: float) -> float:
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(0.5),
+        "p90": percentile(0.9),
+        "p99": percentile(0.99),
+        "min": values[0],
+        "max": values[-1]
+    }
+
+
+def build_report(records: List[Dict], z: float = 1.96) -> Dict[str, Any]:
+    """
+    根据每局结果汇总报告
+
+    Args:
+        records: play_game 返回的对局记录（含失败的记录）
+        z: 胜率置信区间的正态分位数
+
+    Returns:
+        胜率（含 Wilson 置信区间）、平均轮数、每局 token / 调用次数 / 耗时分布和单次调用的延迟分位数
+    """
+    games = [r for r in records if "error" not in r]
+    wins: Dict[str, int] = {}
+    for record in games:
+        wins[record["winner"]] = wins.get(record["winner"], 0) + 1
+
+    win_rates = {}
+    for side, count in sorted(wins.items()):
+        low, high = wilson_interval(count, len(games), z)
+        win_rates[side] = {
+            "wins": count,
+            "rate": count / len(games),
+            "ci_low": low,
+            "ci_high": high
+        }
+
+    latency = LatencyHistogram()
+    for record in games:
+        latency.merge(LatencyHistogram.from_state(record["latency"]))
+
+    return {
+        "games": len(games),
+        "failed": len(records) - len(games),
+        "win_rates": win_rates,
+        "rounds": distribution(r["rounds"] for r in games),
+        "tokens_per_game": distribution(r["total_tokens"] for r in games),
+        "completion_tokens_per_game": distribution(r["completion_tokens"] for r in games),
+        "calls_per_game": distribution(r["calls"] for r in games),
+        "game_duration": distribution(r["duration"] for r in games),
+        "call_latency": latency.to_dict()
+    }
+
+
+# ----------------------------------------------------------------------
+# 工作进程
+# ----------------------------------------------------------------------
+
+# 每个工作进程的共享对象：导入的模块、客户端池、限流器、容错策略和响应缓存在进程内的所有对局间复用
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(options: Dict[str, Any]):
+    """工作进程初始化：配置客户端池，创建进程内共享的限流器、容错策略和响应缓存"""
+    if options.get("http_client"):
+        configure_client_pool(**options["http_client"])
+    _worker["options"] = options
+    _worker["rate_limiter"] = RateLimiter.from_config(options.get("rate_limit"))
+    _worker["resilience"] = ResiliencePolicy.from_config(options.get("resilience"))
+    # SQLite 缓存文件在所有工作进程之间共享（相同请求只调用一次 LLM）
+    cache_path = options.get("response_cache_path")
+    _worker["response_cache"] = ResponseCache(db_path=cache_path) if cache_path else None
+
+
+def play_game(index: int) -> Tuple[Dict[str, Any], Optional[CostTracker]]:
+    """
+    在工作进程中运行一局游戏
+
+    Args:
+        index: 对局序号（决定随机种子和对局 ID）
+
+    Returns:
+        (对局记录, 成本追踪器)；对局无法开始时记录中带 error，追踪器为 None
+    """
+    options = _worker["options"]
+    seed = options["base_seed"] + index
+    game_id = f"{options['batch_id']}-{index:05d}"
+    record: Dict[str, Any] = {"type": "game", "index": index, "game_id": game_id, "seed": seed}
+    return run_worker_game(record)
+
+
+def run_worker_game(record: Dict[str, Any], **game_options) -> Tuple[Dict[str, Any], Optional[CostTracker]]:
+    """
+    在工作进程中运行 record 描述的一局游戏，并把结果填入 record
+
+    Args:
+        record: 对局记录（至少包含 game_id 和 seed）
+        **game_options: 本局额外的 GameFlow 参数（如联赛中按阵营的 team_configs）
+
+    Returns:
+        (对局记录, 成本追踪器)；对局无法开始时记录中带 error，追踪器为 None；
+        对局中途出错或没有结果时记录中带 error（续跑时重新运行），追踪器仍包含已发生的调用
+    """
+    options = _worker["options"]
+    start = time.perf_counter()
+    output = io.StringIO() if options["quiet"] else None
+    try:
+        with redirect_stdout(output) if output is not None else nullcontext():
+            game = GameFlow(
+                players=options["players"],
+                seed=record["seed"],
+                game_id=record["game_id"],
+                rate_limiter=_worker["rate_limiter"],
+                resilience=_worker["resilience"],
+                response_cache=_worker["response_cache"],
+                **{**options["game_options"], **game_options}
+            )
+            result = game.run(max_rounds=options["max_rounds"], save_log=False)
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        return record, None
+
+    tracker = game.cost_tracker
+    if result["error"]:
+        record["error"] = result["error"]
+        return record, tracker
+    if result["round_limit"]:
+        winner = DRAW
+    elif result["winner"] in WINNERS:
+        winner = result["winner"]
+    else:
+        record["error"] = f"Game ended without a winner: {result['winner']!r}"
+        return record, tracker
+
+    record.update({
+        "winner": winner,
+        "reason": result["reason"],
+        "rounds": result["rounds"],
+        "roles": game.roles,
+        "duration": time.perf_counter() - start,
+        "calls": tracker.totals.calls,
+        "total_tokens": tracker.get_total_tokens(),
+        "prompt_tokens": tracker.get_prompt_tokens(),
+        "completion_tokens": tracker.get_completion_tokens(),
+        "latency": tracker.totals.latency.to_state()
+    })
+    return record, tracker
+
+
+# ----------------------------------------------------------------------
+# 批量运行
+# ----------------------------------------------------------------------
+
+class BatchRunner:
+    """批量对局运行器"""
+
+    def __init__(
+        self,
+        num_games: int,
+        output_path: str,
+        players: Optional[List[str]] = None,
+        workers: int = 1,
+        base_seed: int = 0,
+        max_rounds: int = 10,
+        game_options: Optional[Dict[str, Any]] = None,
+        rate_limit: Optional[Dict[str, Any]] = None,
+        resilience: Optional[Dict[str, Any]] = None,
+        http_client: Optional[Dict[str, Any]] = None,
+        quiet: bool = True,
+        response_cache_path: Optional[str] = None
+    ):
+        """
+        初始化批量运行器
+
+        Args:
+            num_games: 对局数
+            output_path: 结果 JSONL 文件路径（已存在时续跑：跳过其中已完成的对局）
+            players: 玩家名称列表（默认 5 名玩家）
+            workers: 工作进程数（1 时在当前进程中顺序运行）
+            base_seed: 第 i 局使用 base_seed + i 作为随机种子（角色分配、平票处理和 stub 后端）
+            max_rounds: 每局最大轮数
+            game_options: 传给 GameFlow 的其他参数（如 llm_backend、llm_config、use_rag，需可序列化）
+            rate_limit: 限流配置（rate_limit 配置段，RPM / TPM 按工作进程数平分）
+            resilience: 容错配置（resilience 配置段）
+            http_client: 客户端池配置（http_client 配置段）
+            quiet: 是否屏蔽每局游戏的控制台输出
+            response_cache_path: LLM 响应缓存的 SQLite 文件（可选，所有工作进程共享）
+        """
+        if num_games < 1:
+            raise ValueError("num_games must be positive")
+        if workers < 1:
+            raise ValueError("workers must be positive")
+
+        self.num_games = num_games
+        self.output_path = output_path
+        self.report_path = os.path.splitext(output_path)[0] + ".report.json"
+        self.players = list(players or DEFAULT_PLAYERS)
+        self.workers = workers
+        self.base_seed = base_seed
+        self.max_rounds = max_rounds
+        self.quiet = quiet
+        self.batch_id = os.path.splitext(os.path.basename(output_path))[0]
+
+        self.worker_options = {
+            "batch_id": self.batch_id,
+            "players": self.players,
+            "base_seed": base_seed,
+            "max_rounds": max_rounds,
+            "game_options": dict(game_options or {}),
+            "rate_limit": self._split_rate_limit(rate_limit, workers),
+            "resilience": resilience,
+            "http_client": http_client,
+            "quiet": quiet,
+            "response_cache_path": response_cache_path
+        }
+
+        # 本次运行中各局成本追踪器的合并结果（按模型 / 路由 / 阶段 / Agent 的细分统计）
+        self.cost_tracker = CostTracker(game_id=self.batch_id, retain_records=None)
+        self.records: Dict[int, Dict] = {}
+
+    @staticmethod
+    def _split_rate_limit(config: Optional[Dict[str, Any]], workers: int) -> Optional[Dict[str, Any]]:
+        """每个工作进程有独立的限流器，账号级的 RPM / TPM 配额按进程数平分"""
+        if not config:
+            return config
+        config = dict(config)
+        for key in ("requests_per_minute", "tokens_per_minute"):
+            if config.get(key):
+                config[key] = config[key] / workers
+        return config
+
+    def _header(self) -> Dict[str, Any]:
+        return {
+            "type": "batch",
+            "batch_id": self.batch_id,
+            "players": self.players,
+            "base_seed": self.base_seed,
+            "max_rounds": self.max_rounds
+        }
+
+    def load_completed(self) -> Dict[int, Dict]:
+        """
+        读取输出文件中已完成的对局（失败的对局会重新运行）
+
+        Raises:
+            ValueError: 输出文件属于玩家、种子或轮数设置不同的另一批对局
+        """
+        completed: Dict[int, Dict] = {}
+        if not os.path.exists(self.output_path):
+            return completed
+
+        header = self._header()
+        with open(self.output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 中断时写了一半的行
+                if record.get("type") == "batch":
+                    for key in ("players", "base_seed", "max_rounds"):
+                        if record.get(key) != header[key]:
+                            raise ValueError(
+                                f"{self.output_path} was written with a different {key}: {record.get(key)}"
+                            )
+                elif record.get("type") == "game" and "error" not in record:
+                    completed[record["index"]] = record
+        return completed
+
+    def run(self, progress: bool = True) -> Dict[str, Any]:
+        """
+        运行全部未完成的对局
+
+        Args:
+            progress: 是否在每局结束时打印进度和当前胜率
+
+        Returns:
+            汇总报告（同时写入 <输出文件名>.report.json）
+        """
+        self.records = self.load_completed()
+        pending = [i for i in range(self.num_games) if i not in self.records]
+        if progress and self.records:
+            print(f"续跑：已完成 {len(self.records)} 局，剩余 {len(pending)} 局")
+
+        directory = os.path.dirname(os.path.abspath(self.output_path))
+        os.makedirs(directory, exist_ok=True)
+        is_new = not os.path.exists(self.output_path) or os.path.getsize(self.output_path) == 0
+
+        with open(self.output_path, "a", encoding="utf-8") as out:
+            if is_new:
+                self._write(out, self._header())
+            elif not self._ends_with_newline():
+                out.write("\n")  # 上次中断时最后一行没有写完
+
+            if self.workers == 1:
+                _init_worker(self.worker_options)
+                for index in pending:
+                    self._handle(out, *play_game(index), progress=progress)
+            elif pending:
+                with ProcessPoolExecutor(
+                    max_workers=min(self.workers, len(pending)),
+                    initializer=_init_worker,
+                    initargs=(self.worker_options,)
+                ) as pool:
+                    futures = [pool.submit(play_game, index) for index in pending]
+                    for future in as_completed(futures):
+                        self._handle(out, *future.result(), progress=progress)
+
+        report = self.get_report()
+        with open(self.report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return report
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.output_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    @staticmethod
+    def _write(out, record: Dict):
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+    def _handle(self, out, record: Dict, tracker: Optional[CostTracker], progress: bool):
+        """写入一局结果并合并成本统计"""
+        self._write(out, record)
+        self.records[record["index"]] = record
+        if tracker is not None:
+            self.cost_tracker.merge(tracker)
+
+        if progress:
+            done = sum(1 for r in self.records.values() if "error" not in r)
+            if "error" in record:
+                print(f"[{done}/{self.num_games}] {record['game_id']} 失败: {record['error']}")
+            else:
+                rates = build_report(list(self.records.values()))["win_rates"]
+                summary = ", ".join(
+                    f"{side} {stats['rate']:.1%} [{stats['ci_low']:.1%}, {stats['ci_high']:.1%}]"
+                    for side, stats in rates.items()
+                )
+                print(f"[{done}/{self.num_games}] {record['game_id']} {record['winner']} "
+                      f"{record['rounds']} 轮, {record['total_tokens']:,} tokens | {summary}")
+
+    def get_report(self) -> Dict[str, Any]:
+        """当前的汇总报告（含已完成的历史对局；cost 为本次运行中各局成本统计的合并）"""
+        report = build_report([self.records[i] for i in sorted(self.records)])
+        report["batch_id"] = self.batch_id
+        report["players"] = self.players
+        report["cost"] = self.cost_tracker.get_summary()
+        return report
@@ -0,0 +1,221 @@
+"""
+紧凑的整数游戏核心
+玩家用座位号（0..n-1）表示，存活玩家和狼人集合用位掩码表示，
+存活狼人 / 村民数随死亡增量更新，胜负判断为 O(1)。
+GameState / GameLogic 在其上提供按玩家名称的接口；蒙特卡洛模拟和 stub Agent 模拟可直接使用
+"""
+
+import random
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+WEREWOLF = "werewolf"
+VILLAGER = "villager"
+
+# 胜负结果 (winner, reason)
+WIN_NONE = 0
+WIN_VILLAGERS = 1
+WIN_WEREWOLVES = 2
+
+REASON_NONE = 0
+REASON_NO_WEREWOLVES = 1
+REASON_WEREWOLF_PARITY = 2
+REASON_FEW_PLAYERS = 3
+
+# (winner, reason) -> GameLogic.check_win_condition 的返回值
+WIN_RESULTS: Dict[Tuple[int, int], Tuple[bool, str, str]] = {
+    (WIN_NONE, REASON_NONE): (False, "", ""),
+    (WIN_VILLAGERS, REASON_NO_WEREWOLVES): (True, "村民", "所有狼人已被处决"),
+    (WIN_WEREWOLVES, REASON_WEREWOLF_PARITY): (True, "狼人", "狼人数量大于等于村民数量"),
+    (WIN_WEREWOLVES, REASON_FEW_PLAYERS): (True, "狼人", "存活玩家过少，狼人获胜"),
+    (WIN_VILLAGERS, REASON_FEW_PLAYERS): (True, "村民", "存活玩家过少，但无狼人，村民获胜")
+}
+
+
+def check_win(alive_werewolves: int, alive_villagers: int, alive_total: Optional[int] = None) -> Tuple[int, int]:
+    """
+    根据存活人数判断胜负（O(1)）
+
+    Args:
+        alive_werewolves: 存活狼人数
+        alive_villagers: 存活村民数
+        alive_total: 存活总人数（含其他角色，默认为两者之和）
+
+    Returns:
+        (winner, reason)：WIN_* 和 REASON_* 常量
+    """
+    if alive_total is None:
+        alive_total = alive_werewolves + alive_villagers
+    if alive_werewolves == 0:
+        return WIN_VILLAGERS, REASON_NO_WEREWOLVES
+    if alive_werewolves >= alive_villagers:
+        return WIN_WEREWOLVES, REASON_WEREWOLF_PARITY
+    if alive_total <= 2:
+        return WIN_WEREWOLVES, REASON_FEW_PLAYERS
+    return WIN_NONE, REASON_NONE
+
+
+def iter_bits(mask: int) -> Iterator[int]:
+    """按从小到大的顺序遍历位掩码中置位的下标"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def popcount(mask: int) -> int:
+    """位掩码中置位的数量"""
+    return bin(mask).count("1")
+
+
+class CompactGame:
+    """位掩码表示的游戏状态"""
+
+    __slots__ = (
+        "names",
+        "index",
+        "werewolf_mask",
+        "villager_mask",
+        "alive_mask",
+        "alive_werewolves",
+        "alive_villagers",
+        "round"
+    )
+
+    def __init__(self, names: Sequence[str], werewolf_mask: int, villager_mask: Optional[int] = None):
+        """
+        初始化
+
+        Args:
+            names: 座位号对应的玩家名称
+            werewolf_mask: 狼人座位的位掩码
+            villager_mask: 村民座位的位掩码（默认为其余所有座位）
+        """
+        full_mask = (1 << len(names)) - 1
+        if werewolf_mask & ~full_mask:
+            raise ValueError("werewolf_mask refers to seats outside the player list")
+        self.names: Tuple[str, ...] = tuple(names)
+        self.index: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
+        self.werewolf_mask = werewolf_mask
+        self.villager_mask = full_mask & ~werewolf_mask if villager_mask is None else villager_mask
+        self.alive_mask = full_mask
+        self.alive_werewolves = popcount(werewolf_mask)
+        self.alive_villagers = popcount(self.villager_mask)
+        self.round = 0
+
+    @classmethod
+    def from_roles(cls, players: Sequence[str], roles: Dict[str, str]) -> "CompactGame":
+        """根据 {player: role} 角色分配创建"""
+        werewolf_mask = 0
+        villager_mask = 0
+        for i, player in enumerate(players):
+            if roles.get(player) == WEREWOLF:
+                werewolf_mask |= 1 << i
+            elif roles.get(player) == VILLAGER:
+                villager_mask |= 1 << i
+        return cls(players, werewolf_mask, villager_mask)
+
+    @classmethod
+    def random_setup(cls, num_players: int, num_werewolves: int = 2, rng: Optional[random.Random] = None) -> "CompactGame":
+        """随机分配角色（玩家名称为 P0..Pn-1）"""
+        rng = rng or random
+        werewolf_mask = 0
+        for seat in rng.sample(range(num_players), num_werewolves):
+            werewolf_mask |= 1 << seat
+        return cls([f"P{i}" for i in range(num_players)], werewolf_mask)
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def is_alive(self, seat: int) -> bool:
+        return bool(self.alive_mask >> seat & 1)
+
+    def is_werewolf(self, seat: int) -> bool:
+        return bool(self.werewolf_mask >> seat & 1)
+
+    @property
+    def alive_count(self) -> int:
+        return popcount(self.alive_mask)
+
+    def alive_seats(self, mask: int = -1) -> List[int]:
+        """存活玩家的座位号（可再用 mask 过滤，如 werewolf_mask）"""
+        return list(iter_bits(self.alive_mask & mask))
+
+    def alive_names(self) -> List[str]:
+        """按座位顺序的存活玩家名称"""
+        return [self.names[seat] for seat in iter_bits(self.alive_mask)]
+
+    def check_win(self) -> Tuple[int, int]:
+        """胜负判断（O(1)，使用增量维护的存活人数）"""
+        if self.alive_werewolves == 0:
+            return WIN_VILLAGERS, REASON_NO_WEREWOLVES
+        if self.alive_werewolves >= self.alive_villagers:
+            return WIN_WEREWOLVES, REASON_WEREWOLF_PARITY
+        return check_win(self.alive_werewolves, self.alive_villagers, self.alive_count)
+
+    # ------------------------------------------------------------------
+    # 状态变更
+    # ------------------------------------------------------------------
+
+    def kill(self, seat: int) -> bool:
+        """
+        玩家死亡（被杀或被处决）
+
+        Returns:
+            该玩家此前是否存活
+        """
+        bit = 1 << seat
+        if not self.alive_mask & bit:
+            return False
+        self.alive_mask ^= bit
+        if self.werewolf_mask & bit:
+            self.alive_werewolves -= 1
+        elif self.villager_mask & bit:
+            self.alive_villagers -= 1
+        return True
+
+    def set_alive(self, seats: Iterable[int]):
+        """直接设置存活玩家（恢复快照时使用），重新计算存活人数"""
+        mask = 0
+        for seat in seats:
+            mask |= 1 << seat
+        self.alive_mask = mask
+        self.alive_werewolves = popcount(mask & self.werewolf_mask)
+        self.alive_villagers = popcount(mask & self.villager_mask)
+
+    def copy(self) -> "CompactGame":
+        """复制（名称和索引是不可变的，直接共享）"""
+        game = CompactGame.__new__(CompactGame)
+        for slot in CompactGame.__slots__:
+            setattr(game, slot, getattr(self, slot))
+        return game
+
+    # ------------------------------------------------------------------
+    # 随机对局
+    # ------------------------------------------------------------------
+
+    def random_playout(self, rng: Optional[random.Random] = None, max_rounds: int = 100) -> Tuple[int, int]:
+        """
+        随机策略下把对局进行到底：狼人随机杀一名存活村民，所有人随机处决一名存活玩家
+
+        用于估算基线胜率和模拟吞吐量，会修改当前状态（需要保留时先 copy）
+
+        Args:
+            rng: 随机数生成器
+            max_rounds: 最大轮数
+
+        Returns:
+            (winner, 进行的轮数)；达到最大轮数时 winner 为 WIN_NONE
+        """
+        rng = rng or random
+        winner, _ = self.check_win()
+        while winner == WIN_NONE and self.round < max_rounds:
+            self.round += 1
+            self.kill(rng.choice(self.alive_seats(~self.werewolf_mask)))
+            winner, _ = self.check_win()
+            if winner != WIN_NONE:
+                break
+            self.kill(rng.choice(self.alive_seats()))
+            winner, _ = self.check_win()
+        return winner, self.round
@@ -0,0 +1,83 @@
+"""
+决策账本
+记录每个 Agent 在每轮每个阶段做出的唯一一次决策，
+游戏逻辑只根据账本结算，不再重复询问 Agent
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+
+class DecisionLedger:
+    """每轮决策账本 {(round, phase): {player: decision}}"""
+
+    def __init__(self):
+        self._decisions: Dict[Tuple[int, str], Dict[str, Dict]] = {}
+
+    def record(self, round_num: int, phase: str, player: str, decision: Dict):
+        """
+        记录一次决策
+
+        Args:
+            round_num: 轮次
+            phase: 阶段（night_action / voting 等）
+            player: 玩家名称
+            decision: Agent 返回的决策结果
+        """
+        phase_decisions = self._decisions.setdefault((round_num, phase), {})
+        if player in phase_decisions:
+            raise ValueError(f"{player} 在第 {round_num} 轮 {phase} 阶段已经做出过决策")
+        phase_decisions[player] = decision
+
+    def has_decided(self, round_num: int, phase: str, player: str) -> bool:
+        """判断玩家在该阶段是否已做出决策"""
+        return player in self._decisions.get((round_num, phase), {})
+
+    def get_decision(self, round_num: int, phase: str, player: str) -> Optional[Dict]:
+        """获取单个玩家的决策"""
+        return self._decisions.get((round_num, phase), {}).get(player)
+
+    def get_decisions(self, round_num: int, phase: str) -> Dict[str, Dict]:
+        """获取某阶段所有玩家的决策（按决策顺序）"""
+        return dict(self._decisions.get((round_num, phase), {}))
+
+    def get_targets(self, round_num: int, phase: str, key: str) -> Dict[str, str]:
+        """
+        获取某阶段所有非空的目标选择
+
+        Args:
+            round_num: 轮次
+            phase: 阶段
+            key: 决策中的目标字段（如 "target"、"vote"）
+
+        Returns:
+            {player: target}
+        """
+        targets = {}
+        for player, decision in self._decisions.get((round_num, phase), {}).items():
+            target = decision.get(key)
+            if target:
+                targets[player] = target
+        return targets
+
+    def pending(self, round_num: int, phase: str, players: List[str]) -> List[str]:
+        """返回尚未做出决策的玩家"""
+        decided = self._decisions.get((round_num, phase), {})
+        return [player for player in players if player not in decided]
+
+    def snapshot(self) -> List[Dict]:
+        """导出可序列化的决策记录（用于检查点）"""
+        return [
+            {"round": round_num, "phase": phase, "decisions": dict(decisions)}
+            for (round_num, phase), decisions in self._decisions.items()
+        ]
+
+    def restore(self, entries: List[Dict]):
+        """从 snapshot 导出的数据恢复账本"""
+        self._decisions = {
+            (entry["round"], entry["phase"]): dict(entry["decisions"])
+            for entry in entries
+        }
+
+    def clear(self):
+        """清空账本（新一局游戏）"""
+        self._decisions = {}
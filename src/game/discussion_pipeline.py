@@ -0,0 +1,242 @@
+"""
+发言环节流水线执行器
+按顺序发言时，每名玩家依次经历三个阶段：RAG 检索（查询嵌入 + 向量搜索）、LLM 发言、写入记忆（嵌入 + 入库）。
+流水线让后续玩家的检索在当前玩家的 LLM 调用期间提前进行，记忆写入放入后台队列按顺序执行，
+LLM 调用仍严格按发言顺序进行；各阶段的忙碌时间和等待时间用于判断关键路径。
+
+检索过滤掉了当前轮次的记忆（见 RAGEngine.retrieve_relevant_speeches），提前检索的结果与按顺序执行相同。
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+
+# 流水线阶段
+RETRIEVE = "retrieve"
+SPEAK = "speak"
+MEMORY_WRITE = "memory_write"
+STAGES = (RETRIEVE, SPEAK, MEMORY_WRITE)
+
+
+class DiscussionPipeline:
+    """发言环节流水线执行器"""
+
+    def __init__(self, lookahead: int = 2, max_workers: Optional[int] = None):
+        """
+        初始化流水线
+
+        Args:
+            lookahead: 提前检索的玩家数（当前玩家之后最多同时进行的检索数）
+            max_workers: 检索线程数（默认等于 lookahead）
+        """
+        if lookahead < 1:
+            raise ValueError("lookahead must be at least 1")
+        self.lookahead = lookahead
+        self.max_workers = max_workers or lookahead
+
+        self._lock = threading.Lock()
+        self._retrieve_executor: Optional[ThreadPoolExecutor] = None
+        self._write_executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._pending_writes: List[Future] = []
+
+        # 统计：各阶段累计忙碌时间、调用次数，发言阶段等待检索的时间，等待记忆写入完成的时间
+        self.busy: Dict[str, float] = {stage: 0.0 for stage in STAGES}
+        self.counts: Dict[str, int] = {stage: 0 for stage in STAGES}
+        self.retrieve_stall = 0.0
+        self.flush_wait = 0.0
+        self.wall_time = 0.0
+        self.phases = 0
+
+    def _executors(self):
+        """按进程懒创建线程池：检索可并行，记忆写入单线程以保持写入顺序"""
+        with self._lock:
+            if self._retrieve_executor is None or self._executor_pid != os.getpid():
+                self._retrieve_executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="rag-retrieve"
+                )
+                self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-write")
+                self._executor_pid = os.getpid()
+                self._pending_writes = []
+            return self._retrieve_executor, self._write_executor
+
+    def _timed(self, stage: str, fn: Callable, *args) -> Any:
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.busy[stage] += elapsed
+                self.counts[stage] += 1
+
+    # ------------------------------------------------------------------
+    # 检索和记忆写入
+    # ------------------------------------------------------------------
+
+    def submit_retrieval(self, retrieve: Callable[[str], Optional[str]], player: str) -> Future:
+        """在后台线程中检索"""
+        retrieve_executor, _ = self._executors()
+        return retrieve_executor.submit(self._timed, RETRIEVE, retrieve, player)
+
+    def retrieve_all(self, retrieve: Callable[[str], Optional[str]], players: List[str]) -> List[Optional[str]]:
+        """并行检索多名玩家的上下文（同时发言模式）"""
+        futures = [self.submit_retrieval(retrieve, player) for player in players]
+        return [self._await_retrieval(future) for future in futures]
+
+    async def aretrieve_all(self, retrieve: Callable[[str], Optional[str]], players: List[str]) -> List[Optional[str]]:
+        """retrieve_all 的异步版本"""
+        futures = [self.submit_retrieval(retrieve, player) for player in players]
+        return [await self._await_retrieval_async(future) for future in futures]
+
+    def submit_write(self, write: Callable[..., None], *args):
+        """把记忆写入放入后台队列（按提交顺序执行）"""
+        _, write_executor = self._executors()
+        future = write_executor.submit(self._timed, MEMORY_WRITE, write, *args)
+        with self._lock:
+            self._pending_writes.append(future)
+
+    def flush(self):
+        """等待所有排队的记忆写入完成（写入失败时抛出第一个异常）"""
+        start = time.perf_counter()
+        with self._lock:
+            pending, self._pending_writes = self._pending_writes, []
+        try:
+            for future in pending:
+                future.result()
+        finally:
+            with self._lock:
+                self.flush_wait += time.perf_counter() - start
+
+    # ------------------------------------------------------------------
+    # 按顺序发言
+    # ------------------------------------------------------------------
+
+    def run(
+        self,
+        speakers: List[str],
+        retrieve: Callable[[str], Optional[str]],
+        speak: Callable[[str, Optional[str]], Dict],
+        record: Callable[[str, Dict], None]
+    ):
+        """
+        按顺序执行一轮发言
+
+        Args:
+            speakers: 按发言顺序排列的玩家
+            retrieve: 检索函数 player -> RAG 上下文（在后台线程中执行）
+            speak: 发言函数 (player, RAG 上下文) -> 发言结果（按顺序在当前线程执行）
+            record: 记录发言 (player, 发言结果)（按顺序在当前线程执行，记忆写入可通过 submit_write 排队）
+        """
+        with self.phase():
+            futures = {i: self.submit_retrieval(retrieve, speakers[i]) for i in range(min(self.lookahead, len(speakers)))}
+            for i, player in enumerate(speakers):
+                rag_context = self._await_retrieval(futures.pop(i))
+                if i + self.lookahead < len(speakers):
+                    futures[i + self.lookahead] = self.submit_retrieval(retrieve, speakers[i + self.lookahead])
+
+                record(player, self._timed(SPEAK, speak, player, rag_context))
+            self.flush()
+
+    async def arun(
+        self,
+        speakers: List[str],
+        retrieve: Callable[[str], Optional[str]],
+        speak: Callable[[str, Optional[str]], Awaitable[Dict]],
+        record: Callable[[str, Dict], None]
+    ):
+        """run 的异步版本：发言函数为协程，等待检索和记忆写入时不阻塞事件循环"""
+        with self.phase():
+            futures = {i: self.submit_retrieval(retrieve, speakers[i]) for i in range(min(self.lookahead, len(speakers)))}
+            for i, player in enumerate(speakers):
+                rag_context = await self._await_retrieval_async(futures.pop(i))
+                if i + self.lookahead < len(speakers):
+                    futures[i + self.lookahead] = self.submit_retrieval(retrieve, speakers[i + self.lookahead])
+
+                speak_start = time.perf_counter()
+                try:
+                    speech_result = await speak(player, rag_context)
+                finally:
+                    with self._lock:
+                        self.busy[SPEAK] += time.perf_counter() - speak_start
+                        self.counts[SPEAK] += 1
+                record(player, speech_result)
+            await self.aflush()
+
+    async def aflush(self):
+        """flush 的异步版本"""
+        await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    def _await_retrieval(self, future: Future) -> Optional[str]:
+        start = time.perf_counter()
+        try:
+            return future.result()
+        finally:
+            with self._lock:
+                self.retrieve_stall += time.perf_counter() - start
+
+    async def _await_retrieval_async(self, future: Future) -> Optional[str]:
+        start = time.perf_counter()
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            with self._lock:
+                self.retrieve_stall += time.perf_counter() - start
+
+    @contextmanager
+    def phase(self) -> Iterator[None]:
+        """统计一个发言环节的总耗时（占用率的分母）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.wall_time += time.perf_counter() - start
+                self.phases += 1
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取各阶段占用率
+
+        occupancy 为阶段忙碌时间占流水线总耗时的比例：接近 1 的阶段是关键路径；
+        retrieve_stall 为发言等待检索结果的时间，flush_wait 为发言结束后等待记忆写入完成的时间
+        """
+        with self._lock:
+            wall_time = self.wall_time
+            stages = {
+                stage: {
+                    "count": self.counts[stage],
+                    "busy": self.busy[stage],
+                    "occupancy": self.busy[stage] / wall_time if wall_time else 0.0
+                }
+                for stage in STAGES
+            }
+            critical = max(STAGES, key=lambda stage: self.busy[stage]) if wall_time else None
+            return {
+                "phases": self.phases,
+                "wall_time": wall_time,
+                "stages": stages,
+                "retrieve_stall": self.retrieve_stall,
+                "flush_wait": self.flush_wait,
+                "critical_stage": critical
+            }
+
+    def close(self):
+        """等待排队的写入并关闭线程池"""
+        self.flush()
+        with self._lock:
+            executors = (self._retrieve_executor, self._write_executor)
+            self._retrieve_executor = self._write_executor = None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=True)
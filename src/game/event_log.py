@@ -0,0 +1,153 @@
+"""
+只追加的游戏事件日志
+每局游戏的唯一历史数据源：每个事件编码为 (类型, 轮次, 玩家, 数据) 元组，
+类型（阶段名 / 主持人事件名）和玩家名称驻留为整数 token。
+按阶段的记录列表、完整历史和主持人日志都是按需解码的视图：
+视图只缓存事件位置索引，条目在访问时才解码，不再重复保存。
+"""
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .shared_log import SharedLog
+
+
+# 事件元组 (kind, round, actor, data)；没有玩家时 actor 为 -1
+Event = Tuple[int, int, int, Any]
+Decoder = Callable[["EventLog", Event], Any]
+
+NO_TOKEN = -1
+
+
+class EventLog:
+    """一局游戏的事件日志"""
+
+    def __init__(self, tokens: Iterable[str] = ()):
+        """
+        初始化事件日志
+
+        Args:
+            tokens: 预先驻留的 token（通常为玩家列表，使玩家 token 与座位号一致）
+        """
+        self.tokens: List[str] = []
+        self._token_ids: Dict[str, int] = {}
+        for token in tokens:
+            self.intern(token)
+        self.events = SharedLog()
+        # 视图名称 -> (事件类型 token 集合, 匹配事件的位置, 已扫描的事件数)
+        self._indexes: Dict[str, Tuple[frozenset, SharedLog, int]] = {}
+
+    def intern(self, token: Optional[str]) -> int:
+        """返回 token 的整数编号（None 为 NO_TOKEN）"""
+        if token is None:
+            return NO_TOKEN
+        token_id = self._token_ids.get(token)
+        if token_id is None:
+            token_id = len(self.tokens)
+            self.tokens.append(token)
+            self._token_ids[token] = token_id
+        return token_id
+
+    def token(self, token_id: int) -> Optional[str]:
+        """整数编号对应的 token"""
+        return None if token_id == NO_TOKEN else self.tokens[token_id]
+
+    def append(self, kind: str, round_num: int = -1, actor: Optional[str] = None, data: Any = None):
+        """
+        追加事件
+
+        Args:
+            kind: 事件类型（阶段名或主持人事件名）
+            round_num: 轮次
+            actor: 相关玩家
+            data: 事件数据（记录后视为不可变）
+        """
+        self.events.append((self.intern(kind), round_num, self.intern(actor), data))
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def positions(self, name: str, kinds: Tuple[str, ...]) -> SharedLog:
+        """
+        指定类型事件在日志中的位置（增量维护，只扫描上次之后追加的事件）
+
+        Args:
+            name: 视图名称（缓存键）
+            kinds: 视图包含的事件类型
+        """
+        index = self._indexes.get(name)
+        if index is None:
+            index = (frozenset(self.intern(kind) for kind in kinds), SharedLog(), 0)
+        kind_ids, positions, scanned = index
+        total = len(self.events)
+        if scanned < total:
+            for offset, event in enumerate(self.events[scanned:], scanned):
+                if event[0] in kind_ids:
+                    positions.append(offset)
+            index = (kind_ids, positions, total)
+        self._indexes[name] = index
+        return positions
+
+    def view(self, name: str, kinds: Tuple[str, ...], decode: Decoder) -> "EventView":
+        """按类型过滤并解码的只读视图（随日志增长）"""
+        return EventView(self, name, kinds, decode)
+
+    def fork(self) -> "EventLog":
+        """分叉：事件和位置索引结构共享，只复制（很小的）token 表"""
+        log = EventLog.__new__(EventLog)
+        log.tokens = list(self.tokens)
+        log._token_ids = dict(self._token_ids)
+        log.events = self.events.fork()
+        log._indexes = {
+            name: (kind_ids, positions.fork(), scanned)
+            for name, (kind_ids, positions, scanned) in self._indexes.items()
+        }
+        return log
+
+    def encode(self) -> Dict[str, Any]:
+        """一次遍历导出可序列化的日志（用于检查点）"""
+        return {
+            "tokens": list(self.tokens),
+            "events": [list(event) for event in self.events]
+        }
+
+    @classmethod
+    def decode(cls, data: Dict[str, Any]) -> "EventLog":
+        """从 encode 导出的数据恢复"""
+        log = cls(data["tokens"])
+        log.events.extend(tuple(event) for event in data["events"])
+        return log
+
+
+class EventView(Sequence):
+    """事件日志的按需解码视图（支持 len、下标、切片和迭代）"""
+
+    def __init__(self, log: EventLog, name: str, kinds: Tuple[str, ...], decode: Decoder):
+        self.log = log
+        self.name = name
+        self.kinds = kinds
+        self.decode = decode
+
+    def _positions(self) -> SharedLog:
+        return self.log.positions(self.name, self.kinds)
+
+    def __len__(self) -> int:
+        return len(self._positions())
+
+    def __iter__(self) -> Iterator[Any]:
+        events = self.log.events
+        for position in self._positions():
+            yield self.decode(self.log, events[position])
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        positions = self._positions()[index]
+        events = self.log.events
+        if isinstance(index, slice):
+            return tuple(self.decode(self.log, events[position]) for position in positions)
+        return self.decode(self.log, events[positions])
+
+    def tail(self, n: int) -> Tuple[Any, ...]:
+        """最后 n 条（n <= 0 时为空）"""
+        return self[-n:] if n > 0 else ()
+
+    def __repr__(self) -> str:
+        return f"EventView({self.name!r}, {len(self)} events)"
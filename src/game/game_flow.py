@@ -4,20 +4,38 @@
 """
 
 import os
-from typing import Dict, List, Any, Optional
+import asyncio
+import pickle
+import random
+import uuid
+from contextlib import nullcontext
+from typing import Awaitable, Callable, ContextManager, Dict, List, Any, Mapping, Optional, Tuple
 from dotenv import load_dotenv
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.graph import StateGraph, END
 
 from ..agents.player_agent import PlayerAgent
 from ..agents.moderator_agent import ModeratorAgent
 from ..agents.role_templates import Role, Personality
+from ..game.checkpoint import create_checkpointer
 from ..game.game_state import GameState
 from ..game.game_logic import GameLogic
+from ..game.decision_ledger import DecisionLedger
+from ..game.discussion_pipeline import DiscussionPipeline
 from ..memory.memory_manager import MemoryManager
 from ..memory.vector_store import VectorStore
 from ..rag.rag_engine import RAGEngine
+from ..llm.client_pool import ClientPool, get_client_pool
+from ..llm.cassette import Cassette, CassetteChatModel
+from ..llm.model_router import ModelRouter
+from ..llm.rate_limiter import RateLimiter
+from ..llm.resilience import ResiliencePolicy
+from ..llm.response_cache import ResponseCache
+from ..llm.stub_backends import StubChatModel, HashEmbeddings
+from ..utils.config import load_config
 from ..utils.cost_tracker import CostTracker
 from ..utils.helpers import save_game_log
+from ..utils.prompt_budget import PromptAssembler
 
 # 加载环境变量
 load_dotenv()
@@ -32,7 +50,32 @@ class GameFlow:
         api_key: Optional[str] = None,
         base_url: Optional[str] = None,
         use_rag: bool = True,
-        use_memory: bool = True
+        use_memory: bool = True,
+        async_mode: bool = False,
+        response_cache: Optional[ResponseCache] = None,
+        llm_backend: str = "openai",
+        stub_options: Optional[Dict[str, Any]] = None,
+        seed: Optional[int] = None,
+        batch_decisions: bool = False,
+        streaming: bool = False,
+        compact_output: bool = False,
+        prompt_budget: Optional[Dict[str, Any]] = None,
+        client_pool: Optional[ClientPool] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        resilience: Optional[ResiliencePolicy] = None,
+        llm_config: Optional[Dict[str, Any]] = None,
+        game_id: Optional[str] = None,
+        checkpoint_path: Optional[str] = None,
+        checkpointer: Optional[BaseCheckpointSaver] = None,
+        keep_last: Optional[int] = None,
+        discussion_mode: str = "sequential",
+        rebuttal: bool = False,
+        pipelined_discussion: bool = False,
+        num_werewolves: int = 2,
+        digest_size: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+        team_configs: Optional[Dict[str, Dict[str, Any]]] = None,
+        cassette: Optional[Cassette] = None
     ):
         """
         初始化游戏流程
@@ -43,20 +86,158 @@ class GameFlow:
             base_url: API Base URL（用于 DeepSeek 等）
             use_rag: 是否使用 RAG
             use_memory: 是否使用记忆管理
+            async_mode: 是否使用异步节点（并发执行狼人行动和投票）
+            response_cache: LLM 响应缓存（可选，多局游戏共享同一实例可合并相同请求）
+            llm_backend: LLM / 嵌入后端（"openai" 或离线确定性的 "stub"）
+            stub_options: 传给 StubChatModel 的参数（如 latency、prompt_tokens）
+            seed: 随机种子（角色分配、平票处理和 stub 后端）
+            batch_decisions: 是否由主持人批量决策（每个角色分组一次请求完成夜晚行动和投票）
+            streaming: 是否流式调用 LLM（JSON 决策完整后立即终止生成）
+            compact_output: 是否要求短键名的紧凑 JSON 输出（减少 completion token）
+            prompt_budget: 提示词 token 预算配置（game_config.yaml 的 prompt_budget 段，
+                None 使用默认预算，enabled: false 关闭裁剪）
+            client_pool: LLM 客户端池（默认使用进程级客户端池，多局游戏共享连接）
+            rate_limiter: 共享限流器（可选，包裹所有 LLM 和嵌入调用；多局并发游戏应共享同一实例，
+                可用 RateLimiter.from_config 根据 rate_limit 配置段创建）
+            resilience: LLM 调用的超时 / 重试 / 对冲策略（可选，共享实例可跨局积累延迟分位数；
+                可用 ResiliencePolicy.from_config 根据 resilience 配置段创建）。
+                无论是否配置，调用最终失败的玩家都会使用兜底决策，不会中断整局游戏
+            llm_config: 模型配置（game_config.yaml 的 llm 段：模型、按阶段的路由和级联），
+                None 时读取 config/game_config.yaml
+            game_id: 对局 ID（写入每条成本记录，也是检查点的 thread_id，默认随机生成）
+            checkpoint_path: SQLite 检查点数据库路径（每个节点完成后保存游戏快照，
+                进程崩溃后可用 resume 续跑）；与 checkpointer 都为 None 时不保存检查点、不能续跑
+            checkpointer: 自定义 LangGraph 检查点存储（优先于 checkpoint_path；可传入 MemorySaver 只在进程内续跑）
+            keep_last: 使用 checkpoint_path 时每局只保留最近的多少个检查点（None 全部保留）
+            discussion_mode: 发言模式（"sequential" 按顺序发言；"simultaneous" 所有存活玩家基于同一份状态
+                同时发言，发言结束后一起公布，async_mode 下并发调用，耗时约为一次调用）
+            rebuttal: 同时发言公布后是否再进行一轮简短的反驳（仅 simultaneous 模式；所有玩家基于已公布的发言
+                同时反驳，整个发言环节耗时约为两次调用）
+            pipelined_discussion: 发言环节流水线执行（后续玩家的 RAG 检索与当前玩家的 LLM 调用重叠，
+                记忆写入在后台队列中按顺序执行；发言顺序和结果不变，各阶段占用率见 pipeline_stats）
+            num_werewolves: 狼人数量（至少 1 名，且少于村民数量）
+            digest_size: 大房间模式下每名玩家的提示词中最多包含的其他玩家数（只保留与其最相关的玩家及其发言，
+                见 GameState.get_agent_view）；None 表示完整视图
+            chunk_size: 异步节点中每批并发的调用数，批量决策时也是每个请求的最大玩家数；None 表示不分批
+            team_configs: 按阵营的 Agent 配置 {"werewolf" / "villager": 配置}（联赛中两个阵营使用不同配置），
+                配置项：personality（该阵营所有玩家的性格）、llm（覆盖 llm_config 的模型配置）、
+                use_rag、use_memory；未配置的阵营使用默认设置。批量决策仍使用默认模型
+            cassette: 对局录像（可选）。录制模式记录随机种子（未指定时随机生成）、角色分配、游戏设置
+                和每次 LLM / 嵌入调用的结果，游戏结束时写入文件；回放模式使用录像中的种子、角色和服务地址，
+                所有 LLM / 嵌入调用都由录像回答（不访问网络，不使用限流、容错策略和响应缓存），
+                其他设置需与录制时一致，可用 GameFlow(**cassette.game_options(), cassette=cassette) 创建
         """
+        if llm_backend not in ("openai", "stub"):
+            raise ValueError(f"Unsupported llm_backend: {llm_backend}")
+        if discussion_mode not in ("sequential", "simultaneous"):
+            raise ValueError(f"Unsupported discussion_mode: {discussion_mode}")
+        if digest_size is not None and digest_size < 1:
+            raise ValueError("digest_size must be at least 1")
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        self.team_configs = dict(team_configs or {})
+        for team, team_config in self.team_configs.items():
+            if team not in ("werewolf", "villager"):
+                raise ValueError(f"Unknown team in team_configs: {team}")
+            if team_config.get("personality"):
+                Personality(team_config["personality"])
+        
+        # 录像：回放时种子来自录像，录制时保证种子确定以便复现
+        self.cassette = cassette
+        if cassette is not None and cassette.replaying:
+            if list(players) != cassette.meta.get("players"):
+                raise ValueError("players do not match the cassette")
+            seed = cassette.meta["seed"]
+            response_cache = rate_limiter = resilience = None
+        elif cassette is not None and seed is None:
+            seed = random.SystemRandom().randrange(2 ** 32)
+        
         self.players = players
+        self.async_mode = async_mode
+        self.llm_backend = llm_backend
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.batch_decisions = batch_decisions
+        self.discussion_mode = discussion_mode
+        self.rebuttal = rebuttal and discussion_mode == "simultaneous"
+        self.discussion_pipeline = DiscussionPipeline() if pipelined_discussion else None
+        self.digest_size = digest_size
+        self.chunk_size = chunk_size
         self.api_key = api_key or os.getenv("DEEPSEEK_API_KEY") or os.getenv("OPENAI_API_KEY")
         self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        if cassette is not None and cassette.replaying:
+            # 服务地址是缓存键的一部分：回放只使用录制时实际生效的地址，不受本机环境变量影响
+            self.base_url = cassette.meta["options"].get("base_url")
+        
+        # 初始化成本追踪（每条记录带对局 ID 和轮次）
+        self.game_id = game_id or uuid.uuid4().hex[:12]
+        self.cost_tracker = CostTracker(game_id=self.game_id)
+        self.client_pool = client_pool or get_client_pool()
+        self.rate_limiter = rate_limiter
+        self.resilience = resilience
         
-        # 初始化成本追踪
-        self.cost_tracker = CostTracker()
+        # 提示词 token 预算（所有 Agent 和 RAG 引擎共享，复用 token 计数缓存）
+        self.prompt_assembler = PromptAssembler.from_config(prompt_budget)
+        
+        # 离线后端：每条模型路由一个确定性的规则模型，所有 Agent 共享
+        if llm_backend == "stub":
+            stub_options = dict(stub_options or {})
+            stub_options.setdefault("seed", seed or 0)
+            
+            def model_factory(route):
+                return StubChatModel(**{"model_name": f"stub-{route.name}", **stub_options})
+            
+            embeddings = HashEmbeddings(seed=seed or 0)
+        else:
+            model_factory = None
+            embeddings = None
+        
+        # 回放：真实模型换成只提供缓存键所需属性（模型名称、温度、输出上限、服务地址）的占位模型（离线的 stub 模型照常创建）；
+        # 录像作为响应缓存接入所有 Agent 的 LLM 调用器
+        if cassette is not None:
+            if cassette.replaying and model_factory is None:
+                def model_factory(route):
+                    return CassetteChatModel(
+                        model_name=route.model,
+                        temperature=route.temperature,
+                        max_tokens=route.max_tokens,
+                        openai_api_base=route.base_url or self.base_url
+                    )
+            if not cassette.replaying:
+                cassette.response_cache = response_cache
+            response_cache = cassette
+        
+        # 按阶段的模型路由（所有 Agent 共享模型实例）
+        if llm_config is None:
+            llm_config = load_config().get("llm")
+        router_options = {
+            "api_key": self.api_key,
+            "base_url": self.base_url,
+            "client_pool": self.client_pool,
+            "model_factory": model_factory,
+            "llm_options": {"max_retries": 0} if resilience else None
+        }
+        self.model_router = ModelRouter.from_config(llm_config, **router_options)
+        self.team_routers: Dict[str, ModelRouter] = {
+            team: ModelRouter.from_config({**(llm_config or {}), **team_config["llm"]}, **router_options)
+            for team, team_config in self.team_configs.items() if team_config.get("llm")
+        }
         
         # 初始化记忆管理
         if use_memory:
+            if cassette is not None:
+                embeddings = cassette.embeddings(None if cassette.replaying else embeddings or self.client_pool.get_embeddings(
+                    model="text-embedding-ada-002",
+                    api_key=self.api_key
+                ))
             vector_store = VectorStore(
                 store_type="faiss",
                 embedding_model="text-embedding-ada-002",
-                api_key=self.api_key
+                api_key=self.api_key,
+                embeddings=embeddings,
+                client_pool=self.client_pool,
+                rate_limiter=rate_limiter,
+                cost_tracker=self.cost_tracker
             )
             self.memory_manager = MemoryManager(vector_store)
         else:
@@ -64,54 +245,133 @@ class GameFlow:
         
         # 初始化 RAG 引擎
         if use_rag and self.memory_manager:
-            self.rag_engine = RAGEngine(self.memory_manager)
+            self.rag_engine = RAGEngine(self.memory_manager, self.prompt_assembler)
         else:
             self.rag_engine = None
         
         # 分配角色
-        self.roles = GameLogic.assign_roles(players, num_werewolves=2)
+        self.roles = GameLogic.assign_roles(players, num_werewolves=num_werewolves, rng=self.rng)
+        if cassette is not None and cassette.replaying:
+            self.roles = dict(cassette.meta["roles"])
+        elif cassette is not None:
+            cassette.meta.update({
+                "players": list(players),
+                "seed": seed,
+                "roles": dict(self.roles),
+                "options": {
+                    # 实际生效的默认服务地址（各路由单独配置的地址在 llm_config / team_configs 中）
+                    "base_url": self.base_url or os.getenv("OPENAI_API_BASE"),
+                    "llm_backend": llm_backend,
+                    "stub_options": stub_options,
+                    "use_rag": use_rag,
+                    "use_memory": use_memory,
+                    "async_mode": async_mode,
+                    "batch_decisions": batch_decisions,
+                    "streaming": streaming,
+                    "compact_output": compact_output,
+                    "prompt_budget": prompt_budget,
+                    "llm_config": llm_config,
+                    "discussion_mode": discussion_mode,
+                    "rebuttal": rebuttal,
+                    "pipelined_discussion": pipelined_discussion,
+                    "num_werewolves": num_werewolves,
+                    "digest_size": digest_size,
+                    "chunk_size": chunk_size,
+                    "team_configs": self.team_configs
+                }
+            })
         
         # 初始化游戏状态
         self.game_state = GameState(players, self.roles)
         
-        # 初始化主持人
-        self.moderator = ModeratorAgent()
+        # 每轮决策账本：每个 Agent 每个阶段只决策一次
+        self.decision_ledger = DecisionLedger()
         
         # 初始化玩家 Agent
+        self._agent_options = {
+            "api_key": self.api_key,
+            "base_url": self.base_url,
+            "cost_tracker": self.cost_tracker,
+            "response_cache": response_cache,
+            "streaming": streaming,
+            "compact_output": compact_output,
+            "prompt_assembler": self.prompt_assembler,
+            "client_pool": self.client_pool,
+            "rate_limiter": rate_limiter,
+            "resilience": resilience,
+            "model_router": self.model_router
+        }
         self.agents: Dict[str, PlayerAgent] = {}
+        self._create_agents()
+        
+        # 初始化主持人（批量决策模式下使用投票阶段的模型路由）
+        if batch_decisions:
+            moderator_route = self.model_router.route_for("voting")
+            self.moderator = ModeratorAgent(
+                llm=self.model_router.get_model(moderator_route),
+                route=moderator_route,
+                cost_tracker=self.cost_tracker,
+                response_cache=response_cache,
+                streaming=streaming,
+                rate_limiter=rate_limiter,
+                resilience=resilience,
+                event_log=self.game_state.events,
+                max_batch_size=chunk_size
+            )
+        else:
+            self.moderator = ModeratorAgent(event_log=self.game_state.events)
+        
+        # 构建 LangGraph（启用检查点时每个节点完成后保存游戏快照，thread_id 为对局 ID）
+        if checkpointer is None and checkpoint_path is not None:
+            checkpointer = create_checkpointer(checkpoint_path, keep_last=keep_last)
+        self.checkpointer = checkpointer
+        self.max_rounds = 10
+        self.graph = self._build_graph()
+    
+    def _create_agents(self):
+        """按当前角色分配创建玩家 Agent"""
         personality_map = {
             "werewolf": [Personality.AGGRESSIVE, Personality.CAUTIOUS],
             "villager": [Personality.ANALYTICAL, Personality.CAUTIOUS, Personality.OBSERVANT]
         }
         
-        for i, player in enumerate(players):
-            role = Role.WEREWOLF if self.roles[player] == "werewolf" else Role.VILLAGER
-            personalities = personality_map[self.roles[player]]
-            personality = personalities[i % len(personalities)]
+        self.agents = {}
+        for i, player in enumerate(self.players):
+            team = self.roles[player]
+            team_config = self.team_configs.get(team, {})
+            role = Role.WEREWOLF if team == "werewolf" else Role.VILLAGER
+            if team_config.get("personality"):
+                personality = Personality(team_config["personality"])
+            else:
+                personalities = personality_map[team]
+                personality = personalities[i % len(personalities)]
             
-            agent = PlayerAgent(
+            options = dict(self._agent_options)
+            if team in self.team_routers:
+                options["model_router"] = self.team_routers[team]
+            self.agents[player] = PlayerAgent(
                 name=player,
                 role=role,
                 personality=personality,
-                api_key=self.api_key,
-                base_url=self.base_url,
-                cost_tracker=self.cost_tracker
+                use_memory=team_config.get("use_memory", True),
+                **options
             )
-            self.agents[player] = agent
-        
-        # 构建 LangGraph
-        self.graph = self._build_graph()
     
     def _build_graph(self) -> StateGraph:
         """构建 LangGraph 状态图"""
         workflow = StateGraph(Dict)
         
-        # 添加节点
-        workflow.add_node("night_action", self._night_action_node)
-        workflow.add_node("day_announce", self._day_announce_node)
-        workflow.add_node("discussion", self._discussion_node)
-        workflow.add_node("voting", self._voting_node)
-        workflow.add_node("check_end", self._check_end_node)
+        # 添加节点（异步模式下使用并发版本的节点）
+        if self.async_mode:
+            workflow.add_node("night_action", self._checkpointed(self._anight_action_node))
+            workflow.add_node("discussion", self._checkpointed(self._adiscussion_node))
+            workflow.add_node("voting", self._checkpointed(self._avoting_node))
+        else:
+            workflow.add_node("night_action", self._checkpointed(self._night_action_node))
+            workflow.add_node("discussion", self._checkpointed(self._discussion_node))
+            workflow.add_node("voting", self._checkpointed(self._voting_node))
+        workflow.add_node("day_announce", self._checkpointed(self._day_announce_node))
+        workflow.add_node("check_end", self._checkpointed(self._check_end_node))
         
         # 设置入口
         workflow.set_entry_point("night_action")
@@ -132,35 +392,122 @@ class GameFlow:
             }
         )
         
-        return workflow.compile()
+        return workflow.compile(checkpointer=self.checkpointer)
     
-    def _night_action_node(self, state: Dict) -> Dict:
-        """夜晚行动节点"""
+    def _checkpointed(self, node: Callable) -> Callable:
+        """节点完成后把游戏快照写入图状态，随检查点一起保存（未启用检查点时原样返回节点）"""
+        if self.checkpointer is None:
+            return node
+        if asyncio.iscoroutinefunction(node):
+            async def run_node(state: Dict) -> Dict:
+                state = await node(state)
+                return {**state, "snapshot": self._snapshot()}
+        else:
+            def run_node(state: Dict) -> Dict:
+                state = node(state)
+                return {**state, "snapshot": self._snapshot()}
+        return run_node
+    
+    def _snapshot(self) -> Dict[str, Any]:
+        """导出续跑所需的全部游戏状态（游戏状态和主持人日志、决策账本、Agent 记忆和思考链、向量记忆、随机数状态、成本统计）"""
+        version, internal, gauss = self.rng.getstate()
+        return {
+            "game_state": self.game_state.snapshot(),
+            "decision_ledger": self.decision_ledger.snapshot(),
+            "agents": {name: agent.snapshot() for name, agent in self.agents.items()},
+            "memory": self.memory_manager.snapshot() if self.memory_manager else None,
+            "rng": [version, list(internal), gauss],
+            "cost_tracker": pickle.dumps(self.cost_tracker)
+        }
+    
+    def _restore(self, snapshot: Dict[str, Any]):
+        """从检查点中的快照恢复游戏状态（不调用 LLM 或嵌入模型）"""
+        self.game_state = GameState.from_snapshot(snapshot["game_state"])
+        self.players = list(self.game_state.players)
+        self.roles = dict(self.game_state.roles)
+        self.decision_ledger.restore(snapshot["decision_ledger"])
+        
+        self._create_agents()
+        for name, data in snapshot["agents"].items():
+            self.agents[name].restore(data)
+        if self.memory_manager and snapshot.get("memory"):
+            self.memory_manager.restore(snapshot["memory"])
+        self.moderator.event_log = self.game_state.events
+        
+        version, internal, gauss = snapshot["rng"]
+        self.rng.setstate((version, tuple(internal), gauss))
+        
+        # 合并崩溃前已付费调用的成本统计（Agent 持有的追踪器实例保持不变）
+        self.cost_tracker.reset()
+        self.cost_tracker.merge(pickle.loads(snapshot["cost_tracker"]))
+        self.cost_tracker.set_round(self.game_state.round)
+    
+    def _graph_config(self) -> Dict[str, Any]:
+        """图运行配置：对局 ID 作为 thread_id，递归上限按轮数限制计算"""
+        return {
+            "configurable": {"thread_id": self.game_id},
+            "recursion_limit": 5 * (self.max_rounds + 1)
+        }
+    
+    def _start_night(self) -> List[PlayerAgent]:
+        """开始夜晚阶段，返回存活的狼人 Agent"""
         self.game_state.start_new_round()
         self.game_state.set_phase("night_action")
+        self.cost_tracker.set_round(self.game_state.round)
         
         announcement = self.moderator.announce_night(self.game_state.round)
         print(f"\n{announcement}")
         
         # 获取狼人 Agent
-        werewolf_agents = [
+        return [
             agent for name, agent in self.agents.items()
             if self.roles[name] == "werewolf" and name in self.game_state.alive_players
         ]
+    
+    def _night_action_node(self, state: Dict) -> Dict:
+        """夜晚行动节点"""
+        werewolf_agents = self._start_night()
         
-        # 处理夜晚行动
-        killed = GameLogic.process_night_actions(werewolf_agents, self.game_state.get_state_dict())
+        # 每个狼人只决策一次
+        if self.batch_decisions and werewolf_agents:
+            actions = self.moderator.batch_decide(werewolf_agents, "night_action", self.game_state.get_state_dict())
+        else:
+            actions = [agent.night_action(self._agent_state(agent.name)) for agent in werewolf_agents]
         
-        if killed:
-            # 记录行动
-            for agent in werewolf_agents:
-                action = agent.night_action(self.game_state.get_state_dict())
-                self.game_state.record_night_action(agent.name, action)
-            
-            state["killed"] = killed
+        return self._resolve_night(state, werewolf_agents, actions)
+    
+    async def _anight_action_node(self, state: Dict) -> Dict:
+        """夜晚行动节点（异步）：所有狼人并发选择目标"""
+        werewolf_agents = self._start_night()
+        
+        if self.batch_decisions and werewolf_agents:
+            actions = await self.moderator.abatch_decide(
+                werewolf_agents, "night_action", self.game_state.get_state_dict()
+            )
         else:
-            state["killed"] = None
+            actions = await self._gather_chunked(
+                lambda agent: agent.anight_action(self._agent_state(agent.name)), werewolf_agents
+            )
         
+        return self._resolve_night(state, werewolf_agents, actions)
+    
+    def _resolve_night(
+        self,
+        state: Dict,
+        werewolf_agents: List[PlayerAgent],
+        actions: List[Dict]
+    ) -> Dict:
+        """将狼人决策写入账本并结算夜晚行动"""
+        round_num = self.game_state.round
+        
+        # 记录行动
+        for agent, action in zip(werewolf_agents, actions):
+            self.decision_ledger.record(round_num, "night_action", agent.name, action)
+            self.game_state.record_night_action(agent.name, action)
+        
+        state["killed"] = GameLogic.resolve_night_actions(
+            self.decision_ledger.get_decisions(round_num, "night_action")
+        )
         return state
     
     def _day_announce_node(self, state: Dict) -> Dict:
@@ -188,8 +535,8 @@ class GameFlow:
         
         return state
     
-    def _discussion_node(self, state: Dict) -> Dict:
-        """发言环节节点"""
+    def _start_discussion(self) -> List[str]:
+        """开始发言阶段，返回按顺序发言的玩家"""
         self.game_state.set_phase("discussion")
         
         announcement = self.moderator.announce_discussion(
@@ -198,48 +545,175 @@ class GameFlow:
         )
         print(f"\n{announcement}")
         
-        # 每个存活玩家发言
-        for player in self.game_state.alive_players:
-            if player not in self.agents:
-                continue
-            
-            agent = self.agents[player]
+        return [player for player in self.game_state.alive_players if player in self.agents]
+    
+    def _retrieve_rag_context(self, player: str) -> Optional[str]:
+        """使用 RAG 检索相关历史发言（该玩家阵营的配置关闭了 RAG 时不检索）"""
+        if not self.rag_engine or not self.team_configs.get(self.roles[player], {}).get("use_rag", True):
+            return None
+        
+        # 构建查询（基于当前游戏状态）
+        query = f"第{self.game_state.round}轮发言，分析局势，找出可疑玩家"
+        return self.rag_engine.retrieve_relevant_speeches(
+            query,
+            player,
+            self.game_state.round
+        )
+    
+    def _record_speech(self, player: str, speech_result: Dict):
+        """记录发言并写入记忆（流水线模式下记忆写入在后台队列中按顺序执行）"""
+        self.game_state.record_discussion(player, speech_result)
+        
+        print(f"\n[{player}] {speech_result.get('speech', '')}")
+        
+        # 记录到记忆
+        if self.memory_manager:
+            event = {
+                "type": "speech",
+                "player": player,
+                "round": self.game_state.round,
+                "phase": "discussion",
+                "content": speech_result.get("speech", "")
+            }
+            if self.discussion_pipeline:
+                self.discussion_pipeline.submit_write(self.memory_manager.add_episodic_memory, event)
+            else:
+                self.memory_manager.add_episodic_memory(event)
+    
+    def _pipeline_phase(self) -> ContextManager:
+        """流水线模式下统计发言环节耗时"""
+        return self.discussion_pipeline.phase() if self.discussion_pipeline else nullcontext()
+    
+    def _retrieve_rag_contexts(self, speakers: List[str]) -> List[Optional[str]]:
+        """检索所有发言玩家的 RAG 上下文（流水线模式下并行检索）"""
+        if self.discussion_pipeline:
+            return self.discussion_pipeline.retrieve_all(self._retrieve_rag_context, speakers)
+        return [self._retrieve_rag_context(player) for player in speakers]
+    
+    def _agent_state(self, player: str) -> Mapping[str, Any]:
+        """某名玩家看到的状态视图（大房间模式下只包含与其最相关的其他玩家摘要）"""
+        return self.game_state.get_agent_view(player, self.digest_size)
+    
+    async def _gather_chunked(self, call: Callable[[Any], Awaitable[Dict]], items: List[Any]) -> List[Dict]:
+        """
+        并发执行一批调用：每次最多 chunk_size 个，上一批全部完成后再开始下一批
+        
+        Args:
+            call: 为每一项创建协程的函数
+            items: 调用对象（玩家 Agent 或玩家名称）
             
-            # 使用 RAG 检索相关历史发言
-            rag_context = None
-            if self.rag_engine:
-                # 构建查询（基于当前游戏状态）
-                query = f"第{self.game_state.round}轮发言，分析局势，找出可疑玩家"
-                rag_context = self.rag_engine.retrieve_relevant_speeches(
-                    query,
-                    player,
-                    self.game_state.round
-                )
+        Returns:
+            与 items 顺序一致的结果
+        """
+        size = self.chunk_size or len(items) or 1
+        results = []
+        for start in range(0, len(items), size):
+            results.extend(await asyncio.gather(*(call(item) for item in items[start:start + size])))
+        return results
+    
+    def _rebuttal_state(self, player: str) -> Dict[str, Any]:
+        """反驳环节的状态：玩家的状态视图加上反驳标记（提示词中包含本轮发言记录）"""
+        return {**self._agent_state(player), "rebuttal": True}
+    
+    def _reveal_speeches(self, speakers: List[str], speech_results: List[Dict]):
+        """同时发言结束后按座位顺序一起公布"""
+        print(f"\n📢 所有玩家的发言同时公布：")
+        for player, speech_result in zip(speakers, speech_results):
+            self._record_speech(player, speech_result)
+    
+    def _discussion_node(self, state: Dict) -> Dict:
+        """发言环节节点"""
+        speakers = self._start_discussion()
+        
+        if self.discussion_mode == "simultaneous":
+            with self._pipeline_phase():
+                # 所有玩家基于同一版本的状态发言，全部完成后才公布
+                rag_contexts = self._retrieve_rag_contexts(speakers)
+                speech_results = [
+                    self.agents[player].discuss(self._agent_state(player), rag_context)
+                    for player, rag_context in zip(speakers, rag_contexts)
+                ]
+                self._reveal_speeches(speakers, speech_results)
+                
+                if self.rebuttal:
+                    self._reveal_speeches(speakers, [
+                        self.agents[player].discuss(self._rebuttal_state(player)) for player in speakers
+                    ])
+                if self.discussion_pipeline:
+                    self.discussion_pipeline.flush()
+            return state
+        
+        if self.discussion_pipeline:
+            # 后续玩家的检索与当前玩家的 LLM 调用重叠，发言仍按顺序进行
+            self.discussion_pipeline.run(
+                speakers,
+                self._retrieve_rag_context,
+                lambda player, rag_context: self.agents[player].discuss(self._agent_state(player), rag_context),
+                self._record_speech
+            )
+            return state
+        
+        # 每个存活玩家发言
+        for player in speakers:
+            rag_context = self._retrieve_rag_context(player)
             
             # 玩家发言
-            speech_result = agent.discuss(
-                self.game_state.get_state_dict(),
+            speech_result = self.agents[player].discuss(
+                self._agent_state(player),
                 rag_context
             )
+            self._record_speech(player, speech_result)
+        
+        return state
+    
+    async def _adiscussion_node(self, state: Dict) -> Dict:
+        """发言环节节点（异步）：顺序模式下仍按顺序发言但不阻塞事件循环，同时发言模式下所有玩家并发发言"""
+        speakers = self._start_discussion()
+        
+        if self.discussion_mode == "simultaneous":
+            with self._pipeline_phase():
+                if self.discussion_pipeline:
+                    rag_contexts = await self.discussion_pipeline.aretrieve_all(self._retrieve_rag_context, speakers)
+                else:
+                    rag_contexts = self._retrieve_rag_contexts(speakers)
+                rag_by_player = dict(zip(speakers, rag_contexts))
+                speech_results = await self._gather_chunked(
+                    lambda player: self.agents[player].adiscuss(self._agent_state(player), rag_by_player[player]),
+                    speakers
+                )
+                self._reveal_speeches(speakers, speech_results)
+                
+                if self.rebuttal:
+                    speech_results = await self._gather_chunked(
+                        lambda player: self.agents[player].adiscuss(self._rebuttal_state(player)), speakers
+                    )
+                    self._reveal_speeches(speakers, speech_results)
+                if self.discussion_pipeline:
+                    await self.discussion_pipeline.aflush()
+            return state
+        
+        if self.discussion_pipeline:
+            await self.discussion_pipeline.arun(
+                speakers,
+                self._retrieve_rag_context,
+                lambda player, rag_context: self.agents[player].adiscuss(self._agent_state(player), rag_context),
+                self._record_speech
+            )
+            return state
+        
+        for player in speakers:
+            rag_context = self._retrieve_rag_context(player)
             
-            self.game_state.record_discussion(player, speech_result)
-            
-            print(f"\n[{player}] {speech_result.get('speech', '')}")
-            
-            # 记录到记忆
-            if self.memory_manager:
-                self.memory_manager.add_episodic_memory({
-                    "type": "speech",
-                    "player": player,
-                    "round": self.game_state.round,
-                    "phase": "discussion",
-                    "content": speech_result.get("speech", "")
-                })
+            speech_result = await self.agents[player].adiscuss(
+                self._agent_state(player),
+                rag_context
+            )
+            self._record_speech(player, speech_result)
         
         return state
     
-    def _voting_node(self, state: Dict) -> Dict:
-        """投票环节节点"""
+    def _start_voting(self) -> List[str]:
+        """开始投票阶段，返回参与投票的玩家"""
         self.game_state.set_phase("voting")
         
         announcement = self.moderator.announce_voting(
@@ -248,27 +722,65 @@ class GameFlow:
         )
         print(f"\n{announcement}")
         
-        # 收集投票
-        votes = {}
-        for player in self.game_state.alive_players:
-            if player not in self.agents:
-                continue
+        return [player for player in self.game_state.alive_players if player in self.agents]
+    
+    def _resolve_voting(self, state: Dict, voters: List[str], vote_results: List[Dict]) -> Dict:
+        """将投票写入账本并结算投票环节"""
+        round_num = self.game_state.round
+        
+        for player, vote_result in zip(voters, vote_results):
+            self.decision_ledger.record(round_num, "voting", player, vote_result)
             
-            agent = self.agents[player]
-            vote_result = agent.vote(self.game_state.get_state_dict())
             vote_target = vote_result.get("vote")
-            
             if vote_target:
-                votes[player] = vote_target
                 print(f"[{player}] 投票给: {vote_target}")
         
         # 处理投票
+        votes = self.decision_ledger.get_targets(round_num, "voting", "vote")
         self.game_state.record_voting(votes)
-        executed, vote_counts = GameLogic.process_voting(
-            self.agents,
-            self.game_state.get_state_dict()
+        executed, vote_counts = GameLogic.resolve_voting(
+            votes,
+            self.game_state.alive_players,
+            rng=self.rng
         )
         
+        return self._apply_voting_result(state, executed, vote_counts)
+    
+    def _voting_node(self, state: Dict) -> Dict:
+        """投票环节节点"""
+        voters = self._start_voting()
+        
+        # 收集投票（每个玩家只投一次）
+        if self.batch_decisions and voters:
+            vote_results = self.moderator.batch_decide(
+                [self.agents[player] for player in voters], "voting", self.game_state.get_state_dict()
+            )
+        else:
+            vote_results = [self.agents[player].vote(self._agent_state(player)) for player in voters]
+        
+        return self._resolve_voting(state, voters, vote_results)
+    
+    async def _avoting_node(self, state: Dict) -> Dict:
+        """投票环节节点（异步）：所有存活玩家并发投票"""
+        voters = self._start_voting()
+        
+        if self.batch_decisions and voters:
+            vote_results = await self.moderator.abatch_decide(
+                [self.agents[player] for player in voters], "voting", self.game_state.get_state_dict()
+            )
+        else:
+            vote_results = await self._gather_chunked(
+                lambda player: self.agents[player].avote(self._agent_state(player)), voters
+            )
+        return self._resolve_voting(state, voters, vote_results)
+    
+    def _apply_voting_result(
+        self,
+        state: Dict,
+        executed: Optional[str],
+        vote_counts: Dict[str, int]
+    ) -> Dict:
+        """处决得票最多的玩家并写入记忆"""
         if executed:
             self.game_state.record_execution(executed)
             announcement = self.moderator.announce_voting_result(vote_counts, executed)
@@ -289,9 +801,7 @@ class GameFlow:
     
     def _check_end_node(self, state: Dict) -> Dict:
         """检查游戏结束节点"""
-        is_end, winner, reason = GameLogic.check_win_condition(
-            self.game_state.get_state_dict()
-        )
+        is_end, winner, reason = self.game_state.check_win()
         
         state["is_end"] = is_end
         state["winner"] = winner
@@ -300,12 +810,16 @@ class GameFlow:
         if is_end:
             announcement = self.moderator.announce_game_end(winner, reason)
             print(f"\n{announcement}")
+        elif self.game_state.round >= self.max_rounds:
+            state["round_limit"] = True
+            state["reason"] = f"达到最大轮数 {self.max_rounds}，游戏未分胜负"
+            print(f"\n{state['reason']}")
         
         return state
     
     def _should_continue(self, state: Dict) -> str:
-        """判断是否继续游戏"""
-        if state.get("is_end", False):
+        """判断是否继续游戏（分出胜负或达到最大轮数时结束）"""
+        if state.get("is_end", False) or state.get("round_limit", False):
             return "end"
         return "continue"
     
@@ -313,36 +827,139 @@ class GameFlow:
         """
         运行游戏
         
+        按节点逐步驱动状态图，每个节点完成后保存检查点；
+        出错时保留最后完成的节点，可用 resume(game_id) 续跑，结果中的 error 为异常信息
+        （正常结束时为 None；round_limit 表示达到最大轮数、未分胜负）
+        
         Args:
-            max_rounds: 最大轮数
+            max_rounds: 最大轮数（达到后游戏结束，不分胜负）
             save_log: 是否保存日志
             
         Returns:
             游戏结果
         """
+        if self.async_mode:
+            return asyncio.run(self.arun(max_rounds=max_rounds, save_log=save_log))
+        
+        self._print_game_start()
+        self.max_rounds = max_rounds
+        return self._run_graph({"max_rounds": max_rounds}, save_log)
+    
+    async def arun(self, max_rounds: int = 10, save_log: bool = True) -> Dict:
+        """
+        异步运行游戏（需要 async_mode=True）
+        
+        Args:
+            max_rounds: 最大轮数（达到后游戏结束，不分胜负）
+            save_log: 是否保存日志
+            
+        Returns:
+            游戏结果
+        """
+        self._print_game_start()
+        self.max_rounds = max_rounds
+        try:
+            return await self._arun_graph({"max_rounds": max_rounds}, save_log)
+        finally:
+            # 异步连接池绑定在当前事件循环上，run 每局新建一个循环，结束前关闭
+            await self.client_pool.aclose_loop()
+    
+    def resume(self, game_id: str, max_rounds: Optional[int] = None, save_log: bool = True) -> Dict:
+        """
+        从检查点续跑一局游戏
+        
+        恢复最后完成的节点之后的游戏状态、Agent 记忆和思考链，从下一个节点继续，
+        已完成节点中的 LLM 和嵌入调用不会重新发起。
+        需要使用与原对局相同的检查点存储（同一个 checkpoint_path）创建 GameFlow。
+        
+        Args:
+            game_id: 要续跑的对局 ID
+            max_rounds: 最大轮数（None 沿用原对局的设置）
+            save_log: 是否保存日志
+            
+        Returns:
+            游戏结果
+            
+        Raises:
+            ValueError: 未启用检查点，或检查点中没有该对局
+        """
+        if self.async_mode:
+            return asyncio.run(self.aresume(game_id, max_rounds=max_rounds, save_log=save_log))
+        
+        state, finished = self._load_checkpoint(game_id, max_rounds)
+        if finished:
+            return self._finish_game(state, self.game_state.round, save_log)
+        return self._run_graph(None, save_log, state)
+    
+    async def aresume(self, game_id: str, max_rounds: Optional[int] = None, save_log: bool = True) -> Dict:
+        """resume 的异步版本（需要 async_mode=True）"""
+        state, finished = self._load_checkpoint(game_id, max_rounds)
+        if finished:
+            return self._finish_game(state, self.game_state.round, save_log)
+        try:
+            return await self._arun_graph(None, save_log, state)
+        finally:
+            await self.client_pool.aclose_loop()
+    
+    def _load_checkpoint(self, game_id: str, max_rounds: Optional[int]) -> Tuple[Dict, bool]:
+        """读取对局的最新检查点并恢复游戏状态，返回 (图状态, 是否已结束)"""
+        if self.checkpointer is None:
+            raise ValueError("Checkpointing is disabled; pass checkpoint_path or checkpointer to resume games")
+        self.game_id = game_id
+        self.cost_tracker.game_id = game_id
+        checkpoint = self.graph.get_state(self._graph_config())
+        state = checkpoint.values
+        if not state or "snapshot" not in state:
+            raise ValueError(f"No checkpoint found for game {game_id}")
+        
+        self._restore(state["snapshot"])
+        self.max_rounds = max_rounds or state.get("max_rounds", self.max_rounds)
+        print(f"从检查点续跑对局 {game_id}：第 {self.game_state.round} 轮，下一节点 {list(checkpoint.next) or '无'}")
+        return state, not checkpoint.next
+    
+    def _run_graph(self, graph_input: Optional[Dict], save_log: bool, state: Optional[Dict] = None) -> Dict:
+        """逐节点驱动状态图直到结束（graph_input 为 None 时从检查点继续）"""
+        state = state or graph_input or {}
+        error = None
+        try:
+            for state in self.graph.stream(graph_input, self._graph_config(), stream_mode="values"):
+                pass
+        except Exception as e:
+            error = self._report_error(e)
+        
+        return self._finish_game(state, self.game_state.round, save_log, error)
+    
+    async def _arun_graph(self, graph_input: Optional[Dict], save_log: bool, state: Optional[Dict] = None) -> Dict:
+        """_run_graph 的异步版本"""
+        state = state or graph_input or {}
+        error = None
+        try:
+            async for state in self.graph.astream(graph_input, self._graph_config(), stream_mode="values"):
+                pass
+        except Exception as e:
+            error = self._report_error(e)
+        
+        return self._finish_game(state, self.game_state.round, save_log, error)
+    
+    def _report_error(self, error: Exception) -> str:
+        """打印对局中断的异常，返回写入结果的错误信息"""
+        hint = f"（可用 resume(\"{self.game_id}\") 从最后完成的节点续跑）" if self.checkpointer is not None else ""
+        print(f"\n游戏运行出错: {error}{hint}")
+        import traceback
+        traceback.print_exc()
+        return f"{type(error).__name__}: {error}"
+    
+    def _print_game_start(self):
+        """打印开局信息"""
         print("=" * 50)
         print("游戏开始！")
         print("=" * 50)
         print(f"\n玩家列表: {', '.join(self.players)}")
         print(f"角色分配: {self.roles}")
         print("\n" + "=" * 50 + "\n")
-        
-        # 运行游戏
-        state = {}
-        round_count = 0
-        
-        try:
-            while round_count < max_rounds:
-                state = self.graph.invoke(state)
-                round_count += 1
-                
-                if state.get("is_end", False):
-                    break
-        except Exception as e:
-            print(f"\n游戏运行出错: {e}")
-            import traceback
-            traceback.print_exc()
-        
+    
+    def _finish_game(self, state: Dict, round_count: int, save_log: bool, error: Optional[str] = None) -> Dict:
+        """汇总游戏结果并保存日志（error 为中断对局的异常信息）"""
         # 获取结果
         winner = state.get("winner", "未知")
         reason = state.get("reason", "")
@@ -360,17 +977,41 @@ class GameFlow:
                 output_dir="./logs"
             )
         
+        player_thoughts = {
+            name: agent.get_thoughts()
+            for name, agent in self.agents.items()
+        }
+        cassette_stats = None
+        if self.cassette is not None:
+            cassette_stats = self._finish_cassette(player_thoughts)
+        
         return {
+            "game_id": self.game_id,
             "winner": winner,
             "reason": reason,
             "rounds": round_count,
+            "round_limit": bool(state.get("round_limit", False)),
+            "error": error,
             "game_history": self.game_state.get_full_history(),
             "cost_summary": self.cost_tracker.get_summary(),
-            "player_thoughts": {
-                name: agent.get_thoughts()
-                for name, agent in self.agents.items()
-            }
+            "connection_stats": self.client_pool.get_stats(),
+            "rate_limit_stats": self.rate_limiter.get_stats() if self.rate_limiter else None,
+            "resilience_stats": self.resilience.get_stats() if self.resilience else None,
+            "pipeline_stats": self.discussion_pipeline.get_stats() if self.discussion_pipeline else None,
+            "cassette_stats": cassette_stats,
+            "player_thoughts": player_thoughts
         }
+    
+    def _finish_cassette(self, player_thoughts: Dict[str, List[Dict]]) -> Dict[str, Any]:
+        """录制时保存录像；回放时检查游戏历史和思考链是否与录制时逐字节一致"""
+        digest = Cassette.transcript_digest(self.game_state.get_full_history(), player_thoughts)
+        if self.cassette.replaying:
+            return {**self.cassette.get_stats(), "transcript_match": digest == self.cassette.meta.get("transcript_digest")}
+        
+        self.cassette.meta.update({"max_rounds": self.max_rounds, "transcript_digest": digest})
+        self.cassette.save()
+        print(f"对局录像已保存到: {self.cassette.path}")
+        return self.cassette.get_stats()
 
 
 if __name__ == "__main__":
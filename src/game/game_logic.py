@@ -5,27 +5,41 @@
 
 from typing import Dict, List, Optional
 import random
-from ..agents.player_agent import PlayerAgent
-from ..agents.role_templates import Role
+
+from .compact_core import WEREWOLF, VILLAGER, WIN_RESULTS, check_win
 
 
 class GameLogic:
     """游戏核心逻辑"""
     
     @staticmethod
-    def assign_roles(players: List[str], num_werewolves: int = 2) -> Dict[str, str]:
+    def assign_roles(
+        players: List[str],
+        num_werewolves: int = 2,
+        rng: Optional[random.Random] = None
+    ) -> Dict[str, str]:
         """
         随机分配角色
         
         Args:
             players: 玩家列表
             num_werewolves: 狼人数量
+            rng: 随机数生成器（可选，用于可复现的角色分配）
             
         Returns:
             角色分配字典 {player: role}
+            
+        Raises:
+            ValueError: 狼人数量不少于村民数量（开局即分胜负）或少于 1
         """
+        if not 0 < num_werewolves < len(players) - num_werewolves:
+            raise ValueError(
+                f"num_werewolves must be at least 1 and fewer than the villagers, "
+                f"got {num_werewolves} of {len(players)} players"
+            )
+        rng = rng or random
         roles = {}
-        werewolves = random.sample(players, num_werewolves)
+        werewolves = rng.sample(players, num_werewolves)
         
         for player in players:
             if player in werewolves:
@@ -36,30 +50,21 @@ class GameLogic:
         return roles
     
     @staticmethod
-    def process_night_actions(
-        werewolf_agents: List[PlayerAgent],
-        game_state: Dict
-    ) -> Optional[str]:
+    def resolve_night_actions(night_decisions: Dict[str, Dict]) -> Optional[str]:
         """
-        处理夜晚行动
+        根据已收集的狼人决策结算夜晚行动
         
         Args:
-            werewolf_agents: 狼人 Agent 列表
-            game_state: 游戏状态
+            night_decisions: 狼人的夜晚决策 {player: action}
             
         Returns:
             被杀死的玩家名称，如果无则返回 None
         """
-        if not werewolf_agents:
-            return None
-        
         # 收集所有狼人的目标
-        targets = []
-        for agent in werewolf_agents:
-            action = agent.night_action(game_state)
-            target = action.get("target")
-            if target:
-                targets.append(target)
+        targets = [
+            action.get("target") for action in night_decisions.values()
+            if action.get("target")
+        ]
         
         # 如果所有狼人选择同一目标，则杀死该玩家
         if targets:
@@ -76,36 +81,28 @@ class GameLogic:
         return None
     
     @staticmethod
-    def process_voting(
-        agents: Dict[str, PlayerAgent],
-        game_state: Dict
+    def resolve_voting(
+        votes: Dict[str, str],
+        alive_players: List[str],
+        rng: Optional[random.Random] = None
     ) -> tuple[Optional[str], Dict[str, int]]:
         """
-        处理投票环节
+        根据已收集的投票结算投票环节
         
         Args:
-            agents: Agent 字典 {player_name: agent}
-            game_state: 游戏状态
+            votes: 投票记录 {voter: target}
+            alive_players: 存活玩家列表
+            rng: 随机数生成器（可选，用于可复现的平票处理）
             
         Returns:
             (被处决的玩家, 投票统计)
         """
-        alive_players = game_state.get("alive_players", [])
-        votes = {}
-        
-        # 收集所有玩家的投票
-        for player in alive_players:
-            if player in agents:
-                agent = agents[player]
-                vote_result = agent.vote(game_state)
-                vote_target = vote_result.get("vote")
-                if vote_target and vote_target in alive_players:
-                    votes[player] = vote_target
-        
-        # 统计投票
+        # 统计投票（只计入存活玩家之间的有效票）
+        alive = set(alive_players)
         vote_counts: Dict[str, int] = {}
         for voter, target in votes.items():
-            vote_counts[target] = vote_counts.get(target, 0) + 1
+            if voter in alive and target in alive:
+                vote_counts[target] = vote_counts.get(target, 0) + 1
         
         if not vote_counts:
             return None, {}
@@ -116,7 +113,7 @@ class GameLogic:
         
         # 如果平票，随机选择（或根据规则处理）
         if len(candidates) > 1:
-            executed = random.choice(candidates)
+            executed = (rng or random).choice(candidates)
         else:
             executed = candidates[0]
         
@@ -136,26 +133,15 @@ class GameLogic:
         alive_players = game_state.get("alive_players", [])
         player_roles = game_state.get("player_roles", {})
         
-        # 统计存活角色
-        alive_werewolves = sum(
-            1 for p in alive_players
-            if player_roles.get(p) == "werewolf"
-        )
-        alive_villagers = sum(
-            1 for p in alive_players
-            if player_roles.get(p) == "villager"
-        )
-        
-        # 检查胜利条件
-        if alive_werewolves == 0:
-            return True, "村民", "所有狼人已被处决"
-        elif alive_werewolves >= alive_villagers:
-            return True, "狼人", "狼人数量大于等于村民数量"
-        elif len(alive_players) <= 2:
-            if alive_werewolves > 0:
-                return True, "狼人", "存活玩家过少，狼人获胜"
-            else:
-                return True, "村民", "存活玩家过少，但无狼人，村民获胜"
-        
-        return False, "", ""
+        # 统计存活角色（一次遍历）
+        alive_werewolves = 0
+        alive_villagers = 0
+        for p in alive_players:
+            role = player_roles.get(p)
+            if role == WEREWOLF:
+                alive_werewolves += 1
+            elif role == VILLAGER:
+                alive_villagers += 1
+        
+        return WIN_RESULTS[check_win(alive_werewolves, alive_villagers, len(alive_players))]
 
@@ -2,8 +2,67 @@
 游戏状态管理
 """
 
-from typing import Dict, List, Optional, Any
-from copy import deepcopy
+from types import MappingProxyType
+from typing import Dict, List, Optional, Any, Mapping, Tuple
+
+from .compact_core import CompactGame, WEREWOLF, WIN_RESULTS
+from .event_log import Event, EventLog, EventView
+
+
+# 游戏事件类型（即阶段名），同时作为事件日志中的 token
+NIGHT_ACTION = "night_action"
+DAY_ANNOUNCE = "day_announce"
+DISCUSSION = "discussion"
+VOTING = "voting"
+EXECUTION = "execution"
+GAME_EVENTS = (NIGHT_ACTION, DAY_ANNOUNCE, DISCUSSION, VOTING, EXECUTION)
+
+
+def _count_votes(votes: Dict[str, Optional[str]]) -> Dict[str, int]:
+    """统计投票"""
+    vote_counts: Dict[str, int] = {}
+    for voter, target in votes.items():
+        if target:
+            vote_counts[target] = vote_counts.get(target, 0) + 1
+    return vote_counts
+
+
+def _decode_votes(log: EventLog, data) -> Dict[str, Optional[str]]:
+    return {log.token(voter): log.token(target) for voter, target in data}
+
+
+def _night_action_entry(log: EventLog, event: Event) -> Dict:
+    return {"round": event[1], "player": log.token(event[2]), "action": event[3]}
+
+
+def _discussion_entry(log: EventLog, event: Event) -> Dict:
+    return {"round": event[1], "player": log.token(event[2]), "speech": event[3]}
+
+
+def _voting_entry(log: EventLog, event: Event) -> Dict:
+    votes = _decode_votes(log, event[3])
+    return {"round": event[1], "votes": votes, "vote_counts": _count_votes(votes)}
+
+
+def _executed_player(log: EventLog, event: Event) -> str:
+    return log.token(event[2])
+
+
+def _history_entry(log: EventLog, event: Event) -> Dict:
+    """完整历史中的条目（与可视化 / 日志文件的格式一致）"""
+    kind = log.token(event[0])
+    entry: Dict[str, Any] = {"round": event[1], "phase": kind}
+    if kind == DAY_ANNOUNCE:
+        entry["deaths"] = [log.token(player) for player in event[3]]
+    elif kind == VOTING:
+        entry["votes"] = _decode_votes(log, event[3])
+        entry["vote_counts"] = _count_votes(entry["votes"])
+    elif kind == EXECUTION:
+        entry["executed"] = log.token(event[2])
+    else:
+        entry["player"] = log.token(event[2])
+        entry["data"] = event[3]
+    return entry
 
 
 class GameState:
@@ -19,122 +78,279 @@ class GameState:
         """
         self.players = players
         self.roles = roles
-        self.alive_players = players.copy()
+        # 存活状态和胜负判断由位掩码核心维护
+        self.core = CompactGame.from_roles(players, roles)
+        self._alive_cache: Tuple[int, Tuple[str, ...]] = (-1, ())
         self.round = 0
         self.phase = "night_action"
         
-        # 游戏历史
-        self.night_actions: List[Dict] = []  # 夜晚行动记录
-        self.last_night_deaths: List[str] = []  # 昨晚死亡玩家
-        self.discussion_logs: List[Dict] = []  # 发言记录
-        self.voting_logs: List[Dict] = []  # 投票记录
-        self.execution_history: List[str] = []  # 被处决的玩家
+        self.last_night_deaths: Tuple[str, ...] = ()  # 昨晚死亡玩家
         
-        # 完整游戏历史（用于可视化）
-        self.full_history: List[Dict] = []
+        # 游戏历史的唯一数据源（只追加，copy 时结构共享）；
+        # 按阶段的记录和完整历史都是从中解码的视图，主持人日志也写入同一日志
+        self.events = EventLog(players)
+        
+        # 每次状态变更递增；同一版本的状态视图只构建一次
+        self.version = 0
+        self._view: Tuple[int, Optional[Mapping[str, Any]]] = (-1, None)
+        self._agent_views: Tuple[int, Dict[str, Mapping[str, Any]]] = (-1, {})
+        self._roles_view: Mapping[str, str] = MappingProxyType(roles)
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        # 只读视图（mappingproxy）不能序列化，恢复时重新构建
+        state = self.__dict__.copy()
+        del state["_view"], state["_agent_views"], state["_roles_view"]
+        return state
+    
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._view = (-1, None)
+        self._agent_views = (-1, {})
+        self._roles_view = MappingProxyType(self.roles)
+    
+    @property
+    def night_actions(self) -> EventView:
+        """夜晚行动记录"""
+        return self.events.view(NIGHT_ACTION, (NIGHT_ACTION,), _night_action_entry)
+    
+    @property
+    def discussion_logs(self) -> EventView:
+        """发言记录"""
+        return self.events.view(DISCUSSION, (DISCUSSION,), _discussion_entry)
+    
+    @property
+    def voting_logs(self) -> EventView:
+        """投票记录"""
+        return self.events.view(VOTING, (VOTING,), _voting_entry)
+    
+    @property
+    def execution_history(self) -> EventView:
+        """被处决的玩家"""
+        return self.events.view(EXECUTION, (EXECUTION,), _executed_player)
+    
+    @property
+    def full_history(self) -> EventView:
+        """完整游戏历史（用于可视化）"""
+        return self.events.view("full_history", GAME_EVENTS, _history_entry)
+    
+    @property
+    def alive_players(self) -> Tuple[str, ...]:
+        """按座位顺序的存活玩家（存活集合变化时才重新生成）"""
+        mask, names = self._alive_cache
+        if mask != self.core.alive_mask:
+            names = tuple(self.core.alive_names())
+            self._alive_cache = (self.core.alive_mask, names)
+        return names
+    
+    @alive_players.setter
+    def alive_players(self, players: List[str]):
+        self.core.set_alive(self.core.index[player] for player in players)
+        self.version += 1
+    
+    def check_win(self) -> Tuple[bool, str, str]:
+        """检查胜利条件（O(1)），返回 (游戏是否结束, 获胜方, 原因)"""
+        return WIN_RESULTS[self.core.check_win()]
     
     def start_new_round(self):
         """开始新的一轮"""
         self.round += 1
         self.phase = "night_action"
-        self.last_night_deaths = []
+        self.last_night_deaths = ()
+        self.version += 1
     
     def set_phase(self, phase: str):
         """设置当前阶段"""
         self.phase = phase
+        self.version += 1
     
     def record_night_action(self, player: str, action: Dict):
         """记录夜晚行动"""
-        self.night_actions.append({
-            "round": self.round,
-            "player": player,
-            "action": action
-        })
-        self.full_history.append({
-            "round": self.round,
-            "phase": "night_action",
-            "player": player,
-            "data": action
-        })
+        self.events.append(NIGHT_ACTION, self.round, player, action)
+        self.version += 1
     
     def record_deaths(self, deaths: List[str]):
         """记录死亡玩家"""
-        self.last_night_deaths = deaths
+        self.last_night_deaths = tuple(deaths)
         for death in deaths:
-            if death in self.alive_players:
-                self.alive_players.remove(death)
+            self.core.kill(self.core.index[death])
         
-        self.full_history.append({
-            "round": self.round,
-            "phase": "day_announce",
-            "deaths": deaths
-        })
+        self.events.append(DAY_ANNOUNCE, self.round, None, tuple(self.events.intern(death) for death in deaths))
+        self.version += 1
     
     def record_discussion(self, player: str, speech: Dict):
         """记录发言"""
-        self.discussion_logs.append({
-            "round": self.round,
-            "player": player,
-            "speech": speech
-        })
-        self.full_history.append({
-            "round": self.round,
-            "phase": "discussion",
-            "player": player,
-            "data": speech
-        })
+        self.events.append(DISCUSSION, self.round, player, speech)
+        self.version += 1
     
     def record_voting(self, votes: Dict[str, str]):
         """记录投票"""
-        # 统计投票
-        vote_counts: Dict[str, int] = {}
-        for voter, target in votes.items():
-            if target:
-                vote_counts[target] = vote_counts.get(target, 0) + 1
-        
-        self.voting_logs.append({
-            "round": self.round,
-            "votes": votes,
-            "vote_counts": vote_counts
-        })
-        self.full_history.append({
-            "round": self.round,
-            "phase": "voting",
-            "votes": votes,
-            "vote_counts": vote_counts
-        })
+        # 只保存 (投票者, 目标) token 对，统计结果在解码时重新计算
+        self.events.append(VOTING, self.round, None, tuple(
+            (self.events.intern(voter), self.events.intern(target or None))
+            for voter, target in votes.items()
+        ))
+        self.version += 1
         
-        return vote_counts
+        return _count_votes(votes)
     
     def record_execution(self, executed: str):
         """记录处决"""
-        if executed in self.alive_players:
-            self.alive_players.remove(executed)
-        self.execution_history.append(executed)
+        self.core.kill(self.core.index[executed])
+        self.events.append(EXECUTION, self.round, executed)
+        self.version += 1
+    
+    def latest_discussion_logs(self) -> Tuple[Dict, ...]:
+        """最近一个发言环节的全部发言（按轮次选取，同时发言模式下包含开场发言和反驳两轮）"""
+        logs = self.discussion_logs
+        start = len(logs)
+        if not start:
+            return ()
+        latest_round = logs[-1]["round"]
+        while start > 0 and logs[start - 1]["round"] == latest_round:
+            start -= 1
+        return logs[start:]
+    
+    def get_state_dict(self) -> Mapping[str, Any]:
+        """
+        获取状态视图（用于传递给 Agent）
         
-        self.full_history.append({
-            "round": self.round,
-            "phase": "execution",
-            "executed": executed
-        })
+        返回只读映射，同一版本内只构建一次并由所有 Agent 共享；
+        其中的列表字段为元组或冻结日志，之后的状态变更对其不可见
+        """
+        version, view = self._view
+        if version != self.version or view is None:
+            alive_players = self.alive_players
+            view = MappingProxyType({
+                "round": self.round,
+                "phase": self.phase,
+                "alive_players": alive_players,
+                "player_roles": self._roles_view,
+                "last_night_deaths": self.last_night_deaths,
+                "discussion_logs": self.latest_discussion_logs(),
+                "execution_history": tuple(self.execution_history)
+            })
+            self._view = (self.version, view)
+        return view
+    
+    def get_agent_view(self, player: str, digest_size: Optional[int] = None) -> Mapping[str, Any]:
+        """
+        获取某名玩家看到的状态视图（大房间模式）
+        
+        其他存活玩家不超过 digest_size（或 digest_size 为 None）时就是 get_state_dict 的共享视图；
+        否则只保留与该玩家最相关的 digest_size 名玩家（digest_players）及他们的发言，
+        提示词长度不再随玩家人数增长。alive_players 仍为完整列表，用于校验决策目标
+        
+        Args:
+            player: 玩家名称
+            digest_size: 摘要中其他玩家的数量上限
+            
+        Returns:
+            只读映射（同一版本内每名玩家只构建一次）
+        """
+        view = self.get_state_dict()
+        alive_players = view["alive_players"]
+        if digest_size is None or len(alive_players) - (player in alive_players) <= digest_size:
+            return view
+        
+        version, views = self._agent_views
+        if version != self.version:
+            views = {}
+            self._agent_views = (self.version, views)
+        agent_view = views.get(player)
+        if agent_view is None:
+            digest = self.select_digest(player, digest_size)
+            visible = set(digest)
+            visible.add(player)
+            agent_view = MappingProxyType({
+                **view,
+                "digest_players": digest,
+                "discussion_logs": tuple(log for log in view["discussion_logs"] if log["player"] in visible)
+            })
+            views[player] = agent_view
+        return agent_view
+    
+    def select_digest(self, player: str, size: int) -> Tuple[str, ...]:
+        """
+        选出与某名玩家最相关的其他存活玩家
+        
+        相关度依次为：最近发言中怀疑该玩家、上一轮投票投给该玩家的玩家；该玩家自己怀疑或投票的对象；
+        最近被怀疑和得票最多的玩家。同分时座位离得近的优先。夜晚狼人只从村民中选择（只需要在村民中选目标）
+        
+        Args:
+            player: 玩家名称
+            size: 数量上限
+            
+        Returns:
+            按座位顺序排列的玩家名称
+        """
+        alive_players = self.alive_players
+        night_werewolf = self.phase == NIGHT_ACTION and self.roles.get(player) == WEREWOLF
+        scores = {
+            other: 0 for other in alive_players
+            if other != player and not (night_werewolf and self.roles.get(other) == WEREWOLF)
+        }
+        
+        def score(actor: Optional[str], target: Optional[str]):
+            if target in scores:
+                scores[target] += 3 if actor == player else 1
+            if target == player and actor in scores:
+                scores[actor] += 4
+        
+        for log in self.get_state_dict()["discussion_logs"]:
+            speech = log.get("speech")
+            if isinstance(speech, dict):
+                score(log.get("player"), speech.get("suspicion"))
+        if len(self.voting_logs):
+            for voter, target in self.voting_logs[-1]["votes"].items():
+                score(voter, target)
+        
+        seat = self.core.index[player]
+        num_seats = len(self.players)
+        
+        def rank(other: str) -> Tuple[int, int]:
+            distance = abs(self.core.index[other] - seat)
+            return -scores[other], min(distance, num_seats - distance)
+        
+        chosen = set(sorted(scores, key=rank)[:size])
+        return tuple(other for other in alive_players if other in chosen)
     
-    def get_state_dict(self) -> Dict[str, Any]:
-        """获取状态字典（用于传递给 Agent）"""
+    def get_full_history(self) -> List[Dict]:
+        """获取完整游戏历史"""
+        return list(self.full_history)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """导出可序列化的状态（用于检查点，历史只需遍历一次事件日志）"""
         return {
+            "players": list(self.players),
+            "roles": dict(self.roles),
+            "alive_players": list(self.alive_players),
             "round": self.round,
             "phase": self.phase,
-            "alive_players": self.alive_players,
-            "player_roles": self.roles,
-            "last_night_deaths": self.last_night_deaths,
-            "discussion_logs": self.discussion_logs[-len(self.alive_players):] if self.discussion_logs else [],
-            "execution_history": self.execution_history
+            "last_night_deaths": list(self.last_night_deaths),
+            "events": self.events.encode()
         }
     
-    def get_full_history(self) -> List[Dict]:
-        """获取完整游戏历史"""
-        return self.full_history
+    @classmethod
+    def from_snapshot(cls, data: Dict[str, Any]) -> 'GameState':
+        """从 snapshot 导出的数据恢复状态"""
+        state = cls(list(data["players"]), dict(data["roles"]))
+        state.alive_players = data["alive_players"]
+        state.last_night_deaths = tuple(data["last_night_deaths"])
+        state.round = data["round"]
+        state.phase = data["phase"]
+        state.events = EventLog.decode(data["events"])
+        return state
     
     def copy(self) -> 'GameState':
-        """深拷贝游戏状态"""
-        return deepcopy(self)
+        """
+        分叉游戏状态（用于假设分析）
+        
+        历史日志结构共享，代价与已有历史长度无关；
+        此后双方的状态变更互不影响，但已记录的条目是共享的，不应修改
+        """
+        state = GameState.__new__(GameState)
+        state.__dict__.update(self.__dict__)
+        state.core = self.core.copy()
+        state.events = self.events.fork()
+        return state
 
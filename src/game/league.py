@@ -0,0 +1,588 @@
+"""
+联赛
+在不同的 Agent 配置（性格 × 模型 × RAG / 记忆设置）之间安排对决，用 Elo 和 TrueSkill 评分比较配置强弱。
+每场对决是同一随机种子下交换阵营的两局（A 当狼人、B 当村民，再反过来），抵消阵营本身的胜率差异；
+每局结束后立即增量更新评分并写入磁盘，调度时优先安排评分仍不确定、实力接近的对决。
+对局记录追加到 JSONL 文件，中断后用同一个输出文件重新运行会按原顺序重放已完成的对局再继续
+"""
+
+import json
+import math
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import combinations
+from statistics import NormalDist
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from ..utils.cost_tracker import CostTracker
+from .batch_runner import DRAW, BatchRunner, _init_worker, _worker, run_worker_game
+
+
+SCHEDULES = ("round_robin", "swiss")
+
+# GameFlow 结果中的获胜方 -> 阵营
+WINNER_TEAMS = {"狼人": "werewolf", "村民": "villager"}
+
+# Agent 配置中允许的字段（见 GameFlow 的 team_configs）
+CONFIG_KEYS = ("personality", "llm", "use_rag", "use_memory")
+
+_NORMAL = NormalDist()
+
+Pair = Tuple[str, str]
+
+
+def pair_key(a: str, b: str) -> Pair:
+    """无序的对决键"""
+    return (a, b) if a <= b else (b, a)
+
+
+def game_error(record: Dict) -> Optional[str]:
+    """
+    一局记录的错误信息（有效结果返回 None）
+
+    获胜方既不是任一阵营、也不是达到最大轮数的平局时（如旧版本记录的中途出错的对局），同样视为失败
+    """
+    if "error" in record:
+        return record["error"]
+    if record.get("winner") != DRAW and record.get("winner") not in WINNER_TEAMS:
+        return f"Game ended without a valid winner: {record.get('winner')!r}"
+    return None
+
+
+def elo_expected(rating: float, opponent: float) -> float:
+    """Elo 期望得分"""
+    return 1.0 / (1.0 + 10 ** ((opponent - rating) / 400.0))
+
+
+# ----------------------------------------------------------------------
+# 评分
+# ----------------------------------------------------------------------
+
+class TrueSkill:
+    """1 对 1 的 TrueSkill 评分更新（高斯技能分布，支持平局）"""
+
+    def __init__(
+        self,
+        mu: float = 25.0,
+        sigma: float = 25.0 / 3,
+        beta: float = 25.0 / 6,
+        tau: float = 25.0 / 300,
+        draw_probability: float = 0.1
+    ):
+        """
+        初始化
+
+        Args:
+            mu: 初始技能均值
+            sigma: 初始技能标准差（不确定度）
+            beta: 单局表现的随机波动
+            tau: 每局之前加入的动态噪声（避免不确定度收缩到 0）
+            draw_probability: 实力相同时平局（达到最大轮数）的概率
+        """
+        if not 0 <= draw_probability < 1:
+            raise ValueError("draw_probability must be in [0, 1)")
+        self.mu = mu
+        self.sigma = sigma
+        self.beta = beta
+        self.tau = tau
+        self.draw_margin = _NORMAL.inv_cdf((draw_probability + 1) / 2) * math.sqrt(2) * beta
+
+    def rate(
+        self,
+        winner: Tuple[float, float],
+        loser: Tuple[float, float],
+        drawn: bool = False
+    ) -> Tuple[Tuple[float, float], Tuple[float, float]]:
+        """
+        根据一局结果更新双方的 (mu, sigma)
+
+        Args:
+            winner: 获胜方的 (mu, sigma)（平局时任意一方）
+            loser: 落败方的 (mu, sigma)
+            drawn: 是否平局
+
+        Returns:
+            更新后的 (winner, loser)
+        """
+        (mu_w, sigma_w), (mu_l, sigma_l) = winner, loser
+        var_w = sigma_w ** 2 + self.tau ** 2
+        var_l = sigma_l ** 2 + self.tau ** 2
+        c = math.sqrt(2 * self.beta ** 2 + var_w + var_l)
+        t = (mu_w - mu_l) / c
+        epsilon = self.draw_margin / c
+        v, w = self._draw_vw(t, epsilon) if drawn else self._win_vw(t, epsilon)
+
+        mu_w += var_w / c * v
+        mu_l -= var_l / c * v
+        sigma_w = math.sqrt(var_w * max(1 - var_w / c ** 2 * w, 1e-6))
+        sigma_l = math.sqrt(var_l * max(1 - var_l / c ** 2 * w, 1e-6))
+        return (mu_w, sigma_w), (mu_l, sigma_l)
+
+    @staticmethod
+    def _win_vw(t: float, epsilon: float) -> Tuple[float, float]:
+        x = t - epsilon
+        denominator = _NORMAL.cdf(x)
+        if denominator < 1e-12:
+            return -x, 1.0
+        v = _NORMAL.pdf(x) / denominator
+        return v, v * (v + x)
+
+    @staticmethod
+    def _draw_vw(t: float, epsilon: float) -> Tuple[float, float]:
+        upper, lower = epsilon - t, -epsilon - t
+        denominator = _NORMAL.cdf(upper) - _NORMAL.cdf(lower)
+        if denominator < 1e-12:
+            return -t, 1.0
+        v = (_NORMAL.pdf(lower) - _NORMAL.pdf(upper)) / denominator
+        return v, v * v + (upper * _NORMAL.pdf(upper) - lower * _NORMAL.pdf(lower)) / denominator
+
+    def quality(self, a: Tuple[float, float], b: Tuple[float, float]) -> float:
+        """匹配质量（0-1，越接近 1 表示双方实力越接近、结果越难预测）"""
+        (mu_a, sigma_a), (mu_b, sigma_b) = a, b
+        c2 = 2 * self.beta ** 2 + sigma_a ** 2 + sigma_b ** 2
+        return math.sqrt(2 * self.beta ** 2 / c2) * math.exp(-(mu_a - mu_b) ** 2 / (2 * c2))
+
+
+class LeagueRatings:
+    """各配置的 Elo / TrueSkill 评分和对决统计（按对局结果的顺序增量更新）"""
+
+    def __init__(
+        self,
+        names: List[str],
+        elo_k: float = 24.0,
+        initial_elo: float = 1500.0,
+        trueskill: Optional[TrueSkill] = None
+    ):
+        """
+        初始化
+
+        Args:
+            names: 配置名称
+            elo_k: Elo 的 K 系数
+            initial_elo: 初始 Elo
+            trueskill: TrueSkill 参数（默认参数）
+        """
+        self.elo_k = elo_k
+        self.trueskill = trueskill or TrueSkill()
+        self.players: Dict[str, Dict[str, float]] = {
+            name: {
+                "elo": initial_elo,
+                "mu": self.trueskill.mu,
+                "sigma": self.trueskill.sigma,
+                "games": 0,
+                "wins": 0,
+                "draws": 0,
+                "losses": 0
+            }
+            for name in names
+        }
+        # 对决键 -> {"games": 局数, "draws": 平局数, "wins": {配置名: 胜局数}}
+        self.pairs: Dict[Pair, Dict[str, Any]] = {}
+
+    def record(self, winner: str, loser: str, drawn: bool = False):
+        """
+        记录一局结果
+
+        Args:
+            winner: 获胜的配置（平局时任意一方）
+            loser: 落败的配置
+            drawn: 是否平局
+        """
+        a, b = self.players[winner], self.players[loser]
+
+        score = 0.5 if drawn else 1.0
+        expected = elo_expected(a["elo"], b["elo"])
+        a["elo"] += self.elo_k * (score - expected)
+        b["elo"] -= self.elo_k * (score - expected)
+
+        (a["mu"], a["sigma"]), (b["mu"], b["sigma"]) = self.trueskill.rate(
+            (a["mu"], a["sigma"]), (b["mu"], b["sigma"]), drawn
+        )
+
+        stats = self.pairs.setdefault(
+            pair_key(winner, loser),
+            {"games": 0, "draws": 0, "wins": {winner: 0, loser: 0}}
+        )
+        stats["games"] += 1
+        a["games"] += 1
+        b["games"] += 1
+        if drawn:
+            stats["draws"] += 1
+            a["draws"] += 1
+            b["draws"] += 1
+        else:
+            stats["wins"][winner] += 1
+            a["wins"] += 1
+            b["losses"] += 1
+
+    def games_between(self, a: str, b: str) -> int:
+        """两个配置之间已评分的局数"""
+        return self.pairs.get(pair_key(a, b), {}).get("games", 0)
+
+    def conservative(self, name: str) -> float:
+        """保守评分 mu - 3 * sigma（排名依据：评分高且已确定）"""
+        player = self.players[name]
+        return player["mu"] - 3 * player["sigma"]
+
+    def uncertainty(self, a: str, b: str) -> float:
+        """对决的信息量：双方不确定度（方差之和）乘以匹配质量"""
+        pa, pb = self.players[a], self.players[b]
+        quality = self.trueskill.quality((pa["mu"], pa["sigma"]), (pb["mu"], pb["sigma"]))
+        return (pa["sigma"] ** 2 + pb["sigma"] ** 2) * quality
+
+    def leaderboard(self) -> List[Dict[str, Any]]:
+        """按保守评分排序的排行榜"""
+        rows = [
+            {"name": name, **player, "conservative": self.conservative(name)}
+            for name, player in self.players.items()
+        ]
+        rows.sort(key=lambda row: row["conservative"], reverse=True)
+        return rows
+
+    def to_dict(self) -> Dict[str, Any]:
+        """可序列化的评分"""
+        return {
+            "leaderboard": self.leaderboard(),
+            "pairs": [
+                {"configs": list(pair), **stats}
+                for pair, stats in sorted(self.pairs.items())
+            ]
+        }
+
+
+# ----------------------------------------------------------------------
+# 调度
+# ----------------------------------------------------------------------
+
+def next_round_robin_pair(
+    names: List[str],
+    ratings: LeagueRatings,
+    open_matchups: Dict[Pair, int]
+) -> Pair:
+    """
+    循环赛的下一场对决：先让每对配置都至少对决一次，之后选择信息量最大的对决
+
+    Args:
+        names: 配置名称
+        ratings: 当前评分
+        open_matchups: 已安排但尚未完成的对决数（避免把并发的名额集中在同一对上）
+
+    Returns:
+        对决的两个配置
+    """
+    pairs = [pair_key(a, b) for a, b in combinations(names, 2)]
+    for pair in pairs:
+        if ratings.games_between(*pair) == 0 and open_matchups.get(pair, 0) == 0:
+            return pair
+    return max(pairs, key=lambda pair: ratings.uncertainty(*pair) / (1 + open_matchups.get(pair, 0)))
+
+
+def swiss_round(names: List[str], ratings: LeagueRatings) -> List[Pair]:
+    """
+    瑞士制的一轮配对：按保守评分从高到低，每个配置与尚未配对的对手中信息量最大者配对，
+    交手次数越多的对手优先级越低；配置数为奇数时不确定度最小的一个轮空
+
+    Args:
+        names: 配置名称
+        ratings: 当前评分
+
+    Returns:
+        本轮的对决列表
+    """
+    ranked = sorted(names, key=ratings.conservative, reverse=True)
+    if len(ranked) % 2:
+        ranked.remove(min(ranked, key=lambda name: (ratings.players[name]["sigma"], name)))
+
+    unpaired = list(ranked)
+    pairs = []
+    while unpaired:
+        name = unpaired.pop(0)
+        opponent = max(
+            unpaired,
+            key=lambda other: ratings.uncertainty(name, other) / (1 + ratings.games_between(name, other))
+        )
+        unpaired.remove(opponent)
+        pairs.append(pair_key(name, opponent))
+    return pairs
+
+
+# ----------------------------------------------------------------------
+# 工作进程
+# ----------------------------------------------------------------------
+
+def play_league_game(task: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[CostTracker]]:
+    """
+    在工作进程中运行联赛的一局
+
+    Args:
+        task: 对局描述（index、matchup、seed 以及两个阵营使用的配置名）
+
+    Returns:
+        (对局记录, 成本追踪器)
+    """
+    options = _worker["options"]
+    configs = options["configs"]
+    record = {
+        "type": "game",
+        "game_id": f"{options['batch_id']}-{task['index']:05d}",
+        **task
+    }
+    return run_worker_game(record, team_configs={
+        "werewolf": configs[task["werewolf"]],
+        "villager": configs[task["villager"]]
+    })
+
+
+# ----------------------------------------------------------------------
+# 联赛运行
+# ----------------------------------------------------------------------
+
+class League(BatchRunner):
+    """联赛运行器（复用批量对局的工作进程池、结果文件续跑和成本统计）"""
+
+    def __init__(
+        self,
+        configs: Dict[str, Dict[str, Any]],
+        num_matchups: int,
+        output_path: str,
+        schedule: str = "round_robin",
+        elo_k: float = 24.0,
+        draw_probability: float = 0.1,
+        **kwargs
+    ):
+        """
+        初始化联赛
+
+        Args:
+            configs: 配置名称 -> Agent 配置（personality、llm、use_rag、use_memory，见 GameFlow 的 team_configs）
+            num_matchups: 对决数（每场对决为交换阵营的两局）
+            output_path: 对局记录 JSONL 文件路径（已存在时续跑）；评分写入 <文件名>.ratings.json
+            schedule: 调度方式（"round_robin" 循环赛或 "swiss" 瑞士制）
+            elo_k: Elo 的 K 系数
+            draw_probability: TrueSkill 的平局概率（达到最大轮数的对局记为平局）
+            **kwargs: BatchRunner 的其他参数（players、workers、base_seed、max_rounds、game_options、
+                rate_limit、resilience、http_client、quiet、response_cache_path）
+        """
+        if len(configs) < 2:
+            raise ValueError("a league needs at least two configs")
+        if schedule not in SCHEDULES:
+            raise ValueError(f"Unsupported schedule: {schedule}")
+        for name, config in configs.items():
+            unknown = set(config or {}) - set(CONFIG_KEYS)
+            if unknown:
+                raise ValueError(f"Unknown keys in league config {name}: {sorted(unknown)}")
+
+        super().__init__(num_games=2 * num_matchups, output_path=output_path, **kwargs)
+        self.configs = {name: dict(config or {}) for name, config in configs.items()}
+        self.names = list(self.configs)
+        self.num_matchups = num_matchups
+        self.schedule = schedule
+        self.elo_k = elo_k
+        self.draw_probability = draw_probability
+        self.ratings_path = os.path.splitext(output_path)[0] + ".ratings.json"
+        self.worker_options["configs"] = self.configs
+
+        self.ratings = self._new_ratings()
+        self._open_matchups: Dict[Pair, int] = {}
+        self._swiss_queue: Deque[Pair] = deque()
+
+    def _new_ratings(self) -> LeagueRatings:
+        return LeagueRatings(
+            self.names,
+            elo_k=self.elo_k,
+            trueskill=TrueSkill(draw_probability=self.draw_probability)
+        )
+
+    def _header(self) -> Dict[str, Any]:
+        return {**super()._header(), "type": "league", "configs": self.configs}
+
+    def load_records(self) -> List[Dict]:
+        """
+        按写入顺序读取输出文件中的对局记录（含失败的记录）
+
+        Raises:
+            ValueError: 输出文件的玩家、种子或轮数设置不同，或同名配置的设置被修改
+        """
+        records: List[Dict] = []
+        if not os.path.exists(self.output_path):
+            return records
+
+        header = self._header()
+        with open(self.output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 中断时写了一半的行
+                if record.get("type") == "league":
+                    for key in ("players", "base_seed", "max_rounds"):
+                        if record.get(key) != header[key]:
+                            raise ValueError(
+                                f"{self.output_path} was written with a different {key}: {record.get(key)}"
+                            )
+                    for name, config in record.get("configs", {}).items():
+                        if name in self.configs and config != self.configs[name]:
+                            raise ValueError(f"{self.output_path} was written with a different config for {name}")
+                elif record.get("type") == "game":
+                    records.append(record)
+        return records
+
+    def _apply(self, record: Dict):
+        """用一局结果更新评分（失败的对局和已移除配置的对局不计；只有达到最大轮数的对局记为平局）"""
+        if game_error(record) is not None or not {record["werewolf"], record["villager"]} <= set(self.configs):
+            return
+        if record["winner"] == DRAW:
+            self.ratings.record(record["werewolf"], record["villager"], drawn=True)
+        else:
+            winner_team = WINNER_TEAMS[record["winner"]]
+            loser_team = "villager" if winner_team == "werewolf" else "werewolf"
+            self.ratings.record(record[winner_team], record[loser_team])
+
+    def _save_ratings(self):
+        """写入评分文件（先写临时文件再替换，中断时不会留下写了一半的文件）"""
+        data = {
+            "league_id": self.batch_id,
+            "schedule": self.schedule,
+            "games": sum(1 for record in self.records.values() if "error" not in record),
+            **self.ratings.to_dict()
+        }
+        temp_path = self.ratings_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.ratings_path)
+
+    def _next_pair(self) -> Pair:
+        if self.schedule == "swiss":
+            if not self._swiss_queue:
+                self._swiss_queue.extend(swiss_round(self.names, self.ratings))
+            return self._swiss_queue.popleft()
+        return next_round_robin_pair(self.names, self.ratings, self._open_matchups)
+
+    @staticmethod
+    def _matchup_tasks(matchup: int, pair: Pair, seed: int) -> List[Dict[str, Any]]:
+        """一场对决的两局：同一种子下交换阵营"""
+        a, b = pair
+        return [
+            {"index": 2 * matchup, "matchup": matchup, "seed": seed, "werewolf": a, "villager": b},
+            {"index": 2 * matchup + 1, "matchup": matchup, "seed": seed, "werewolf": b, "villager": a}
+        ]
+
+    def run(self, progress: bool = True) -> Dict[str, Any]:
+        """
+        运行联赛直到完成 num_matchups 场对决
+
+        Args:
+            progress: 是否在每局结束时打印结果和当前排行榜前几名
+
+        Returns:
+            汇总报告（评分、排行榜、对决统计和成本，同时写入 <输出文件名>.report.json）
+        """
+        # 按原顺序重放已完成的对局，重建评分；失败或缺失的一局重新运行
+        self.records = {}
+        self.ratings = self._new_ratings()
+        matchups: Dict[int, List[Dict]] = {}
+        for record in self.load_records():
+            matchups.setdefault(record["matchup"], []).append(record)
+            if game_error(record) is None:
+                self.records[record["index"]] = record
+                self._apply(record)
+
+        pending: Deque[Dict[str, Any]] = deque()
+        for matchup, records in sorted(matchups.items()):
+            first = records[0]
+            pair = (first["werewolf"], first["villager"]) if first["index"] % 2 == 0 else (first["villager"], first["werewolf"])
+            for task in self._matchup_tasks(matchup, pair, first["seed"]):
+                if task["index"] not in self.records and set(pair) <= set(self.configs):
+                    pending.append(task)
+                    self._open_matchups[pair_key(*pair)] = self._open_matchups.get(pair_key(*pair), 0) + 1
+        next_matchup = max(matchups) + 1 if matchups else 0
+        if progress and self.records:
+            print(f"续跑：已完成 {len(self.records)} 局，补跑 {len(pending)} 局")
+
+        directory = os.path.dirname(os.path.abspath(self.output_path))
+        os.makedirs(directory, exist_ok=True)
+
+        def schedule() -> bool:
+            """安排下一场对决，对决数已满时返回 False"""
+            nonlocal next_matchup
+            if next_matchup >= self.num_matchups:
+                return False
+            pair = self._next_pair()
+            pending.extend(self._matchup_tasks(next_matchup, pair, self.base_seed + next_matchup))
+            self._open_matchups[pair_key(*pair)] = self._open_matchups.get(pair_key(*pair), 0) + 2
+            next_matchup += 1
+            return True
+
+        with open(self.output_path, "a", encoding="utf-8") as out:
+            if os.path.getsize(self.output_path) > 0 and not self._ends_with_newline():
+                out.write("\n")  # 上次中断时最后一行没有写完
+            self._write(out, self._header())
+
+            if self.workers == 1:
+                _init_worker(self.worker_options)
+                while pending or schedule():
+                    self._handle(out, *play_league_game(pending.popleft()), progress=progress)
+            else:
+                with ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_worker,
+                    initargs=(self.worker_options,)
+                ) as pool:
+                    running = set()
+                    while True:
+                        # 保持进程池满载；每次安排对决时使用最新的评分
+                        while len(running) < self.workers and (pending or schedule()):
+                            running.add(pool.submit(play_league_game, pending.popleft()))
+                        if not running:
+                            break
+                        done, running = wait(running, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self._handle(out, *future.result(), progress=progress)
+
+        report = self.get_report()
+        with open(self.report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return report
+
+    def _handle(self, out, record: Dict, tracker: Optional[CostTracker], progress: bool):
+        """写入一局结果，增量更新评分并写入磁盘（没有有效结果的对局记为失败，续跑时重新运行）"""
+        error = game_error(record)
+        if error is not None:
+            record["error"] = error
+        self._write(out, record)
+        pair = pair_key(record["werewolf"], record["villager"])
+        self._open_matchups[pair] = max(self._open_matchups.get(pair, 0) - 1, 0)
+        if "error" not in record:
+            self.records[record["index"]] = record
+            self._apply(record)
+        if tracker is not None:
+            self.cost_tracker.merge(tracker)
+        self._save_ratings()
+
+        if progress:
+            done = len(self.records)
+            if "error" in record:
+                print(f"[{done}/{self.num_games}] {record['game_id']} 失败: {record['error']}")
+            else:
+                top = ", ".join(
+                    f"{row['name']} {row['elo']:.0f} ({row['mu']:.1f}±{row['sigma']:.1f})"
+                    for row in self.ratings.leaderboard()[:3]
+                )
+                print(f"[{done}/{self.num_games}] {record['game_id']} 狼人 {record['werewolf']} vs "
+                      f"村民 {record['villager']}: {record['winner']} | {top}")
+
+    def get_report(self) -> Dict[str, Any]:
+        """当前的汇总报告（cost 为本次运行中各局成本统计的合并）"""
+        games = [self.records[i] for i in sorted(self.records)]
+        side_wins: Dict[str, int] = {}
+        for record in games:
+            side_wins[record["winner"]] = side_wins.get(record["winner"], 0) + 1
+        return {
+            "league_id": self.batch_id,
+            "schedule": self.schedule,
+            "games": len(games),
+            "side_wins": side_wins,
+            **self.ratings.to_dict(),
+            "cost": self.cost_tracker.get_summary()
+        }
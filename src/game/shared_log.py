@@ -0,0 +1,129 @@
+"""
+结构共享的只追加日志
+游戏历史只会追加，不会修改已有条目，因此分叉（copy）时新旧状态可以共享同一段前缀：
+分叉只固定当前长度并各自开启新的尾部，代价与历史长度无关；
+冻结视图（FrozenLog）同样只固定长度，构建为 O(1)，之后的追加对其不可见。
+
+日志条目按约定视为不可变，记录之后不应再修改。
+"""
+
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Sequence, Tuple, Union
+
+
+# 分叉链过长时（例如反复在分支上继续分叉）把前缀合并成一段，避免随机访问变慢
+MAX_SEGMENTS = 8
+
+Segment = Tuple[List[Any], int]
+
+
+class FrozenLog(Sequence):
+    """日志在某一时刻的只读视图"""
+
+    __slots__ = ("_segments", "_length")
+
+    def __init__(self, segments: Tuple[Segment, ...] = (), length: int = 0):
+        """
+        初始化
+
+        Args:
+            segments: (列表, 可见长度) 组成的分段，各段只读取前“可见长度”个元素
+            length: 总长度
+        """
+        self._segments = segments
+        self._length = length
+
+    def _parts(self) -> Tuple[Segment, ...]:
+        return self._segments
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[Any]:
+        for items, count in self._parts():
+            yield from islice(items, count)
+
+    def __reversed__(self) -> Iterator[Any]:
+        for items, count in reversed(self._parts()):
+            for i in range(count - 1, -1, -1):
+                yield items[i]
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step != 1:
+                return tuple(self[i] for i in range(start, stop, step))
+            return tuple(self._range(start, stop))
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("log index out of range")
+        for items, count in self._parts():
+            if index < count:
+                return items[index]
+            index -= count
+        raise IndexError("log index out of range")
+
+    def _range(self, start: int, stop: int) -> Iterator[Any]:
+        """按顺序产出 [start, stop) 范围内的条目"""
+        offset = 0
+        for items, count in self._parts():
+            if start < offset + count and stop > offset:
+                yield from items[max(start - offset, 0):min(stop - offset, count)]
+            offset += count
+            if offset >= stop:
+                break
+
+    def freeze(self) -> "FrozenLog":
+        """固定当前内容的只读视图"""
+        return FrozenLog(self._parts(), self._length)
+
+    def tail(self, n: int) -> Tuple[Any, ...]:
+        """最后 n 条（n <= 0 时为空）"""
+        return self[-n:] if n > 0 else ()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self)!r})"
+
+
+class SharedLog(FrozenLog):
+    """可追加、可 O(1) 分叉的日志"""
+
+    __slots__ = ("_tail",)
+
+    def __init__(self, items: Iterable[Any] = ()):
+        """
+        初始化
+
+        Args:
+            items: 初始条目
+        """
+        self._tail: List[Any] = list(items)
+        super().__init__((), len(self._tail))
+
+    def _parts(self) -> Tuple[Segment, ...]:
+        return self._segments + ((self._tail, len(self._tail)),)
+
+    def append(self, item: Any):
+        """追加一条记录（只写入本日志独占的尾部）"""
+        self._tail.append(item)
+        self._length += 1
+
+    def extend(self, items: Iterable[Any]):
+        """追加多条记录"""
+        for item in items:
+            self.append(item)
+
+    def fork(self) -> "SharedLog":
+        """
+        分叉：新日志与当前日志共享已有条目，此后双方的追加互不可见
+
+        当前日志继续在原来的尾部追加（分叉方只读取固定长度的前缀），分叉方使用新的尾部
+        """
+        if len(self._segments) >= MAX_SEGMENTS:
+            prefix = [item for items, count in self._segments for item in islice(items, count)]
+            self._segments = ((prefix, len(prefix)),)
+        log = SharedLog()
+        log._segments = tuple(segment for segment in self._parts() if segment[1])
+        log._length = self._length
+        return log
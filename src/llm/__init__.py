@@ -0,0 +1,35 @@
+"""
+LLM 调用基础设施模块：调用器、响应缓存、流式 JSON 扫描、离线后端、共享客户端池、限流器、容错策略等
+"""
+
+from .llm_caller import LLMCaller
+from .response_cache import ResponseCache, CachedResponse
+from .json_stream import IncrementalJSONScanner
+from .stub_backends import StubChatModel, HashEmbeddings
+from .client_pool import ClientPool, get_client_pool, configure_client_pool
+from .rate_limiter import RateLimiter, RateLimitedEmbeddings
+from .resilience import ResiliencePolicy, LLMTimeoutError
+from .model_router import ModelRouter, ModelRoute
+from .cassette import Cassette, CassetteEmbeddings, CassetteChatModel, CassetteMissError
+
+__all__ = [
+    "LLMCaller",
+    "ResponseCache",
+    "CachedResponse",
+    "IncrementalJSONScanner",
+    "StubChatModel",
+    "HashEmbeddings",
+    "ClientPool",
+    "get_client_pool",
+    "configure_client_pool",
+    "RateLimiter",
+    "RateLimitedEmbeddings",
+    "ResiliencePolicy",
+    "LLMTimeoutError",
+    "ModelRouter",
+    "ModelRoute",
+    "Cassette",
+    "CassetteEmbeddings",
+    "CassetteChatModel",
+    "CassetteMissError"
+]
@@ -0,0 +1,356 @@
+"""
+对局录制与回放（cassette）
+录制模式记录一局游戏的随机种子、角色分配、游戏设置，以及每次 LLM 和嵌入调用的结果，保存为压缩的单局文件；
+回放模式用录制的结果代替所有 LLM 和嵌入调用，不访问网络、几乎没有延迟，
+用于在真实对局上反复剖析和回归测试游戏引擎、记忆和 RAG 代码。
+
+LLM 结果按 LLMCaller 的缓存键（模型、温度、输出上限、服务地址、提示词）寻址，同一个键的多次结果按调用顺序依次回放，
+因此并发调用的完成顺序不影响回放；嵌入按文本寻址，以 float32 保存（与 FAISS 索引中的精度一致）。
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Type
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+
+from .response_cache import ResponseCache, CachedResponse
+
+
+CASSETTE_VERSION = 1
+
+
+class CassetteMissError(LookupError):
+    """回放时录像中没有对应的调用结果（提示词或游戏设置与录制时不一致）"""
+
+
+class ReplayedError(Exception):
+    """回放录制时失败的 LLM 调用（异常类名与录制时相同，兜底决策的说明文字保持一致）"""
+
+
+_error_types: Dict[str, Type[ReplayedError]] = {}
+
+
+def _replayed_error_type(name: str) -> Type[ReplayedError]:
+    error_type = _error_types.get(name)
+    if error_type is None:
+        error_type = type(name, (ReplayedError,), {})
+        _error_types[name] = error_type
+    return error_type
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """一局游戏的录像"""
+
+    RECORD = "record"
+    REPLAY = "replay"
+
+    # 回放结果在成本统计中的缓存命中来源
+    SOURCE_REPLAY = "replay"
+
+    def __init__(self, path: str, mode: str = RECORD):
+        """
+        初始化录像
+
+        Args:
+            path: 录像文件路径（gzip 压缩的 JSON，建议以 .json.gz 结尾）
+            mode: "record" 录制（结束时写入 path）或 "replay" 回放（从 path 读取）
+
+        Raises:
+            ValueError: mode 不合法或录像文件版本不支持
+        """
+        if mode not in (self.RECORD, self.REPLAY):
+            raise ValueError(f"Unsupported cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        # 录制时真实调用前仍先查询的响应缓存（由 GameFlow 设置）
+        self.response_cache: Optional[ResponseCache] = None
+
+        self.meta: Dict[str, Any] = {}
+        self._llm: Dict[str, List[Dict[str, Any]]] = {}
+        self._embeddings: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        # 回放进度：每个键下一条待回放的结果
+        self._pending: Dict[str, Deque[Dict[str, Any]]] = {}
+        self.llm_replayed = 0
+        self.embeddings_replayed = 0
+        self.misses = 0
+
+        if mode == self.REPLAY:
+            self._load()
+
+    @classmethod
+    def record(cls, path: str) -> "Cassette":
+        """创建用于录制的录像"""
+        return cls(path, cls.RECORD)
+
+    @classmethod
+    def replay(cls, path: str) -> "Cassette":
+        """读取录像用于回放"""
+        return cls(path, cls.REPLAY)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == self.REPLAY
+
+    # ------------------------------------------------------------------
+    # 文件读写
+    # ------------------------------------------------------------------
+
+    def _load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"Unsupported cassette version: {data.get('version')}")
+        self.meta = data["meta"]
+        self._llm = data["llm"]
+        self._embeddings = data["embeddings"]
+        self._pending = {key: deque(entries) for key, entries in self._llm.items()}
+
+    def save(self):
+        """写入录像文件（先写临时文件再替换，中途失败不会留下不完整的录像）"""
+        with self._lock:
+            data = {
+                "version": CASSETTE_VERSION,
+                "meta": self.meta,
+                "llm": self._llm,
+                "embeddings": self._embeddings
+            }
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+
+    def game_options(self) -> Dict[str, Any]:
+        """
+        录制时的游戏设置，可直接传给 GameFlow：GameFlow(**cassette.game_options(), cassette=cassette)
+
+        Raises:
+            ValueError: 录像中没有游戏设置
+        """
+        if "players" not in self.meta:
+            raise ValueError("Cassette has no recorded game settings")
+        return {"players": list(self.meta["players"]), "seed": self.meta["seed"], **self.meta["options"]}
+
+    @staticmethod
+    def transcript_digest(game_history: List[Dict], player_thoughts: Dict[str, List[Dict]]) -> str:
+        """游戏历史和思考链的摘要（回放与录制的结果逐字节一致时摘要相同）"""
+        payload = json.dumps(
+            {"game_history": game_history, "player_thoughts": player_thoughts},
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------
+    # LLM 调用（与 ResponseCache 相同的接口，作为 LLMCaller 的 response_cache 使用）
+    # ------------------------------------------------------------------
+
+    def _record(self, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._llm.setdefault(key, []).append(entry)
+
+    @staticmethod
+    def _response_entry(response: CachedResponse) -> Dict[str, Any]:
+        return {
+            "content": response.content,
+            "prompt_tokens": response.prompt_tokens,
+            "completion_tokens": response.completion_tokens
+        }
+
+    @staticmethod
+    def _error_entry(error: Exception) -> Dict[str, Any]:
+        return {"error": type(error).__name__, "message": str(error)}
+
+    def _replay(self, key: str) -> CachedResponse:
+        with self._lock:
+            pending = self._pending.get(key)
+            if not pending:
+                self.misses += 1
+                raise CassetteMissError(f"No recorded LLM response for key {key[:12]}")
+            entry = pending.popleft()
+            self.llm_replayed += 1
+        if "error" in entry:
+            raise _replayed_error_type(entry["error"])(entry["message"])
+        return CachedResponse(
+            content=entry["content"],
+            prompt_tokens=entry["prompt_tokens"],
+            completion_tokens=entry["completion_tokens"]
+        )
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], CachedResponse]
+    ) -> Tuple[CachedResponse, str]:
+        """
+        录制：调用（或查询响应缓存）并记录结果；回放：返回录制的下一条结果，不调用 compute
+
+        Returns:
+            (响应, 来源)
+
+        Raises:
+            CassetteMissError: 回放时没有对应的结果
+        """
+        if self.replaying:
+            return self._replay(key), self.SOURCE_REPLAY
+        try:
+            if self.response_cache is None:
+                response, source = compute(), ResponseCache.SOURCE_MISS
+            else:
+                response, source = self.response_cache.get_or_compute(key, compute)
+        except Exception as e:
+            self._record(key, self._error_entry(e))
+            raise
+        self._record(key, self._response_entry(response))
+        return response, source
+
+    async def aget_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[CachedResponse]]
+    ) -> Tuple[CachedResponse, str]:
+        """get_or_compute 的异步版本"""
+        if self.replaying:
+            return self._replay(key), self.SOURCE_REPLAY
+        try:
+            if self.response_cache is None:
+                response, source = await compute(), ResponseCache.SOURCE_MISS
+            else:
+                response, source = await self.response_cache.aget_or_compute(key, compute)
+        except Exception as e:
+            self._record(key, self._error_entry(e))
+            raise
+        self._record(key, self._response_entry(response))
+        return response, source
+
+    # ------------------------------------------------------------------
+    # 嵌入
+    # ------------------------------------------------------------------
+
+    def embeddings(self, inner: Optional[Embeddings] = None) -> "CassetteEmbeddings":
+        """
+        录制或回放嵌入调用的嵌入模型
+
+        Args:
+            inner: 录制时实际调用的嵌入模型（回放时不需要）
+
+        Raises:
+            ValueError: 录制时没有提供嵌入模型
+        """
+        if not self.replaying and inner is None:
+            raise ValueError("An embeddings model is required for recording")
+        return CassetteEmbeddings(self, inner)
+
+    def record_embedding(self, text: str, vector: List[float]):
+        """记录一条文本的嵌入"""
+        encoded = base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+        with self._lock:
+            self._embeddings[_text_key(text)] = encoded
+
+    def replay_embedding(self, text: str) -> List[float]:
+        """
+        回放一条文本的嵌入
+
+        Raises:
+            CassetteMissError: 录像中没有该文本
+        """
+        with self._lock:
+            encoded = self._embeddings.get(_text_key(text))
+            if encoded is None:
+                self.misses += 1
+                raise CassetteMissError("No recorded embedding for text")
+            self.embeddings_replayed += 1
+        return np.frombuffer(base64.b64decode(encoded), dtype=np.float32).tolist()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """录制的条目数和回放进度（unused 为录制了但未回放的 LLM 结果数）"""
+        with self._lock:
+            stats = {
+                "mode": self.mode,
+                "llm_entries": sum(len(entries) for entries in self._llm.values()),
+                "embedding_entries": len(self._embeddings)
+            }
+            if self.replaying:
+                stats.update({
+                    "llm_replayed": self.llm_replayed,
+                    "embeddings_replayed": self.embeddings_replayed,
+                    "misses": self.misses,
+                    "unused": sum(len(pending) for pending in self._pending.values())
+                })
+            return stats
+
+
+class CassetteChatModel(BaseChatModel):
+    """
+    回放时代替真实模型的占位模型
+
+    只提供与录制时相同的模型名称、温度、输出上限和服务地址（组成缓存键），不需要 API Key；
+    所有调用都由录像回答，直接调用该模型会抛出 CassetteMissError
+    """
+
+    model_name: str
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    openai_api_base: Optional[str] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette-replay"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        raise CassetteMissError(f"{self.model_name} is a replay placeholder and cannot be called")
+
+
+class CassetteEmbeddings(Embeddings):
+    """录制或回放嵌入调用的嵌入模型包装"""
+
+    def __init__(self, cassette: Cassette, embeddings: Optional[Embeddings] = None):
+        """
+        初始化
+
+        Args:
+            cassette: 录像
+            embeddings: 录制时被包装的嵌入模型
+        """
+        self.cassette = cassette
+        self.embeddings = embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.cassette.replaying:
+            return self.cassette.replay_embedding(text)
+        vector = self.embeddings.embed_query(text)
+        self.cassette.record_embedding(text, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.cassette.replaying:
+            return [self.cassette.replay_embedding(text) for text in texts]
+        vectors = self.embeddings.embed_documents(texts)
+        for text, vector in zip(texts, vectors):
+            self.cassette.record_embedding(text, vector)
+        return vectors
@@ -0,0 +1,374 @@
+"""
+共享 LLM 客户端池
+进程级注册表：按 (base_url, api_key, model) 复用 ChatOpenAI / OpenAIEmbeddings 实例，
+同一 base_url 的所有实例共享一组保持长连接的 HTTP 客户端（安装 h2 时启用 HTTP/2），
+并通过 httpcore 的 trace 扩展统计连接复用情况
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class ConnectionStats:
+    """连接复用统计（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connect_started: Dict[int, float] = {}
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.connect_time = 0.0  # 建立 TCP + TLS 连接的累计耗时（秒）
+        self.http2_requests = 0
+
+    def trace(self, event_name: str, info: Dict[str, Any]):
+        """httpcore trace 回调（同步客户端）"""
+        key = threading.get_ident()
+        with self._lock:
+            if event_name == "connection.connect_tcp.started":
+                self._connect_started[key] = time.perf_counter()
+            elif event_name == "connection.connect_tcp.complete":
+                self.new_connections += 1
+            elif event_name == "connection.start_tls.complete":
+                self.tls_handshakes += 1
+                started = self._connect_started.pop(key, None)
+                if started is not None:
+                    self.connect_time += time.perf_counter() - started
+            elif event_name.endswith("send_request_headers.started"):
+                self.requests += 1
+                if event_name.startswith("http2"):
+                    self.http2_requests += 1
+                started = self._connect_started.pop(key, None)
+                if started is not None:
+                    self.connect_time += time.perf_counter() - started
+
+    async def atrace(self, event_name: str, info: Dict[str, Any]):
+        """httpcore trace 回调（异步客户端）"""
+        self.trace(event_name, info)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取统计快照"""
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": reused,
+                "reuse_rate": reused / self.requests if self.requests else 0.0,
+                "tls_handshakes": self.tls_handshakes,
+                "connect_time": self.connect_time,
+                "http2_requests": self.http2_requests
+            }
+
+
+class _TracingTransport(httpx.HTTPTransport):
+    """为每个请求挂上 trace 回调的同步传输层"""
+
+    def __init__(self, stats: ConnectionStats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions["trace"] = self._stats.trace
+        return super().handle_request(request)
+
+
+class _LoopLocalAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    异步传输层：每个事件循环一个连接池
+
+    异步连接绑定在创建它的事件循环上，多次 asyncio.run（每局游戏一次）时不能跨循环复用，
+    因此按事件循环分别维护连接池。连接池持有事件循环的引用，不会随循环自动释放：
+    应在循环结束前调用 aclose()（ClientPool.aclose_loop）关闭当前循环的连接池；
+    未关闭就结束的循环，其连接池在下次获取连接池时被丢弃（套接字随垃圾回收关闭）。
+    """
+
+    def __init__(self, stats: ConnectionStats, **kwargs):
+        self._stats = stats
+        self._kwargs = kwargs
+        self._transports: Dict[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport] = {}
+        self._lock = threading.Lock()
+
+    def _transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            for closed_loop in [other for other in self._transports if other.is_closed()]:
+                del self._transports[closed_loop]
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = httpx.AsyncHTTPTransport(**self._kwargs)
+                self._transports[loop] = transport
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions["trace"] = self._stats.atrace
+        return await self._transport().handle_async_request(request)
+
+    @property
+    def open_pools(self) -> int:
+        """尚未关闭的连接池数（每个事件循环一个）"""
+        with self._lock:
+            return len(self._transports)
+
+    async def aclose(self):
+        """关闭当前事件循环的连接池"""
+        with self._lock:
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+class ClientPool:
+    """进程级 LLM 客户端注册表"""
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 60.0,
+        http2: Optional[bool] = None,
+        timeout: float = 60.0,
+        connect_timeout: float = 10.0
+    ):
+        """
+        初始化客户端池
+
+        Args:
+            max_connections: 每个 base_url 的最大连接数
+            max_keepalive_connections: 每个 base_url 保持的空闲长连接数
+            keepalive_expiry: 空闲长连接的保持时间（秒）
+            http2: 是否启用 HTTP/2（None 表示安装了 h2 时自动启用）
+            timeout: 读写超时（秒）
+            connect_timeout: 建立连接超时（秒）
+        """
+        if http2 and not HTTP2_AVAILABLE:
+            raise ImportError("HTTP/2 requires h2. Install with: pip install httpx[http2]")
+
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.http2 = HTTP2_AVAILABLE if http2 is None else http2
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._http_clients: Dict[Optional[str], Tuple[httpx.Client, httpx.AsyncClient]] = {}
+        self._async_transports: Dict[Optional[str], _LoopLocalAsyncTransport] = {}
+        self._stats: Dict[Optional[str], ConnectionStats] = {}
+        self._chat_models: Dict[Tuple, ChatOpenAI] = {}
+        self._embeddings: Dict[Tuple, OpenAIEmbeddings] = {}
+        self.model_requests = 0  # 获取模型实例的次数
+        self.model_reuses = 0  # 其中复用已有实例的次数
+
+    def _check_fork(self):
+        """子进程不能复用父进程的连接，fork 后重新创建"""
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._http_clients = {}
+            self._async_transports = {}
+            self._stats = {}
+            self._chat_models = {}
+            self._embeddings = {}
+
+    def get_http_clients(self, base_url: Optional[str] = None) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        """
+        获取某个 base_url 共享的同步 / 异步 HTTP 客户端
+
+        Args:
+            base_url: API Base URL（None 表示 OpenAI 默认地址）
+
+        Returns:
+            (同步客户端, 异步客户端)
+        """
+        with self._lock:
+            self._check_fork()
+            clients = self._http_clients.get(base_url)
+            if clients is None:
+                stats = ConnectionStats()
+                transport_options = {"limits": self.limits, "http2": self.http2}
+                async_transport = _LoopLocalAsyncTransport(stats, **transport_options)
+                clients = (
+                    httpx.Client(
+                        transport=_TracingTransport(stats, **transport_options),
+                        timeout=self.timeout,
+                        follow_redirects=True
+                    ),
+                    httpx.AsyncClient(
+                        transport=async_transport,
+                        timeout=self.timeout,
+                        follow_redirects=True
+                    )
+                )
+                self._http_clients[base_url] = clients
+                self._async_transports[base_url] = async_transport
+                self._stats[base_url] = stats
+            return clients
+
+    def get_chat_model(
+        self,
+        model: str,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> ChatOpenAI:
+        """
+        获取共享的 ChatOpenAI 实例
+
+        Args:
+            model: 模型名称
+            api_key: API Key
+            base_url: API Base URL
+            temperature: 温度
+            **kwargs: 其他 ChatOpenAI 参数（参与实例的区分）
+
+        Returns:
+            按 (base_url, api_key, model, temperature, kwargs) 共享的 ChatOpenAI 实例
+        """
+        key = (base_url, api_key, model, temperature, tuple(sorted(kwargs.items())))
+        http_client, http_async_client = self.get_http_clients(base_url)
+        with self._lock:
+            self.model_requests += 1
+            llm = self._chat_models.get(key)
+            if llm is not None:
+                self.model_reuses += 1
+                return llm
+
+            llm = ChatOpenAI(
+                model=model,
+                api_key=api_key,
+                base_url=base_url,
+                temperature=temperature,
+                http_client=http_client,
+                http_async_client=http_async_client,
+                **kwargs
+            )
+            self._chat_models[key] = llm
+            return llm
+
+    def get_embeddings(
+        self,
+        model: str = "text-embedding-ada-002",
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None
+    ) -> OpenAIEmbeddings:
+        """
+        获取共享的 OpenAIEmbeddings 实例
+
+        Args:
+            model: 嵌入模型名称
+            api_key: API Key
+            base_url: API Base URL
+
+        Returns:
+            按 (base_url, api_key, model) 共享的 OpenAIEmbeddings 实例
+        """
+        key = (base_url, api_key, model)
+        http_client, http_async_client = self.get_http_clients(base_url)
+        with self._lock:
+            self.model_requests += 1
+            embeddings = self._embeddings.get(key)
+            if embeddings is not None:
+                self.model_reuses += 1
+                return embeddings
+
+            embeddings = OpenAIEmbeddings(
+                model=model,
+                openai_api_key=api_key,
+                openai_api_base=base_url,
+                http_client=http_client,
+                http_async_client=http_async_client
+            )
+            self._embeddings[key] = embeddings
+            return embeddings
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接复用统计（总体和按 base_url）"""
+        with self._lock:
+            by_endpoint = {
+                base_url or "default": stats.snapshot()
+                for base_url, stats in self._stats.items()
+            }
+            model_requests = self.model_requests
+            model_reuses = self.model_reuses
+
+        totals = {
+            key: sum(stats[key] for stats in by_endpoint.values())
+            for key in ("requests", "new_connections", "reused_connections", "tls_handshakes", "connect_time", "http2_requests")
+        }
+        totals["reuse_rate"] = totals["reused_connections"] / totals["requests"] if totals["requests"] else 0.0
+        return {
+            **totals,
+            "http2_enabled": self.http2,
+            "clients": len(by_endpoint),
+            "model_instances": model_requests - model_reuses,
+            "model_reuses": model_reuses,
+            "by_endpoint": by_endpoint
+        }
+
+    async def aclose_loop(self):
+        """
+        关闭当前事件循环上的异步连接池（各 base_url 的异步客户端）
+
+        应在事件循环结束前调用（如每局异步游戏结束时），否则连接池和其中的套接字会一直保留到下次使用该客户端池；
+        客户端本身保留，之后的事件循环会重新建立连接池
+        """
+        with self._lock:
+            transports = list(self._async_transports.values())
+        for transport in transports:
+            await transport.aclose()
+
+    def close(self):
+        """关闭同步客户端（异步连接池需在各自的事件循环中用 aclose_loop 关闭）"""
+        with self._lock:
+            for client, _ in self._http_clients.values():
+                client.close()
+            self._http_clients = {}
+            self._async_transports = {}
+            self._chat_models = {}
+            self._embeddings = {}
+
+
+_default_pool: Optional[ClientPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_client_pool() -> ClientPool:
+    """获取进程级默认客户端池"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ClientPool()
+        return _default_pool
+
+
+def configure_client_pool(**options) -> ClientPool:
+    """
+    使用新的连接池参数替换进程级默认客户端池
+
+    Args:
+        **options: ClientPool 的构造参数（max_connections、max_keepalive_connections 等）
+
+    Returns:
+        新的默认客户端池
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is not None:
+            _default_pool.close()
+        _default_pool = ClientPool(**options)
+        return _default_pool
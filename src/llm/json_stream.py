@@ -0,0 +1,95 @@
+"""
+增量 JSON 扫描器
+在流式输出中追踪括号深度和字符串状态，顶层 JSON 对象（或数组）闭合后立即判定完成；
+全角括号视为对应的半角括号。可选的校验函数不通过时（如说明文字中的 "[1]"）丢弃该候选，继续扫描
+"""
+
+from typing import Callable, Optional
+
+
+# 全角括号 -> 半角括号
+_FULLWIDTH_BRACKETS = {"｛": "{", "｝": "}", "［": "[", "］": "]"}
+
+
+class IncrementalJSONScanner:
+    """增量 JSON 扫描器"""
+
+    _OPENERS = {"{": "}", "[": "]"}
+
+    def __init__(self, allow_arrays: bool = True, validate: Optional[Callable[[str], bool]] = None):
+        """
+        初始化扫描器
+
+        Args:
+            allow_arrays: 顶层是否可以是数组（单个决策只接受对象，批量决策的回复为数组）
+            validate: 候选 JSON 文本的校验函数（可选），返回 False 时丢弃该候选并继续扫描
+        """
+        self.allow_arrays = allow_arrays
+        self.validate = validate
+        self.text = ""
+        self.start: Optional[int] = None  # 顶层 JSON 起始位置
+        self.end: Optional[int] = None    # 顶层 JSON 结束位置（不含）
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def complete(self) -> bool:
+        """顶层 JSON 是否已闭合"""
+        return self.end is not None
+
+    @property
+    def json_text(self) -> Optional[str]:
+        """已闭合的顶层 JSON 文本"""
+        if self.end is None:
+            return None
+        return self.text[self.start:self.end]
+
+    def feed(self, chunk: str) -> bool:
+        """
+        输入一段流式文本
+
+        Args:
+            chunk: 新收到的文本
+
+        Returns:
+            顶层 JSON 是否已闭合
+        """
+        if self.complete or not chunk:
+            return self.complete
+
+        offset = len(self.text)
+        self.text += chunk
+
+        for i, ch in enumerate(chunk, start=offset):
+            if self.start is None:
+                ch = _FULLWIDTH_BRACKETS.get(ch, ch)
+                if ch == "{" or (ch == "[" and self.allow_arrays):
+                    self.start = i
+                    self._stack.append(self._OPENERS[ch])
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            ch = _FULLWIDTH_BRACKETS.get(ch, ch)
+            if ch == '"':
+                self._in_string = True
+            elif ch in self._OPENERS:
+                self._stack.append(self._OPENERS[ch])
+            elif self._stack and ch == self._stack[-1]:
+                self._stack.pop()
+                if not self._stack:
+                    if self.validate is not None and not self.validate(self.text[self.start:i + 1]):
+                        self.start = None  # 不是有效的决策，从下一个字符继续寻找
+                        continue
+                    self.end = i + 1
+                    return True
+
+        return False
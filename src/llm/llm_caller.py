@@ -0,0 +1,384 @@
+"""
+LLM 调用器
+封装一次 LLM 调用的公共流程：响应缓存、限流、超时重试、流式输出、成本与延迟记录，
+供玩家 Agent 和主持人 Agent 共用
+"""
+
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain.schema import BaseMessage, SystemMessage
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import LLMResult
+
+from .json_stream import IncrementalJSONScanner
+from .rate_limiter import Permit, RateLimiter
+from .resilience import LLMTimeoutError, ResiliencePolicy
+from .response_cache import ResponseCache, CachedResponse
+from ..utils.cost_tracker import CostTracker
+from ..utils.prompt_budget import count_tokens
+
+
+def cached_prompt_tokens(token_usage: Optional[Dict[str, Any]]) -> int:
+    """
+    从服务端返回的 token_usage 中读取命中提示词前缀缓存的 token 数
+
+    Args:
+        token_usage: OpenAI 格式（prompt_tokens_details.cached_tokens）
+            或 DeepSeek 格式（prompt_cache_hit_tokens）的用量信息
+
+    Returns:
+        命中缓存的 prompt token 数
+    """
+    if not token_usage:
+        return 0
+    details = token_usage.get("prompt_tokens_details") or {}
+    if details.get("cached_tokens"):
+        return int(details["cached_tokens"])
+    return int(token_usage.get("prompt_cache_hit_tokens") or 0)
+
+
+class _UsageHandler(BaseCallbackHandler):
+    """回调处理器：收集一次调用中服务端报告的 token 用量（含命中提示词前缀缓存的 token 数）"""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        # 流式分块上报告的用量（提前终止的流不会触发 on_llm_end，只能依赖它）
+        self.stream_prompt_tokens = 0
+        self.stream_completion_tokens = 0
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        message = None
+        if response.generations and response.generations[0]:
+            message = getattr(response.generations[0][0], "message", None)
+        token_usage = (response.llm_output or {}).get("token_usage")
+        if not token_usage and message is not None:
+            token_usage = getattr(message, "response_metadata", {}).get("token_usage")
+
+        if token_usage:
+            self.prompt_tokens += int(token_usage.get("prompt_tokens") or 0)
+            self.completion_tokens += int(token_usage.get("completion_tokens") or 0)
+        elif getattr(message, "usage_metadata", None):
+            # 非 OpenAI 格式的后端只在消息的 usage_metadata 中报告用量
+            self.add_usage_metadata(message.usage_metadata)
+        self.cached_tokens += cached_prompt_tokens(token_usage)
+
+    def add_usage_metadata(self, usage: Dict[str, Any]):
+        """累加 langchain 标准格式（usage_metadata）的用量"""
+        self.prompt_tokens += int(usage.get("input_tokens") or 0)
+        self.completion_tokens += int(usage.get("output_tokens") or 0)
+
+    def add_stream_usage(self, usage: Dict[str, Any]):
+        """累加流式分块上的 usage_metadata"""
+        self.stream_prompt_tokens += int(usage.get("input_tokens") or 0)
+        self.stream_completion_tokens += int(usage.get("output_tokens") or 0)
+
+
+class LLMCaller:
+    """LLM 调用器"""
+
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        cost_tracker: Optional[CostTracker] = None,
+        response_cache: Optional[ResponseCache] = None,
+        streaming: bool = False,
+        name: Optional[str] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        resilience: Optional[ResiliencePolicy] = None,
+        route: Optional[str] = None,
+        stream_arrays: bool = False,
+        stream_validator: Optional[Callable[[str], bool]] = None
+    ):
+        """
+        初始化 LLM 调用器
+
+        Args:
+            llm: LLM 实例
+            cost_tracker: 成本追踪器
+            response_cache: LLM 响应缓存（可选）
+            streaming: 是否流式调用（顶层 JSON 闭合后立即停止生成）
+            name: 调用方名称（玩家名或 moderator），用于按 Agent 统计
+            rate_limiter: 共享限流器（可选，缓存未命中的调用才会占用配额）
+            resilience: 超时 / 重试 / 对冲策略（可选，每次重试和对冲都单独占用限流配额）
+            route: 该调用器对应的模型路由名，用于按路由统计成本和延迟
+            stream_arrays: 流式调用时顶层 JSON 是否可以是数组（批量决策）；否则只在顶层对象闭合时停止
+            stream_validator: 流式调用时停止生成前对候选 JSON 的校验（可选，如能否被解析器解析），
+                不通过时继续接收
+        """
+        self.llm = llm
+        self.cost_tracker = cost_tracker
+        self.response_cache = response_cache
+        self.streaming = streaming
+        self.name = name
+        self.rate_limiter = rate_limiter
+        self.resilience = resilience
+        self.route = route
+        self.stream_arrays = stream_arrays
+        self.stream_validator = stream_validator
+
+    def invoke(self, messages: List[BaseMessage], phase: Optional[str] = None) -> str:
+        """同步调用 LLM（优先使用响应缓存），返回回复文本"""
+        if self.response_cache is None:
+            return self._call_resilient(messages, phase).content
+
+        cached, source = self.response_cache.get_or_compute(
+            self._cache_key(messages),
+            lambda: self._call_resilient(messages, phase)
+        )
+        self._record_cache_lookup(cached, source)
+        return cached.content
+
+    async def ainvoke(self, messages: List[BaseMessage], phase: Optional[str] = None) -> str:
+        """异步调用 LLM（优先使用响应缓存），返回回复文本"""
+        if self.response_cache is None:
+            return (await self._acall_resilient(messages, phase)).content
+
+        cached, source = await self.response_cache.aget_or_compute(
+            self._cache_key(messages),
+            lambda: self._acall_resilient(messages, phase)
+        )
+        self._record_cache_lookup(cached, source)
+        return cached.content
+
+    def _call_resilient(self, messages: List[BaseMessage], phase: Optional[str] = None) -> CachedResponse:
+        """按容错策略调用 LLM（未配置策略时直接调用）"""
+        if self.resilience is None:
+            return self._call_llm(messages, phase)
+        return self.resilience.call(lambda deadline: self._call_llm(messages, phase, deadline), phase)
+
+    async def _acall_resilient(self, messages: List[BaseMessage], phase: Optional[str] = None) -> CachedResponse:
+        """_call_resilient 的异步版本"""
+        if self.resilience is None:
+            return await self._acall_llm(messages, phase)
+        return await self.resilience.acall(lambda: self._acall_llm(messages, phase), phase)
+
+    def _call_llm(
+        self,
+        messages: List[BaseMessage],
+        phase: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> CachedResponse:
+        """同步调用 LLM 并记录成本和延迟（deadline 为容错策略给出的本次尝试截止时间）"""
+        if self.streaming:
+            return self._stream_llm(messages, phase, deadline)
+        
+        handler = _UsageHandler()
+        with self._limit(messages) as permit:
+            options = self._request_options(deadline)
+            start = time.perf_counter()
+            response = self.llm.invoke(messages, config={"callbacks": [handler]}, **options)
+            latency = time.perf_counter() - start
+            result = self._finish_call(messages, response.content, handler, phase, latency)
+            permit.actual_tokens = result.prompt_tokens + result.completion_tokens
+        return result
+
+    async def _acall_llm(self, messages: List[BaseMessage], phase: Optional[str] = None) -> CachedResponse:
+        """异步调用 LLM 并记录成本和延迟"""
+        if self.streaming:
+            return await self._astream_llm(messages, phase)
+        
+        handler = _UsageHandler()
+        async with self._alimit(messages) as permit:
+            start = time.perf_counter()
+            response = await self.llm.ainvoke(messages, config={"callbacks": [handler]})
+            latency = time.perf_counter() - start
+            result = self._finish_call(messages, response.content, handler, phase, latency)
+            permit.actual_tokens = result.prompt_tokens + result.completion_tokens
+        return result
+
+    def _stream_llm(
+        self,
+        messages: List[BaseMessage],
+        phase: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> CachedResponse:
+        """流式调用 LLM，顶层 JSON 闭合后立即关闭流（超过截止时间时关闭流并抛出 LLMTimeoutError）"""
+        scanner = IncrementalJSONScanner(self.stream_arrays, self.stream_validator)
+        first_token_time = None
+        stopped_early = False
+        
+        handler = _UsageHandler()
+        with self._limit(messages) as permit:
+            options = self._request_options(deadline)
+            start = time.perf_counter()
+            stream = self.llm.stream(messages, config={"callbacks": [handler]}, **options)
+            try:
+                for chunk in stream:
+                    # HTTP 读超时只限制相邻两块之间的间隔，持续输出的流由这里按总时长中止
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise LLMTimeoutError(f"LLM stream for phase {phase} passed its deadline")
+                    if first_token_time is None and chunk.content:
+                        first_token_time = time.perf_counter() - start
+                    if getattr(chunk, "usage_metadata", None):
+                        handler.add_stream_usage(chunk.usage_metadata)
+                    if scanner.feed(chunk.content):
+                        stopped_early = True
+                        break
+            finally:
+                stream.close()
+            decision_time = time.perf_counter() - start
+            result = self._finish_call(
+                messages, scanner.json_text or scanner.text, handler, phase, decision_time, first_token_time
+            )
+            permit.actual_tokens = result.prompt_tokens + result.completion_tokens
+        
+        self._record_stream(first_token_time, decision_time, stopped_early)
+        return result
+    
+    async def _astream_llm(self, messages: List[BaseMessage], phase: Optional[str] = None) -> CachedResponse:
+        """异步流式调用 LLM，顶层 JSON 闭合后立即关闭流"""
+        scanner = IncrementalJSONScanner(self.stream_arrays, self.stream_validator)
+        first_token_time = None
+        stopped_early = False
+        
+        handler = _UsageHandler()
+        async with self._alimit(messages) as permit:
+            start = time.perf_counter()
+            stream = self.llm.astream(messages, config={"callbacks": [handler]})
+            try:
+                async for chunk in stream:
+                    if first_token_time is None and chunk.content:
+                        first_token_time = time.perf_counter() - start
+                    if getattr(chunk, "usage_metadata", None):
+                        handler.add_stream_usage(chunk.usage_metadata)
+                    if scanner.feed(chunk.content):
+                        stopped_early = True
+                        break
+            finally:
+                await stream.aclose()
+            decision_time = time.perf_counter() - start
+            result = self._finish_call(
+                messages, scanner.json_text or scanner.text, handler, phase, decision_time, first_token_time
+            )
+            permit.actual_tokens = result.prompt_tokens + result.completion_tokens
+        
+        self._record_stream(first_token_time, decision_time, stopped_early)
+        return result
+    
+    def _finish_call(
+        self,
+        messages: List[BaseMessage],
+        content: str,
+        handler: _UsageHandler,
+        phase: Optional[str],
+        latency: float,
+        ttft: Optional[float] = None
+    ) -> CachedResponse:
+        """
+        确定一次调用的 token 用量并记录成本
+        
+        优先使用服务端报告的用量；服务端没有报告（部分非 OpenAI 后端、提前终止的流式调用）时
+        用 tiktoken 按 prompt 和回复文本估算。
+        
+        Returns:
+            带 token 用量的响应
+        """
+        prompt_tokens = handler.prompt_tokens or handler.stream_prompt_tokens
+        completion_tokens = handler.completion_tokens or handler.stream_completion_tokens
+        token_source = "provider"
+        if not prompt_tokens and not completion_tokens:
+            model = getattr(self.llm, "model_name", None)
+            prompt_tokens = sum(count_tokens(str(m.content), model) for m in messages)
+            completion_tokens = count_tokens(content, model)
+            token_source = "estimate"
+        
+        if self.cost_tracker:
+            self.cost_tracker.record_call(
+                model=self.llm.model_name,
+                tokens=prompt_tokens + completion_tokens,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                latency=latency,
+                cached_tokens=handler.cached_tokens,
+                phase=phase,
+                agent=self.name,
+                route=self.route,
+                ttft=ttft,
+                token_source=token_source
+            )
+        return CachedResponse(
+            content=content,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens
+        )
+    
+    @staticmethod
+    def _request_options(deadline: Optional[float]) -> Dict[str, Any]:
+        """
+        同步调用的请求参数：按截止时间设置 HTTP 请求超时，超时的请求由客户端中止而不是在后台继续
+
+        Raises:
+            LLMTimeoutError: 等待限流配额时已经超过截止时间（不再发出请求）
+        """
+        if deadline is None:
+            return {}
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMTimeoutError("LLM call passed its deadline before the request was sent")
+        return {"timeout": remaining}
+
+    @contextmanager
+    def _limit(self, messages: List[BaseMessage]):
+        """在限流器允许后执行调用（未配置限流器时直接执行）"""
+        if self.rate_limiter is None:
+            yield Permit(0)
+            return
+        estimated = self.rate_limiter.estimate_tokens([str(m.content) for m in messages])
+        with self.rate_limiter.limit(estimated) as permit:
+            yield permit
+
+    @asynccontextmanager
+    async def _alimit(self, messages: List[BaseMessage]):
+        """异步版本的 _limit"""
+        if self.rate_limiter is None:
+            yield Permit(0)
+            return
+        estimated = self.rate_limiter.estimate_tokens([str(m.content) for m in messages])
+        async with self.rate_limiter.alimit(estimated) as permit:
+            yield permit
+
+    def _record_stream(
+        self,
+        first_token_time: Optional[float],
+        decision_time: float,
+        stopped_early: bool
+    ):
+        """向成本追踪器报告首 token 时间和决策时间"""
+        if self.cost_tracker:
+            self.cost_tracker.record_stream(
+                model=self.llm.model_name,
+                ttft=first_token_time,
+                time_to_decision=decision_time,
+                stopped_early=stopped_early
+            )
+    
+    def _cache_key(self, messages: List[BaseMessage]) -> str:
+        """根据模型、温度、输出上限、服务地址、系统提示词和用户提示词生成缓存键"""
+        system_prompt = "\n".join(m.content for m in messages if isinstance(m, SystemMessage))
+        user_prompt = "\n".join(m.content for m in messages if not isinstance(m, SystemMessage))
+        return ResponseCache.make_key(
+            self.llm.model_name,
+            getattr(self.llm, "temperature", None),
+            system_prompt,
+            user_prompt,
+            max_tokens=getattr(self.llm, "max_tokens", None),
+            base_url=getattr(self.llm, "openai_api_base", None)
+        )
+
+    def _record_cache_lookup(self, cached: CachedResponse, source: str):
+        """向成本追踪器报告缓存命中情况"""
+        if not self.cost_tracker:
+            return
+        if source == ResponseCache.SOURCE_MISS:
+            self.cost_tracker.record_cache_miss(self.llm.model_name)
+        else:
+            self.cost_tracker.record_cache_hit(
+                self.llm.model_name,
+                source,
+                saved_tokens=cached.prompt_tokens + cached.completion_tokens
+            )
@@ -0,0 +1,211 @@
+"""
+按阶段的模型路由
+夜晚行动和投票使用便宜快速的模型，发言使用更强的模型；
+可选的级联：便宜模型的输出无法通过校验或置信度过低时，升级到更强的模型重新决策
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from .client_pool import ClientPool, get_client_pool
+
+
+# 解析器的这些修复方式说明回复没有按格式给出，视为低置信度
+LOW_CONFIDENCE_NOTES = {"free_text", "fields", "raw_speech"}
+
+
+@dataclass
+class ModelRoute:
+    """一条模型路由"""
+    name: str
+    model: str
+    temperature: float = 0.7
+    max_tokens: Optional[int] = None
+    base_url: Optional[str] = None  # None 使用 GameFlow 的 base_url
+    api_key_env: Optional[str] = None  # 从该环境变量读取 API Key（None 使用 GameFlow 的 api_key）
+
+
+class ModelRouter:
+    """阶段 -> 模型路由，持有各路由的模型实例"""
+
+    DEFAULT_ROUTE = "default"
+
+    def __init__(
+        self,
+        routes: Dict[str, ModelRoute],
+        phase_routes: Optional[Dict[str, str]] = None,
+        default_route: Optional[str] = None,
+        cascade: Optional[Dict[str, Any]] = None,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        client_pool: Optional[ClientPool] = None,
+        model_factory: Optional[Callable[[ModelRoute], BaseChatModel]] = None,
+        llm_options: Optional[Dict[str, Any]] = None
+    ):
+        """
+        初始化模型路由
+
+        Args:
+            routes: 路由定义 {路由名: ModelRoute}
+            phase_routes: 阶段到路由名的映射（未列出的阶段使用默认路由）
+            default_route: 默认路由名（None 时取 routes 中的第一条）
+            cascade: 级联配置 {"enabled", "to", "phases", "min_confidence"}
+            api_key: 路由未单独指定时使用的 API Key
+            base_url: 路由未单独指定时使用的 API Base URL
+            client_pool: 创建模型实例的客户端池（默认使用进程级客户端池）
+            model_factory: 自定义模型实例的创建函数（如离线后端），优先于客户端池
+            llm_options: 传给 ChatOpenAI 的额外参数（如 max_retries）
+        """
+        if not routes:
+            raise ValueError("At least one model route is required")
+        phase_routes = dict(phase_routes or {})
+        default_route = default_route or next(iter(routes))
+        cascade = dict(cascade or {})
+        for name in [default_route, *phase_routes.values()] + ([cascade["to"]] if cascade.get("to") else []):
+            if name not in routes:
+                raise ValueError(f"Unknown model route: {name}")
+
+        self.routes = routes
+        self.phase_routes = phase_routes
+        self.default_route = default_route
+        self.cascade = cascade
+        self.api_key = api_key
+        self.base_url = base_url
+        self.client_pool = client_pool
+        self.model_factory = model_factory
+        self.llm_options = dict(llm_options or {})
+
+        self._lock = threading.Lock()
+        self._models: Dict[str, BaseChatModel] = {}
+
+    @classmethod
+    def from_config(
+        cls,
+        config: Optional[Dict[str, Any]],
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        **kwargs
+    ) -> "ModelRouter":
+        """
+        根据配置（game_config.yaml 中的 llm 段）创建
+
+        没有 routes 时只有一条默认路由，使用 llm 段的 model / temperature / max_tokens；
+        未配置 model 时按 base_url 选择 deepseek-chat 或 gpt-3.5-turbo。
+
+        Args:
+            config: llm 配置
+            api_key: API Key
+            base_url: API Base URL
+            **kwargs: 其他构造参数（client_pool、model_factory、llm_options）
+
+        Returns:
+            ModelRouter 实例
+        """
+        config = config or {}
+        default_model = config.get("model") or ("deepseek-chat" if base_url else "gpt-3.5-turbo")
+        routes = {
+            cls.DEFAULT_ROUTE: ModelRoute(
+                name=cls.DEFAULT_ROUTE,
+                model=default_model,
+                temperature=config.get("temperature", 0.7),
+                max_tokens=config.get("max_tokens")
+            )
+        }
+        for name, options in (config.get("routes") or {}).items():
+            options = dict(options or {})
+            options.setdefault("model", default_model)
+            routes[name] = ModelRoute(name=name, **options)
+
+        cascade = config.get("cascade") or {}
+        return cls(
+            routes=routes,
+            phase_routes=config.get("phase_routes"),
+            default_route=config.get("default_route", cls.DEFAULT_ROUTE),
+            cascade=cascade if cascade.get("enabled", True) else None,
+            api_key=api_key,
+            base_url=base_url,
+            **kwargs
+        )
+
+    def route_for(self, phase: Optional[str]) -> str:
+        """阶段对应的路由名（批量决策阶段 batch_xxx 使用 xxx 的路由）"""
+        if phase and phase.startswith("batch_"):
+            phase = phase[len("batch_"):]
+        return self.phase_routes.get(phase, self.default_route)
+
+    def escalation_for(self, phase: Optional[str], route: str) -> Optional[str]:
+        """
+        该阶段当前路由的级联升级目标
+
+        未启用级联、已是目标路由，或目标路由与当前路由是同一个模型（模型名称和服务地址都相同，
+        只有温度或输出上限不同）时返回 None：同一模型重新决策不会更可靠，只会让调用次数翻倍
+        """
+        target = self.cascade.get("to")
+        if not target or target == route:
+            return None
+        phases: List[str] = self.cascade.get("phases") or []
+        if phases and phase not in phases:
+            return None
+        if self.same_model(route, target):
+            return None
+        return target
+
+    def same_model(self, route: str, other: str) -> bool:
+        """两条路由的模型实例是否为同一个模型（比较模型名称和服务地址）"""
+        def identity(name: str):
+            model = self.get_model(name)
+            return getattr(model, "model_name", None), getattr(model, "openai_api_base", None)
+        return identity(route) == identity(other)
+
+    def should_escalate(self, result: Any) -> bool:
+        """
+        判断便宜模型的解析结果是否需要升级
+
+        Args:
+            result: 解析结果（ParseResult：ok / notes / data）
+
+        Returns:
+            未通过校验、只能从非格式化回复中抽取，或给出的 confidence 低于阈值时为 True
+        """
+        if not result.ok:
+            return True
+        if LOW_CONFIDENCE_NOTES.intersection(result.notes):
+            return True
+
+        min_confidence = self.cascade.get("min_confidence")
+        confidence = result.data.get("confidence") if isinstance(result.data, dict) else None
+        if min_confidence is None or confidence is None:
+            return False
+        try:
+            return float(confidence) < float(min_confidence)
+        except (TypeError, ValueError):
+            return False
+
+    def get_model(self, route: str) -> BaseChatModel:
+        """获取（并缓存）某条路由的模型实例"""
+        with self._lock:
+            model = self._models.get(route)
+            if model is not None:
+                return model
+
+            spec = self.routes[route]
+            if self.model_factory is not None:
+                model = self.model_factory(spec)
+            else:
+                options = dict(self.llm_options)
+                if spec.max_tokens is not None:
+                    options["max_tokens"] = spec.max_tokens
+                api_key = os.getenv(spec.api_key_env) if spec.api_key_env else None
+                model = (self.client_pool or get_client_pool()).get_chat_model(
+                    model=spec.model,
+                    api_key=api_key or self.api_key,
+                    base_url=spec.base_url or self.base_url,
+                    temperature=spec.temperature,
+                    **options
+                )
+            self._models[route] = model
+            return model
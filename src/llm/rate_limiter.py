@@ -0,0 +1,378 @@
+"""
+自适应限流器
+基于令牌桶限制每分钟请求数（RPM）和每分钟 token 数（TPM），
+并使用 AIMD 自适应并发：遇到 429 / 5xx 时乘性减小并发上限，调用健康时加性增大，
+同步线程和异步协程共用同一个限流器
+"""
+
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from ..utils.prompt_budget import count_tokens
+
+
+class TokenBucket:
+    """令牌桶（调用方负责加锁）"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        """
+        初始化令牌桶
+
+        Args:
+            capacity: 桶容量
+            refill_per_second: 每秒补充的令牌数
+        """
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """获取 amount 个令牌还需要等待的秒数（超过容量的请求按满桶处理）"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount: float):
+        """扣除令牌（可以扣成负数，用于按实际用量补扣）"""
+        self._refill()
+        self.tokens -= amount
+
+
+class Permit:
+    """一次获得的调用许可"""
+
+    def __init__(self, estimated_tokens: int):
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens: Optional[int] = None  # 调用方在调用完成后填入实际用量
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """判断异常是否表示服务端过载（429 或 5xx）"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status == 429 or (isinstance(status, int) and status >= 500)
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """读取异常响应中的 Retry-After（秒）"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimiter:
+    """RPM / TPM 令牌桶 + AIMD 自适应并发限流器"""
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_concurrency: int = 32,
+        min_concurrency: int = 1,
+        initial_concurrency: Optional[int] = None,
+        increase_step: float = 1.0,
+        decrease_factor: float = 0.5,
+        decrease_cooldown: float = 1.0,
+        expected_completion_tokens: int = 200
+    ):
+        """
+        初始化限流器
+
+        Args:
+            requests_per_minute: 每分钟请求数上限（None 表示不限制）
+            tokens_per_minute: 每分钟 token 数上限（None 表示不限制）
+            max_concurrency: 并发上限的最大值
+            min_concurrency: 并发上限的最小值
+            initial_concurrency: 初始并发上限（默认为 max_concurrency）
+            increase_step: 每完成“一个并发窗口”的成功调用后并发上限增加的量（加性增）
+            decrease_factor: 遇到 429 / 5xx 时并发上限乘以的系数（乘性减）
+            decrease_cooldown: 两次乘性减之间的最短间隔（秒），避免同一波错误反复减半
+            expected_completion_tokens: 预估 TPM 用量时为每次调用预留的 completion token 数
+        """
+        if min_concurrency < 1 or max_concurrency < min_concurrency:
+            raise ValueError("Require 1 <= min_concurrency <= max_concurrency")
+        if not 0 < decrease_factor < 1:
+            raise ValueError("decrease_factor must be between 0 and 1")
+
+        self._rpm_bucket = (
+            TokenBucket(requests_per_minute, requests_per_minute / 60.0) if requests_per_minute else None
+        )
+        self._tpm_bucket = (
+            TokenBucket(tokens_per_minute, tokens_per_minute / 60.0) if tokens_per_minute else None
+        )
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.expected_completion_tokens = expected_completion_tokens
+
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._limit = float(initial_concurrency or max_concurrency)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+
+        # 统计
+        self.calls = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.throttled_calls = 0
+        self.throttle_time = 0.0
+        self.overload_errors = 0
+        self.other_errors = 0
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> Optional["RateLimiter"]:
+        """
+        根据配置（game_config.yaml 中的 rate_limit 段）创建
+
+        Args:
+            config: rate_limit 配置
+
+        Returns:
+            RateLimiter 实例；未配置或 enabled 为 false 时返回 None
+        """
+        if not config or not config.get("enabled", True):
+            return None
+        options = {k: v for k, v in config.items() if k != "enabled"}
+        return cls(**options)
+
+    # ------------------------------------------------------------------
+    # 许可获取与释放
+    # ------------------------------------------------------------------
+
+    def _try_acquire(self, tokens: int) -> Optional[float]:
+        """尝试获取许可（需持有锁）：成功返回 0，需要等待时返回等待秒数，等待并发槽位时返回 None"""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._in_flight >= int(self._limit):
+            return None
+
+        wait = 0.0
+        if self._rpm_bucket:
+            wait = max(wait, self._rpm_bucket.wait_time(1))
+        if self._tpm_bucket:
+            wait = max(wait, self._tpm_bucket.wait_time(tokens))
+        if wait > 0:
+            return wait
+
+        if self._rpm_bucket:
+            self._rpm_bucket.consume(1)
+        if self._tpm_bucket:
+            self._tpm_bucket.consume(tokens)
+        self._in_flight += 1
+        self.calls += 1
+        return 0.0
+
+    def _enter_queue(self):
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def _leave_queue(self, waited: float):
+        self.queue_depth -= 1
+        if waited > 0:
+            self.throttled_calls += 1
+            self.throttle_time += waited
+
+    def acquire(self, estimated_tokens: int = 0) -> Permit:
+        """
+        阻塞直到获得调用许可（同步）
+
+        Args:
+            estimated_tokens: 预估的本次调用 token 数（用于 TPM 限制）
+
+        Returns:
+            调用许可，调用结束后必须 release
+        """
+        start = time.perf_counter()
+        with self._condition:
+            wait = self._try_acquire(estimated_tokens)
+            if wait == 0:
+                return Permit(estimated_tokens)
+
+            self._enter_queue()
+            try:
+                while wait != 0:
+                    self._condition.wait(timeout=wait)
+                    wait = self._try_acquire(estimated_tokens)
+            finally:
+                self._leave_queue(time.perf_counter() - start)
+        return Permit(estimated_tokens)
+
+    async def aacquire(self, estimated_tokens: int = 0) -> Permit:
+        """等待获得调用许可（异步，不阻塞事件循环）"""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        with self._lock:
+            wait = self._try_acquire(estimated_tokens)
+            if wait == 0:
+                return Permit(estimated_tokens)
+            self._enter_queue()
+
+        try:
+            while True:
+                future = loop.create_future()
+                with self._lock:
+                    wait = self._try_acquire(estimated_tokens)
+                    if wait == 0:
+                        break
+                    self._async_waiters.append((loop, future))
+                await asyncio.wait({future}, timeout=wait)
+                with self._lock:
+                    if (loop, future) in self._async_waiters:
+                        self._async_waiters.remove((loop, future))
+        finally:
+            with self._lock:
+                self._leave_queue(time.perf_counter() - start)
+        return Permit(estimated_tokens)
+
+    def release(self, permit: Permit, error: Optional[BaseException] = None):
+        """
+        释放许可，并根据调用结果调整并发上限
+
+        Args:
+            permit: acquire 返回的许可
+            error: 调用抛出的异常（成功时为 None）
+        """
+        with self._condition:
+            self._in_flight -= 1
+
+            # 按实际用量补扣（或退还）TPM 令牌
+            if self._tpm_bucket and permit.actual_tokens is not None:
+                self._tpm_bucket.consume(permit.actual_tokens - permit.estimated_tokens)
+
+            if isinstance(error, asyncio.CancelledError):
+                # 被取消的调用（如对冲请求中落败的一方）不代表服务端状态
+                pass
+            elif error is None:
+                # 加性增：每完成约 limit 次成功调用，并发上限增加 increase_step
+                self._limit = min(self.max_concurrency, self._limit + self.increase_step / self._limit)
+            elif is_overload_error(error):
+                self.overload_errors += 1
+                now = time.monotonic()
+                if now - self._last_decrease >= self.decrease_cooldown:
+                    self._limit = max(self.min_concurrency, self._limit * self.decrease_factor)
+                    self._last_decrease = now
+                retry_after = retry_after_seconds(error)
+                if retry_after:
+                    self._paused_until = max(self._paused_until, now + retry_after)
+            else:
+                self.other_errors += 1
+
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    @contextmanager
+    def limit(self, estimated_tokens: int = 0):
+        """同步上下文管理器：获取许可，退出时按是否异常释放"""
+        permit = self.acquire(estimated_tokens)
+        try:
+            yield permit
+        except BaseException as e:
+            self.release(permit, e)
+            raise
+        self.release(permit)
+
+    @asynccontextmanager
+    async def alimit(self, estimated_tokens: int = 0):
+        """异步上下文管理器：获取许可，退出时按是否异常释放"""
+        permit = await self.aacquire(estimated_tokens)
+        try:
+            yield permit
+        except BaseException as e:
+            self.release(permit, e)
+            raise
+        self.release(permit)
+
+    def estimate_tokens(self, texts: List[str]) -> int:
+        """预估一次调用的 token 数（prompt + 预留的 completion）"""
+        return sum(count_tokens(text) for text in texts) + self.expected_completion_tokens
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取限流统计"""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "in_flight": self._in_flight,
+                "concurrency_limit": int(self._limit),
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "throttled_calls": self.throttled_calls,
+                "throttle_time": self.throttle_time,
+                "average_throttle_time": self.throttle_time / self.throttled_calls if self.throttled_calls else 0.0,
+                "overload_errors": self.overload_errors,
+                "other_errors": self.other_errors,
+                "rpm_available": self._rpm_bucket.tokens if self._rpm_bucket else None,
+                "tpm_available": self._tpm_bucket.tokens if self._tpm_bucket else None
+            }
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """经过限流器的嵌入模型包装"""
+
+    def __init__(self, embeddings: Embeddings, rate_limiter: RateLimiter):
+        """
+        初始化限流嵌入模型
+
+        Args:
+            embeddings: 被包装的嵌入模型
+            rate_limiter: 限流器
+        """
+        self.embeddings = embeddings
+        self.rate_limiter = rate_limiter
+
+    def _estimate(self, texts: List[str]) -> int:
+        return sum(count_tokens(text) for text in texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self.rate_limiter.limit(self._estimate([text])):
+            return self.embeddings.embed_query(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self.rate_limiter.limit(self._estimate(texts)):
+            return self.embeddings.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        async with self.rate_limiter.alimit(self._estimate([text])):
+            return await self.embeddings.aembed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        async with self.rate_limiter.alimit(self._estimate(texts)):
+            return await self.embeddings.aembed_documents(texts)
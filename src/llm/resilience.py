@@ -0,0 +1,364 @@
+"""
+LLM 调用容错策略
+按阶段设置超时，对可重试的错误（超时、429 / 5xx、连接错误）做带抖动的指数退避重试，
+并可选地对冲请求：调用耗时超过该阶段观测到的 p95 时再发一个相同请求，取先返回的结果
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+import httpx
+import openai
+
+from .rate_limiter import is_overload_error, retry_after_seconds
+
+
+# 各阶段的默认超时（秒）
+DEFAULT_PHASE_TIMEOUTS = {
+    "night_action": 30.0,
+    "discussion": 60.0,
+    "voting": 30.0
+}
+
+
+class LLMTimeoutError(TimeoutError):
+    """单次 LLM 调用超过阶段超时"""
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """判断异常是否值得重试（超时、服务端过载、连接错误）"""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return True
+    return is_overload_error(error)
+
+
+class ResiliencePolicy:
+    """超时 + 重试 + 对冲请求策略（可在多个 Agent / 多局游戏间共享，共享延迟观测）"""
+
+    def __init__(
+        self,
+        phase_timeouts: Optional[Dict[str, float]] = None,
+        default_timeout: float = 60.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        max_hedge_ratio: float = 0.1,
+        latency_window: int = 200,
+        max_workers: int = 32,
+        seed: Optional[int] = None
+    ):
+        """
+        初始化容错策略
+
+        Args:
+            phase_timeouts: 各阶段的单次调用超时（秒），与默认值合并
+            default_timeout: 未配置阶段的超时（秒）
+            max_retries: 可重试错误的最大重试次数
+            backoff_base: 退避基数（秒），第 n 次重试前等待 [0, base * 2^n] 内的随机时长
+            backoff_max: 单次退避的上限（秒）
+            hedge: 是否启用对冲请求
+            hedge_quantile: 触发对冲的延迟分位数（按阶段观测）
+            hedge_min_samples: 某阶段至少观测到多少次调用后才开始对冲
+            max_hedge_ratio: 对冲请求占全部调用的比例上限，防止服务整体变慢时请求翻倍
+            latency_window: 每个阶段保留的最近延迟样本数
+            max_workers: 同步调用使用的线程池大小（超时和对冲需要在线程中执行调用）
+            seed: 退避抖动的随机种子
+        """
+        if max_retries < 0:
+            raise ValueError("max_retries must be non-negative")
+        if not 0 < hedge_quantile < 1:
+            raise ValueError("hedge_quantile must be between 0 and 1")
+
+        self.phase_timeouts = {**DEFAULT_PHASE_TIMEOUTS, **(phase_timeouts or {})}
+        self.default_timeout = default_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+        self.latency_window = latency_window
+        self.max_workers = max_workers
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+
+        # 统计
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedged_calls = 0
+        self.hedge_wins = 0
+        self.failures = 0
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> Optional["ResiliencePolicy"]:
+        """
+        根据配置（game_config.yaml 中的 resilience 段）创建
+
+        Args:
+            config: resilience 配置
+
+        Returns:
+            ResiliencePolicy 实例；enabled 为 false 时返回 None
+        """
+        config = config or {}
+        if not config.get("enabled", True):
+            return None
+        options = {k: v for k, v in config.items() if k != "enabled"}
+        return cls(**options)
+
+    # ------------------------------------------------------------------
+    # 超时、退避和对冲时机
+    # ------------------------------------------------------------------
+
+    def timeout_for(self, phase: Optional[str]) -> float:
+        """获取阶段超时（批量决策阶段 batch_xxx 使用 xxx 的配置）"""
+        if phase and phase.startswith("batch_"):
+            phase = phase[len("batch_"):]
+        return self.phase_timeouts.get(phase, self.default_timeout)
+
+    def backoff_delay(self, retry: int, error: Optional[BaseException] = None) -> float:
+        """第 retry 次重试前的等待时间（full jitter，且不短于服务端要求的 Retry-After）"""
+        with self._lock:
+            delay = self._rng.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** retry)))
+        retry_after = retry_after_seconds(error) if error is not None else None
+        return max(delay, retry_after or 0.0)
+
+    def percentile(self, phase: Optional[str], quantile: float) -> Optional[float]:
+        """某阶段最近调用延迟的分位数（样本不足时返回 None）"""
+        with self._lock:
+            samples = sorted(self._latencies.get(phase or "", ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(quantile * len(samples)))
+        return samples[index]
+
+    def hedge_delay(self, phase: Optional[str]) -> Optional[float]:
+        """多久之后发出对冲请求（不对冲时返回 None）"""
+        if not self.hedge:
+            return None
+        with self._lock:
+            if len(self._latencies.get(phase or "", ())) < self.hedge_min_samples:
+                return None
+            if self.calls and self.hedged_calls >= self.max_hedge_ratio * self.calls:
+                return None
+        return self.percentile(phase, self.hedge_quantile)
+
+    def _observe(self, phase: Optional[str], latency: float):
+        with self._lock:
+            window = self._latencies.setdefault(phase or "", deque(maxlen=self.latency_window))
+            window.append(latency)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """按进程懒创建线程池（fork 后的子进程重新创建）"""
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="llm-call"
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    # ------------------------------------------------------------------
+    # 同步调用
+    # ------------------------------------------------------------------
+
+    def call(self, fn: Callable[[float], Any], phase: Optional[str] = None) -> Any:
+        """
+        按策略执行一次同步调用
+
+        线程中的调用无法从外部取消，因此 fn 会收到本次尝试的截止时间（time.monotonic() 时刻），
+        应据此设置 HTTP 请求超时：超时的尝试由 HTTP 客户端中止，不会在后台继续占用限流配额和记录成本。
+        对冲中落败的尝试已经发出，会执行到完成或截止时间为止（服务端同样计费，成本照常记录）。
+
+        Args:
+            fn: 执行一次 LLM 调用的函数，参数为截止时间（可能被重复调用：重试或对冲）
+            phase: 阶段（决定超时和延迟统计的分组）
+
+        Returns:
+            fn 的返回值
+
+        Raises:
+            最后一次尝试的异常（不可重试的错误立即抛出）
+        """
+        with self._lock:
+            self.calls += 1
+        for retry in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                result = self._call_once(fn, phase)
+            except Exception as e:
+                if not is_retryable_error(e) or retry == self.max_retries:
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                with self._lock:
+                    self.retries += 1
+                time.sleep(self.backoff_delay(retry, e))
+                continue
+            self._observe(phase, time.perf_counter() - start)
+            return result
+
+    def _call_once(self, fn: Callable[[float], Any], phase: Optional[str]) -> Any:
+        """在线程池中执行一次尝试（含对冲，共用同一截止时间），超过阶段超时抛出 LLMTimeoutError"""
+        executor = self._get_executor()
+        timeout = self.timeout_for(phase)
+        deadline = time.monotonic() + timeout
+        futures: List[Future] = [executor.submit(fn, deadline)]
+        with self._lock:
+            self.attempts += 1
+
+        hedge_delay = self.hedge_delay(phase)
+        if hedge_delay is not None and hedge_delay < timeout:
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done:
+                futures.append(executor.submit(fn, deadline))
+                with self._lock:
+                    self.attempts += 1
+                    self.hedged_calls += 1
+
+        primary = futures[0]
+        error: Optional[BaseException] = None
+        pending = list(futures)
+        while pending:
+            done, _ = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                pending.remove(future)
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if future is not primary:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+
+        if pending:
+            # 超时：放弃仍在执行的尝试（请求按同一截止时间设置了 HTTP 超时，线程随即结束）
+            for future in pending:
+                future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise LLMTimeoutError(f"LLM call for phase {phase} exceeded {timeout:.1f}s")
+        raise error
+
+    # ------------------------------------------------------------------
+    # 异步调用
+    # ------------------------------------------------------------------
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], phase: Optional[str] = None) -> Any:
+        """call 的异步版本（fn 每次调用返回一个新的协程）"""
+        with self._lock:
+            self.calls += 1
+        for retry in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                result = await self._acall_once(fn, phase)
+            except Exception as e:
+                if not is_retryable_error(e) or retry == self.max_retries:
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                with self._lock:
+                    self.retries += 1
+                await asyncio.sleep(self.backoff_delay(retry, e))
+                continue
+            self._observe(phase, time.perf_counter() - start)
+            return result
+
+    async def _acall_once(self, fn: Callable[[], Awaitable[Any]], phase: Optional[str]) -> Any:
+        """执行一次异步尝试（含对冲），超时或分出胜负后取消其余请求"""
+        timeout = self.timeout_for(phase)
+        deadline = time.monotonic() + timeout
+        tasks = [asyncio.ensure_future(fn())]
+        with self._lock:
+            self.attempts += 1
+
+        try:
+            hedge_delay = self.hedge_delay(phase)
+            if hedge_delay is not None and hedge_delay < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    tasks.append(asyncio.ensure_future(fn()))
+                    with self._lock:
+                        self.attempts += 1
+                        self.hedged_calls += 1
+
+            error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=max(0.0, deadline - time.monotonic()),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise LLMTimeoutError(f"LLM call for phase {phase} exceeded {timeout:.1f}s")
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            with self._lock:
+                                self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取重试、超时、对冲统计和各阶段延迟分位数"""
+        with self._lock:
+            phases = list(self._latencies.keys())
+            stats = {
+                "calls": self.calls,
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "timeouts": self.timeouts,
+                "hedged_calls": self.hedged_calls,
+                "hedge_wins": self.hedge_wins,
+                "failures": self.failures
+            }
+        stats["latency"] = {
+            phase or "unknown": {
+                "p50": self.percentile(phase, 0.5),
+                "p95": self.percentile(phase, 0.95),
+                "p99": self.percentile(phase, 0.99)
+            }
+            for phase in phases
+        }
+        return stats
+
+    def close(self):
+        """关闭线程池"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,406 @@
+"""
+LLM 响应缓存
+内存 LRU + SQLite（WAL 模式）持久层，多个工作进程可共享同一个缓存文件；
+相同请求并发时只发起一次真实调用（single-flight）
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+@dataclass
+class CachedResponse:
+    """缓存的 LLM 响应"""
+    content: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class _Flight:
+    """一次进行中的请求，供同进程内的线程和协程等待结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self.result: Optional[CachedResponse] = None
+        self.error: Optional[BaseException] = None
+
+    def finish(self, result: Optional[CachedResponse], error: Optional[BaseException]):
+        """设置结果并唤醒所有等待者"""
+        with self._lock:
+            self.result = result
+            self.error = error
+            self._event.set()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve_future, future)
+
+    def wait(self) -> CachedResponse:
+        """同步等待结果"""
+        self._event.wait()
+        return self._outcome()
+
+    async def await_result(self) -> CachedResponse:
+        """异步等待结果"""
+        future = None
+        with self._lock:
+            if not self._event.is_set():
+                loop = asyncio.get_running_loop()
+                future = loop.create_future()
+                self._waiters.append((loop, future))
+        if future is not None:
+            await future
+        return self._outcome()
+
+    def _outcome(self) -> CachedResponse:
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def _resolve_future(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ResponseCache:
+    """内容寻址的 LLM 响应缓存"""
+
+    # 命中来源
+    SOURCE_MEMORY = "memory"
+    SOURCE_DISK = "disk"
+    SOURCE_COALESCED = "coalesced"
+    SOURCE_MISS = "miss"
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        max_memory_items: int = 1024,
+        lease_timeout: float = 120.0,
+        poll_interval: float = 0.05
+    ):
+        """
+        初始化响应缓存
+
+        Args:
+            db_path: SQLite 文件路径（可选，不提供则只使用内存缓存）
+            max_memory_items: 内存 LRU 的最大条目数
+            lease_timeout: 跨进程请求租约的超时时间（秒），超时后其他进程可接手
+            poll_interval: 等待其他进程结果时的轮询间隔（秒）
+        """
+        self.db_path = db_path
+        self.max_memory_items = max_memory_items
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+
+        self._memory: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._owner_id = uuid.uuid4().hex
+
+        if db_path:
+            directory = os.path.dirname(os.path.abspath(db_path))
+            os.makedirs(directory, exist_ok=True)
+            self._init_db()
+
+    @staticmethod
+    def make_key(
+        model: str,
+        temperature: Optional[float],
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: Optional[int] = None,
+        base_url: Optional[str] = None
+    ) -> str:
+        """
+        生成缓存键
+
+        同名模型的不同服务地址或输出上限（如两条路由、联赛中共享缓存的两个配置）不会互相命中
+
+        Args:
+            model: 模型名称
+            temperature: 采样温度
+            system_prompt: 系统提示词
+            user_prompt: 渲染后的用户提示词
+            max_tokens: 输出 token 上限（None 表示不限制）
+            base_url: API Base URL（None 表示默认地址）
+
+        Returns:
+            SHA-256 摘要
+        """
+        payload = json.dumps(
+            [model, temperature, max_tokens, base_url, system_prompt, user_prompt],
+            ensure_ascii=False,
+            separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------
+    # SQLite 持久层
+    # ------------------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        """获取当前线程（和进程）的 SQLite 连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_db(self):
+        """创建数据表"""
+        conn = self._connect()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS inflight (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )"""
+        )
+
+    def _disk_get(self, key: str) -> Optional[CachedResponse]:
+        row = self._connect().execute(
+            "SELECT content, prompt_tokens, completion_tokens FROM responses WHERE key = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return CachedResponse(content=row[0], prompt_tokens=row[1], completion_tokens=row[2])
+
+    def _disk_put(self, key: str, response: CachedResponse):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+            (key, response.content, response.prompt_tokens, response.completion_tokens, time.time())
+        )
+        conn.execute("DELETE FROM inflight WHERE key = ? AND owner = ?", (key, self._owner_id))
+
+    def _try_lease(self, key: str) -> bool:
+        """尝试获取跨进程租约，成功则由本进程负责调用"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("DELETE FROM inflight WHERE key = ? AND expires_at < ?", (key, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO inflight VALUES (?, ?, ?)",
+            (key, self._owner_id, now + self.lease_timeout)
+        )
+        return cursor.rowcount == 1
+
+    def _release_lease(self, key: str):
+        self._connect().execute(
+            "DELETE FROM inflight WHERE key = ? AND owner = ?",
+            (key, self._owner_id)
+        )
+
+    # ------------------------------------------------------------------
+    # 内存 LRU
+    # ------------------------------------------------------------------
+
+    def _memory_get(self, key: str) -> Optional[CachedResponse]:
+        response = self._memory.get(key)
+        if response is not None:
+            self._memory.move_to_end(key)
+        return response
+
+    def _memory_put(self, key: str, response: CachedResponse):
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """查询缓存（内存 -> 磁盘）"""
+        with self._lock:
+            response = self._memory_get(key)
+        if response is not None or not self.db_path:
+            return response
+
+        response = self._disk_get(key)
+        if response is not None:
+            with self._lock:
+                self._memory_put(key, response)
+        return response
+
+    def put(self, key: str, response: CachedResponse):
+        """写入缓存（内存 + 磁盘）"""
+        with self._lock:
+            self._memory_put(key, response)
+        if self.db_path:
+            self._disk_put(key, response)
+
+    # ------------------------------------------------------------------
+    # single-flight
+    # ------------------------------------------------------------------
+
+    def _lookup_or_join(self, key: str) -> Tuple[Optional[CachedResponse], Optional[_Flight], bool]:
+        """
+        查询内存缓存，未命中则加入或发起一次进程内请求
+
+        Returns:
+            (内存命中结果, 请求对象, 是否由当前调用者负责发起)
+        """
+        with self._lock:
+            response = self._memory_get(key)
+            if response is not None:
+                return response, None, False
+            flight = self._flights.get(key)
+            if flight is not None:
+                return None, flight, False
+            flight = _Flight()
+            self._flights[key] = flight
+            return None, flight, True
+
+    def _land(self, key: str, flight: _Flight, result: Optional[CachedResponse], error: Optional[BaseException]):
+        """结束一次进程内请求"""
+        with self._lock:
+            self._flights.pop(key, None)
+        flight.finish(result, error)
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], CachedResponse]
+    ) -> Tuple[CachedResponse, str]:
+        """
+        查询缓存，未命中时调用 compute 并写入缓存
+
+        Args:
+            key: 缓存键
+            compute: 实际调用 LLM 的函数
+
+        Returns:
+            (响应, 来源)，来源为 memory / disk / coalesced / miss
+        """
+        response, flight, leader = self._lookup_or_join(key)
+        if response is not None:
+            return response, self.SOURCE_MEMORY
+        if not leader:
+            return flight.wait(), self.SOURCE_COALESCED
+
+        try:
+            response, source = self._compute_as_leader(key, compute)
+        except BaseException as e:
+            self._land(key, flight, None, e)
+            raise
+        self._land(key, flight, response, None)
+        return response, source
+
+    def _compute_as_leader(
+        self,
+        key: str,
+        compute: Callable[[], CachedResponse]
+    ) -> Tuple[CachedResponse, str]:
+        if not self.db_path:
+            response = compute()
+            self.put(key, response)
+            return response, self.SOURCE_MISS
+
+        while True:
+            response = self._disk_get(key)
+            if response is not None:
+                with self._lock:
+                    self._memory_put(key, response)
+                return response, self.SOURCE_DISK
+            if self._try_lease(key):
+                break
+            # 其他进程正在请求同一内容，等待其写入结果
+            time.sleep(self.poll_interval)
+
+        try:
+            response = compute()
+        except BaseException:
+            self._release_lease(key)
+            raise
+        self.put(key, response)
+        return response, self.SOURCE_MISS
+
+    async def aget_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[CachedResponse]]
+    ) -> Tuple[CachedResponse, str]:
+        """get_or_compute 的异步版本"""
+        response, flight, leader = self._lookup_or_join(key)
+        if response is not None:
+            return response, self.SOURCE_MEMORY
+        if not leader:
+            return await flight.await_result(), self.SOURCE_COALESCED
+
+        try:
+            response, source = await self._acompute_as_leader(key, compute)
+        except BaseException as e:
+            self._land(key, flight, None, e)
+            raise
+        self._land(key, flight, response, None)
+        return response, source
+
+    async def _acompute_as_leader(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[CachedResponse]]
+    ) -> Tuple[CachedResponse, str]:
+        if not self.db_path:
+            response = await compute()
+            self.put(key, response)
+            return response, self.SOURCE_MISS
+
+        while True:
+            response = self._disk_get(key)
+            if response is not None:
+                with self._lock:
+                    self._memory_put(key, response)
+                return response, self.SOURCE_DISK
+            if self._try_lease(key):
+                break
+            await asyncio.sleep(self.poll_interval)
+
+        try:
+            response = await compute()
+        except BaseException:
+            self._release_lease(key)
+            raise
+        self.put(key, response)
+        return response, self.SOURCE_MISS
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取缓存容量统计"""
+        stats = {"memory_items": len(self._memory), "in_flight": len(self._flights)}
+        if self.db_path:
+            row = self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()
+            stats["disk_items"] = row[0]
+        return stats
+
+    def clear_memory(self):
+        """清空内存缓存（磁盘缓存保留）"""
+        with self._lock:
+            self._memory.clear()
+
+    def close(self):
+        """关闭当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,313 @@
+"""
+离线确定性后端
+基于规则的 Chat 模型和基于哈希的嵌入模型，不需要网络，
+用于基准测试和大规模模拟（单独测量游戏引擎、记忆和 RAG 的开销）
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
+
+
+# 紧凑输出格式使用的短键名
+_SHORT_KEYS = {
+    "target": "t",
+    "vote": "v",
+    "speech": "s",
+    "suspicion": "u",
+    "reasoning": "r"
+}
+
+
+class StubChatModel(BaseChatModel):
+    """
+    基于规则的确定性 Chat 模型
+
+    根据提示词识别阶段（夜晚 / 发言 / 投票），返回合法的 JSON 决策。
+    相同的 seed 和消息总是得到相同的回复。
+    """
+
+    model_name: str = "stub-chat"
+    temperature: float = 0.0
+    seed: int = 0
+    latency: float = 0.0  # 模拟的响应延迟（秒）
+    latency_jitter: float = 0.0  # 延迟的随机抖动幅度（秒）
+    prompt_tokens: Optional[int] = None  # 固定的 prompt token 数（None 则按字符数估算）
+    completion_tokens: Optional[int] = None  # 固定的 completion token 数（None 则按字符数估算）
+    trailing_commentary: str = ""  # 附加在 JSON 之后的多余说明（模拟真实模型的啰嗦输出）
+    stream_chunk_size: int = 8  # 流式输出每个分块的字符数
+    chunk_latency: float = 0.0  # 流式输出每个分块的间隔（秒）
+    prefix_cache: bool = True  # 是否模拟服务端的提示词前缀缓存（在 token_usage 中报告命中的 token 数）
+    prefix_cache_block: int = 64  # 前缀缓存的粒度（字符数）
+    
+    _seen_prefixes: set = PrivateAttr(default_factory=set)
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "seed": self.seed}
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        rng = self._rng(messages)
+        delay = self._delay(rng)
+        if delay > 0:
+            time.sleep(delay)
+        return self._build_result(messages, self._respond(messages, rng))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        rng = self._rng(messages)
+        delay = self._delay(rng)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return self._build_result(messages, self._respond(messages, rng))
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        rng = self._rng(messages)
+        delay = self._delay(rng)
+        if delay > 0:
+            time.sleep(delay)
+        for i, piece in enumerate(self._chunks(self._respond(messages, rng))):
+            if i > 0 and self.chunk_latency > 0:
+                time.sleep(self.chunk_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        rng = self._rng(messages)
+        delay = self._delay(rng)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        for i, piece in enumerate(self._chunks(self._respond(messages, rng))):
+            if i > 0 and self.chunk_latency > 0:
+                await asyncio.sleep(self.chunk_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+    def _chunks(self, content: str) -> List[str]:
+        size = max(1, self.stream_chunk_size)
+        return [content[i:i + size] for i in range(0, len(content), size)]
+
+    def _rng(self, messages: List[BaseMessage]) -> random.Random:
+        """由 seed 和消息内容派生随机数生成器，保证确定性"""
+        digest = hashlib.sha256(str(self.seed).encode("utf-8"))
+        for message in messages:
+            digest.update(message.type.encode("utf-8"))
+            digest.update(str(message.content).encode("utf-8"))
+        return random.Random(int.from_bytes(digest.digest()[:8], "big"))
+
+    def _delay(self, rng: random.Random) -> float:
+        if self.latency_jitter <= 0:
+            return self.latency
+        return max(0.0, self.latency + rng.uniform(-self.latency_jitter, self.latency_jitter))
+
+    def _build_result(self, messages: List[BaseMessage], content: str) -> ChatResult:
+        prompt_tokens = self.prompt_tokens
+        if prompt_tokens is None:
+            prompt_tokens = sum(_estimate_tokens(str(m.content)) for m in messages)
+        completion_tokens = self.completion_tokens
+        if completion_tokens is None:
+            completion_tokens = _estimate_tokens(content)
+        token_usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+        if self.prefix_cache:
+            token_usage["prompt_tokens_details"] = {
+                "cached_tokens": min(prompt_tokens, self._lookup_prefix(messages))
+            }
+        message = AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            },
+            response_metadata={"model_name": self.model_name, "token_usage": token_usage}
+        )
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"token_usage": token_usage, "model_name": self.model_name}
+        )
+
+    def _lookup_prefix(self, messages: List[BaseMessage]) -> int:
+        """按块查找已出现过的最长前缀，返回其 token 数，并登记本次请求的所有前缀块"""
+        text = "".join(f"{m.type}:{m.content}\n" for m in messages)
+        block = max(1, self.prefix_cache_block)
+        digest = hashlib.sha256()
+        cached_chars = 0
+        for end in range(block, len(text) + 1, block):
+            digest.update(text[end - block:end].encode("utf-8"))
+            key = digest.copy().hexdigest()
+            if key in self._seen_prefixes:
+                cached_chars = end
+            else:
+                self._seen_prefixes.add(key)
+        return _estimate_tokens(text[:cached_chars]) if cached_chars else 0
+
+    # ------------------------------------------------------------------
+    # 规则决策
+    # ------------------------------------------------------------------
+
+    def _respond(self, messages: List[BaseMessage], rng: random.Random) -> str:
+        system_text = "\n".join(str(m.content) for m in messages if isinstance(m, SystemMessage))
+        user_text = "\n".join(str(m.content) for m in messages if not isinstance(m, SystemMessage))
+
+        alive = _parse_player_line(user_text, "当前存活的玩家")
+
+        # 批量决策：为每名玩家分别决策，回复 JSON 数组
+        members = _parse_player_line(user_text, "需要决策的玩家")
+        if members:
+            results = []
+            for member in members:
+                decision = self._decide(user_text, member, alive, rng)
+                results.append({"player": member, **decision})
+            return json.dumps(results, ensure_ascii=False) + self.trailing_commentary
+
+        name_match = re.search(r"你是玩家 (\S+?)。", system_text)
+        me = name_match.group(1) if name_match else ""
+        decision = self._decide(user_text, me, alive, rng)
+        if "紧凑 JSON" in user_text:
+            # 提示词要求紧凑输出时使用短键名
+            decision = {_SHORT_KEYS.get(k, k): v for k, v in decision.items()}
+            return json.dumps(decision, ensure_ascii=False, separators=(",", ":")) + self.trailing_commentary
+        return json.dumps(decision, ensure_ascii=False) + self.trailing_commentary
+
+    def _decide(self, user_text: str, me: str, alive: List[str], rng: random.Random) -> Dict:
+        """为一名玩家做出当前阶段的决策"""
+        others = [p for p in alive if p != me] or alive
+
+        if "狼人行动时间" in user_text:
+            villagers = _parse_player_line(user_text, "存活的村民")
+            candidates = villagers or others
+            result = {
+                "target": rng.choice(candidates) if candidates else None,
+                "reasoning": "规则选择：随机选择一名存活村民"
+            }
+        elif "投票环节" in user_text:
+            result = {
+                "vote": self._pick_most_mentioned(user_text, others, rng),
+                "reasoning": "规则选择：投给发言中被提及最多的玩家"
+            }
+        elif "发言环节" in user_text:
+            suspicion = rng.choice(others) if others else None
+            result = {
+                "speech": f"我觉得 {suspicion} 的表现有些可疑，大家可以多关注一下。",
+                "suspicion": suspicion,
+                "reasoning": "规则选择：随机怀疑一名其他玩家"
+            }
+        else:
+            result = {"reasoning": "无法识别的阶段"}
+
+        return result
+
+    @staticmethod
+    def _pick_most_mentioned(text: str, candidates: List[str], rng: random.Random) -> Optional[str]:
+        """选择发言记录中被提及最多的候选人，平局随机"""
+        if not candidates:
+            return None
+        speech_section = text.split("本轮发言记录", 1)[-1].split("\n\n", 1)[0]
+        counts = {p: speech_section.count(p) for p in candidates}
+        best = max(counts.values())
+        if best == 0:
+            return rng.choice(candidates)
+        return rng.choice([p for p, c in counts.items() if c == best])
+
+
+def _parse_player_line(text: str, label: str) -> List[str]:
+    """解析形如 “当前存活的玩家：A, B, C” 的行"""
+    match = re.search(rf"{label}：(.+)", text)
+    if not match:
+        return []
+    players = [p.strip() for p in match.group(1).split(",")]
+    return [p for p in players if p and p != "无"]
+
+
+def _estimate_tokens(text: str) -> int:
+    """粗略估算 token 数（中文约 1 字 1 token，英文约 4 字符 1 token）"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return max(1, (len(text) - ascii_chars) + ascii_chars // 4)
+
+
+class HashEmbeddings(Embeddings):
+    """
+    基于特征哈希的确定性嵌入模型
+
+    将字符 n-gram 哈希到固定维度并归一化，文本越相似向量越接近
+    """
+
+    def __init__(self, dimension: int = 1536, ngram_range: tuple = (1, 3), seed: int = 0):
+        """
+        初始化哈希嵌入
+
+        Args:
+            dimension: 向量维度（默认与 OpenAI embeddings 一致）
+            ngram_range: 字符 n-gram 的长度范围
+            seed: 哈希种子
+        """
+        self.dimension = dimension
+        self.ngram_range = ngram_range
+        self.seed = seed
+        self._salt = str(seed).encode("utf-8")
+
+    def embed_query(self, text: str) -> List[float]:
+        """生成单条文本的嵌入"""
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        min_n, max_n = self.ngram_range
+        for n in range(min_n, max_n + 1):
+            for i in range(len(text) - n + 1):
+                digest = hashlib.blake2b(
+                    text[i:i + n].encode("utf-8"),
+                    digest_size=8,
+                    key=self._salt
+                ).digest()
+                value = int.from_bytes(digest, "big")
+                index = value % self.dimension
+                sign = 1.0 if (value >> 63) & 1 else -1.0
+                vector[index] += sign
+
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """生成多条文本的嵌入"""
+        return [self.embed_query(text) for text in texts]
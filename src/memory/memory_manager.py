@@ -3,7 +3,7 @@
 实现跨轮次的记忆存储和语义记忆召回
 """
 
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 from .vector_store import VectorStore
 
 
@@ -55,18 +55,24 @@ class MemoryManager:
         else:
             return f"第{round_num}轮，{player}：{content}"
     
-    def retrieve_semantic_memory(self, query: str, top_k: int = 5) -> List[Dict]:
+    def retrieve_semantic_memory(
+        self,
+        query: str,
+        top_k: int = 5,
+        metadata_filter: Optional[Callable[[Dict], bool]] = None
+    ) -> List[Dict]:
         """
         检索语义记忆（使用向量搜索）
         
         Args:
             query: 查询文本
             top_k: 返回前 K 条结果
+            metadata_filter: 元数据过滤条件（可选，如只检索之前轮次的记忆）
             
         Returns:
             相关记忆列表
         """
-        return self.vector_store.search(query, top_k=top_k)
+        return self.vector_store.search(query, top_k=top_k, metadata_filter=metadata_filter)
     
     def get_recent_episodic_memory(self, rounds: int = 3) -> List[Dict]:
         """
@@ -109,6 +115,18 @@ class MemoryManager:
         """获取所有情景记忆"""
         return self.episodic_memory
     
+    def snapshot(self) -> Dict:
+        """导出情景记忆和向量存储（用于检查点，恢复时不需要重新生成嵌入）"""
+        return {
+            "episodic_memory": list(self.episodic_memory),
+            "vector_store": self.vector_store.snapshot()
+        }
+    
+    def restore(self, data: Dict):
+        """从 snapshot 导出的数据恢复记忆"""
+        self.episodic_memory = list(data.get("episodic_memory", []))
+        self.vector_store.restore(data.get("vector_store", {}))
+    
     def clear(self):
         """清空记忆（新一局游戏）"""
         self.episodic_memory = []
@@ -3,9 +3,11 @@
 支持 FAISS（本地）和 Milvus（可选）
 """
 
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 import os
 import json
+import threading
+import time
 import numpy as np
 
 try:
@@ -20,7 +22,12 @@ try:
 except ImportError:
     MILVUS_AVAILABLE = False
 
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.embeddings import Embeddings
+
+from ..llm.client_pool import ClientPool, get_client_pool
+from ..llm.rate_limiter import RateLimitedEmbeddings, RateLimiter
+from ..utils.cost_tracker import CostTracker
+from ..utils.prompt_budget import count_tokens
 
 
 class VectorStore:
@@ -33,7 +40,11 @@ class VectorStore:
         api_key: Optional[str] = None,
         milvus_host: str = "localhost",
         milvus_port: int = 19530,
-        collection_name: str = "werewolf_memory"
+        collection_name: str = "werewolf_memory",
+        embeddings: Optional[Embeddings] = None,
+        client_pool: Optional[ClientPool] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        cost_tracker: Optional[CostTracker] = None
     ):
         """
         初始化向量存储
@@ -45,15 +56,25 @@ class VectorStore:
             milvus_host: Milvus 主机地址
             milvus_port: Milvus 端口
             collection_name: Milvus 集合名称
+            embeddings: 嵌入模型实例（可选，如离线的 HashEmbeddings）
+            client_pool: LLM 客户端池（未提供 embeddings 时从中获取共享实例）
+            rate_limiter: 共享限流器（可选，嵌入调用与 LLM 调用共用配额）
+            cost_tracker: 成本追踪器（可选，记录每次嵌入调用的耗时和估算 token 数）
         """
         self.store_type = store_type
         self.embedding_model = embedding_model
+        self.cost_tracker = cost_tracker
         
         # 初始化嵌入模型
-        self.embeddings = OpenAIEmbeddings(
-            model=embedding_model,
-            openai_api_key=api_key
-        )
+        if embeddings is None:
+            self.embeddings = (client_pool or get_client_pool()).get_embeddings(
+                model=embedding_model,
+                api_key=api_key
+            )
+        else:
+            self.embeddings = embeddings
+        if rate_limiter is not None:
+            self.embeddings = RateLimitedEmbeddings(self.embeddings, rate_limiter)
         
         if store_type == "faiss":
             if not FAISS_AVAILABLE:
@@ -68,6 +89,9 @@ class VectorStore:
         
         # 存储元数据
         self.metadata_store: List[Dict] = []
+        
+        # 保护 FAISS 索引和元数据（流水线执行时检索和写入在不同线程；嵌入调用不持锁）
+        self._lock = threading.Lock()
     
     def _init_faiss(self):
         """初始化 FAISS 索引"""
@@ -95,6 +119,19 @@ class VectorStore:
         
         self.collection.load()
     
+    def _embed_query(self, text: str) -> List[float]:
+        """生成单条文本的嵌入，并向成本追踪器报告耗时"""
+        start = time.perf_counter()
+        embedding = self.embeddings.embed_query(text)
+        if self.cost_tracker:
+            self.cost_tracker.record_embedding(
+                model=self.embedding_model,
+                texts=1,
+                tokens=count_tokens(text),
+                latency=time.perf_counter() - start
+            )
+        return embedding
+    
     def add_memory(self, text: str, metadata: Dict):
         """
         添加记忆
@@ -104,15 +141,16 @@ class VectorStore:
             metadata: 元数据（包含 player, round, phase 等）
         """
         # 生成嵌入
-        embedding = self.embeddings.embed_query(text)
+        embedding = self._embed_query(text)
         embedding_array = np.array([embedding], dtype=np.float32)
         
         if self.store_type == "faiss":
-            self.index.add(embedding_array)
-            self.metadata_store.append({
-                "text": text,
-                "metadata": metadata
-            })
+            with self._lock:
+                self.index.add(embedding_array)
+                self.metadata_store.append({
+                    "text": text,
+                    "metadata": metadata
+                })
         elif self.store_type == "milvus":
             data = [{
                 "embedding": [embedding],
@@ -122,7 +160,13 @@ class VectorStore:
             self.collection.insert(data)
             self.collection.flush()
     
-    def search(self, query: str, top_k: int = 5, threshold: float = 0.7) -> List[Dict]:
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        threshold: float = 0.7,
+        metadata_filter: Optional[Callable[[Dict], bool]] = None
+    ) -> List[Dict]:
         """
         搜索相关记忆
         
@@ -130,33 +174,43 @@ class VectorStore:
             query: 查询文本
             top_k: 返回前 K 条结果
             threshold: 相似度阈值
+            metadata_filter: 元数据过滤条件（可选，在排序截断之前过滤，返回满足条件的前 K 条）
             
         Returns:
             相关记忆列表，包含 text 和 metadata
         """
         # 生成查询嵌入
-        query_embedding = self.embeddings.embed_query(query)
+        query_embedding = self._embed_query(query)
         query_array = np.array([query_embedding], dtype=np.float32)
         
         if self.store_type == "faiss":
-            # FAISS 搜索
-            k = min(top_k, self.index.ntotal) if self.index.ntotal > 0 else 0
-            if k == 0:
-                return []
-            
-            distances, indices = self.index.search(query_array, k)
+            with self._lock:
+                # FAISS 搜索（有过滤条件时对全部向量排序，Flat 索引本来就要计算所有距离）
+                ntotal = self.index.ntotal
+                k = ntotal if metadata_filter else min(top_k, ntotal)
+                if k == 0:
+                    return []
+                
+                distances, indices = self.index.search(query_array, k)
+                entries = [
+                    self.metadata_store[idx] if 0 <= idx < len(self.metadata_store) else None
+                    for idx in indices[0]
+                ]
             
             results = []
-            for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-                if idx < len(self.metadata_store):
-                    # 计算相似度（L2距离转换为相似度）
-                    similarity = 1 / (1 + distance)
-                    if similarity >= threshold:
-                        results.append({
-                            "text": self.metadata_store[idx]["text"],
-                            "metadata": self.metadata_store[idx]["metadata"],
-                            "similarity": similarity
-                        })
+            for distance, entry in zip(distances[0], entries):
+                if entry is None or (metadata_filter and not metadata_filter(entry["metadata"])):
+                    continue
+                # 计算相似度（L2距离转换为相似度）
+                similarity = 1 / (1 + distance)
+                if similarity >= threshold:
+                    results.append({
+                        "text": entry["text"],
+                        "metadata": entry["metadata"],
+                        "similarity": similarity
+                    })
+                    if len(results) >= top_k:
+                        break
             
             return results
         
@@ -167,22 +221,51 @@ class VectorStore:
                 data=[query_embedding],
                 anns_field="embedding",
                 param=search_params,
-                limit=top_k,
+                limit=top_k * 4 if metadata_filter else top_k,  # 元数据为 JSON 字符串，过滤时多取一些候选
                 output_fields=["text", "metadata"]
             )
             
             formatted_results = []
             for hits in results:
                 for hit in hits:
+                    metadata = json.loads(hit.entity.get("metadata", "{}"))
+                    if metadata_filter and not metadata_filter(metadata):
+                        continue
                     similarity = 1 / (1 + hit.distance)
                     if similarity >= threshold:
                         formatted_results.append({
                             "text": hit.entity.get("text"),
-                            "metadata": json.loads(hit.entity.get("metadata", "{}")),
+                            "metadata": metadata,
                             "similarity": similarity
                         })
             
-            return formatted_results
+            return formatted_results[:top_k]
+    
+    def snapshot(self) -> Dict:
+        """
+        导出 FAISS 索引中的向量和元数据（用于检查点）
+        
+        Milvus 集合由服务端持久化，只返回空字典
+        """
+        if self.store_type != "faiss":
+            return {}
+        with self._lock:
+            vectors = self.index.reconstruct_n(0, self.index.ntotal) if self.index.ntotal else np.zeros((0, self.dimension))
+            return {
+                "vectors": np.asarray(vectors, dtype=np.float32).tobytes(),
+                "metadata": list(self.metadata_store)
+            }
+    
+    def restore(self, data: Dict):
+        """从 snapshot 导出的数据重建 FAISS 索引（不调用嵌入模型）"""
+        if self.store_type != "faiss" or not data:
+            return
+        vectors = np.frombuffer(data["vectors"], dtype=np.float32).reshape(-1, self.dimension)
+        with self._lock:
+            self.index.reset()
+            if len(vectors):
+                self.index.add(vectors)
+            self.metadata_store = list(data["metadata"])
     
     def save(self, filepath: str):
         """保存 FAISS 索引到文件"""
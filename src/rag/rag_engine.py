@@ -5,19 +5,22 @@ RAG 增强推理引擎
 
 from typing import List, Dict, Optional
 from ..memory.memory_manager import MemoryManager
+from ..utils.prompt_budget import PromptAssembler
 
 
 class RAGEngine:
     """RAG 增强推理引擎"""
     
-    def __init__(self, memory_manager: MemoryManager):
+    def __init__(self, memory_manager: MemoryManager, prompt_assembler: Optional[PromptAssembler] = None):
         """
         初始化 RAG 引擎
         
         Args:
             memory_manager: 记忆管理器实例
+            prompt_assembler: 提示词 token 预算（可选，按 discussion 阶段的 rag 预算裁剪检索结果）
         """
         self.memory_manager = memory_manager
+        self.prompt_assembler = prompt_assembler
     
     def retrieve_relevant_speeches(
         self,
@@ -41,32 +44,37 @@ class RAGEngine:
         # 构建查询
         search_query = f"{query} 历史发言 怀疑 证据"
         
-        # 检索语义记忆
-        relevant_memories = self.memory_manager.retrieve_semantic_memory(
+        # 检索语义记忆：在排序前过滤掉当前玩家的发言和当前轮次的记忆，
+        # 检索结果不受本轮新写入的记忆影响（发言流水线可以提前检索）
+        filtered_memories = self.memory_manager.retrieve_semantic_memory(
             search_query,
-            top_k=top_k
+            top_k=top_k,
+            metadata_filter=lambda metadata: (
+                metadata.get("player") != current_player
+                and metadata.get("round", 0) < current_round
+            )
         )
         
-        # 过滤掉当前玩家的发言和当前轮次的发言
-        filtered_memories = [
-            m for m in relevant_memories
-            if m.get("metadata", {}).get("player") != current_player
-            and m.get("metadata", {}).get("round", 0) < current_round
-        ]
-        
         if not filtered_memories:
             return "暂无相关历史发言。"
         
-        # 格式化输出
-        context = "相关历史发言：\n"
-        for i, memory in enumerate(filtered_memories[:top_k], 1):
+        # 格式化输出（按相似度从高到低，超出预算时丢弃相似度最低的条目）
+        lines = []
+        for memory in filtered_memories[:top_k]:
             metadata = memory.get("metadata", {})
             player = metadata.get("player", "未知")
             round_num = metadata.get("round", 0)
             text = memory.get("text", "")
             similarity = memory.get("similarity", 0)
             
-            context += f"{i}. [第{round_num}轮] {player}: {text} (相似度: {similarity:.2f})\n"
+            lines.append(f"[第{round_num}轮] {player}: {text} (相似度: {similarity:.2f})")
+        
+        if self.prompt_assembler:
+            lines = self.prompt_assembler.fit_section("discussion", "rag", lines)
+        
+        context = "相关历史发言：\n"
+        for i, line in enumerate(lines, 1):
+            context += f"{i}. {line}\n"
         
         return context
     
@@ -2,7 +2,9 @@
 工具模块
 """
 
+from .config import load_config
 from .cost_tracker import CostTracker
 from .helpers import format_game_log, save_game_log
+from .prompt_budget import PromptAssembler, count_tokens
 
-__all__ = ["CostTracker", "format_game_log", "save_game_log"]
+__all__ = ["CostTracker", "format_game_log", "save_game_log", "PromptAssembler", "count_tokens", "load_config"]
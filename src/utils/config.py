@@ -0,0 +1,73 @@
+"""
+配置加载
+读取 config/game_config.yaml，供运行脚本和 GameFlow 使用
+"""
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import yaml
+
+
+# 仓库自带的默认配置文件
+DEFAULT_CONFIG_PATH = Path(__file__).resolve().parents[2] / "config" / "game_config.yaml"
+
+# 未配置玩家名称时使用的默认名单
+DEFAULT_PLAYER_NAMES = ["Alice", "Bob", "Charlie", "David", "Eve"]
+
+
+def load_config(path: Optional[Union[str, Path]] = None) -> Dict[str, Any]:
+    """
+    加载 YAML 配置
+
+    Args:
+        path: 配置文件路径（None 使用 config/game_config.yaml）
+
+    Returns:
+        配置字典；未指定路径且默认配置文件不存在时返回空字典
+
+    Raises:
+        FileNotFoundError: 指定的配置文件不存在
+    """
+    if path is None:
+        if not DEFAULT_CONFIG_PATH.exists():
+            return {}
+        path = DEFAULT_CONFIG_PATH
+
+    with open(path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+    if not isinstance(config, dict):
+        raise ValueError(f"Config file must contain a mapping: {path}")
+    return config
+
+
+def get_player_setup(config: Dict[str, Any]) -> Tuple[List[str], int]:
+    """
+    读取 game.players 配置段的玩家名单和狼人数量
+
+    names 未配置时使用默认名单；名单不足 total 人时其余玩家依次命名为 P{座位号}
+
+    Args:
+        config: load_config 返回的完整配置
+
+    Returns:
+        (玩家名称列表, 狼人数量)
+
+    Raises:
+        ValueError: 人数配置不一致（villagers + werewolves 与 total 不符，或名单多于 total）
+    """
+    players_config = (config.get("game") or {}).get("players") or {}
+    names = list(players_config.get("names") or DEFAULT_PLAYER_NAMES)
+    total = players_config.get("total", len(names))
+    num_werewolves = players_config.get("werewolves", 2)
+    villagers = players_config.get("villagers")
+    if villagers is not None and villagers + num_werewolves != total:
+        raise ValueError(
+            f"game.players: villagers ({villagers}) + werewolves ({num_werewolves}) must equal total ({total})"
+        )
+    if "names" in players_config and len(names) > total:
+        raise ValueError(f"game.players: {len(names)} names configured for {total} players")
+
+    names = names[:total]
+    names += [f"P{seat}" for seat in range(len(names) + 1, total + 1)]
+    return names, num_werewolves
@@ -1,10 +1,16 @@
 """
 成本追踪器
-统计总调用 token 数、平均响应延迟、GPU 资源预估
+统计总调用 token 数、平均响应延迟（单调时钟）、首 token 时间、嵌入调用耗时、GPU 资源预估；
+每条记录带有阶段、Agent、轮次和对局 ID 标签。
+所有统计在记录时增量累加（总体、按模型 / 路由 / 阶段 / Agent），延迟用对数分桶直方图估算分位数，
+摘要的计算量与调用次数无关；原始记录可选保留（列表或按列的紧凑数组）
 """
 
+import math
+import threading
 import time
-from typing import Dict, List, Optional
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime
 
@@ -18,153 +24,820 @@ class CallRecord:
     completion_tokens: int
     total_tokens: int
     latency: float  # 响应延迟（秒）
+    cached_tokens: int = 0  # 命中服务端提示词前缀缓存的 prompt token 数
+    phase: Optional[str] = None
+    agent: Optional[str] = None
+    route: Optional[str] = None  # 模型路由名
+    ttft: Optional[float] = None  # 首 token 时间（秒，仅流式调用）
+    token_source: str = "provider"  # token 数来源：provider（服务端报告）或 estimate（tiktoken 估算）
+    round_num: Optional[int] = None
+    game_id: Optional[str] = None
 
 
-class CostTracker:
-    """成本追踪器"""
-    
+@dataclass
+class EmbeddingRecord:
+    """嵌入调用记录"""
+    timestamp: float
+    model: str
+    texts: int  # 本次嵌入的文本条数
+    tokens: int  # 估算的输入 token 数
+    latency: float  # 耗时（秒）
+    round_num: Optional[int] = None
+    game_id: Optional[str] = None
+
+
+class LatencyHistogram:
+    """
+    对数分桶的延迟直方图
+    桶边界按固定倍率增长，分位数的相对误差不超过约 (growth - 1) / 2；
+    只保存非空桶的计数，可直接相加合并
+    """
+
+    def __init__(self, growth: float = 1.05, min_value: float = 1e-4):
+        """
+        初始化直方图
+
+        Args:
+            growth: 相邻桶边界的倍率（越接近 1 越精确，桶越多）
+            min_value: 最小可区分的值（秒），更小的值都落入第 0 个桶
+        """
+        if growth <= 1:
+            raise ValueError("growth must be greater than 1")
+        self.growth = growth
+        self.min_value = min_value
+        self._log_growth = math.log(growth)
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def _index(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        return int(math.log(value / self.min_value) / self._log_growth) + 1
+
+    def _value(self, index: int) -> float:
+        """桶的代表值（上下边界的几何中点）"""
+        if index == 0:
+            return self.min_value
+        return self.min_value * self.growth ** (index - 0.5)
+
+    def add(self, value: float):
+        """加入一个样本"""
+        index = self._index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram"):
+        """合并另一个直方图（分桶参数必须相同）"""
+        if (other.growth, other.min_value) != (self.growth, self.min_value):
+            raise ValueError("Cannot merge histograms with different bucket layouts")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, quantile: float) -> float:
+        """估算分位数（没有样本时返回 0）"""
+        if not self.count:
+            return 0.0
+        rank = min(self.count - 1, int(quantile * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return min(max(self._value(index), self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def to_state(self) -> Dict[str, Any]:
+        """导出完整的分桶数据（可写入 JSON，用 from_state 还原后继续合并）"""
+        return {
+            "growth": self.growth,
+            "min_value": self.min_value,
+            "buckets": {str(index): count for index, count in self.buckets.items()},
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "LatencyHistogram":
+        """从 to_state 导出的数据还原直方图"""
+        histogram = cls(growth=state["growth"], min_value=state["min_value"])
+        histogram.buckets = {int(index): count for index, count in state["buckets"].items()}
+        histogram.count = state["count"]
+        histogram.total = state["total"]
+        histogram.min = state["min"]
+        histogram.max = state["max"]
+        return histogram
+
+    def to_dict(self) -> Dict[str, float]:
+        """摘要：次数、均值、p50 / p90 / p95 / p99 和最大值"""
+        return {
+            "count": self.count,
+            "average": self.mean,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max or 0.0
+        }
+
+
+class UsageAggregate:
+    """一组调用的增量统计（调用次数、token、延迟直方图）"""
+
     def __init__(self):
-        self.records: List[CallRecord] = []
-        self.start_time: Optional[float] = None
-    
+        self.calls = 0
+        self.total_tokens = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.estimated_token_calls = 0
+        self.latency = LatencyHistogram()  # 只统计延迟大于 0 的调用
+        self.ttft = LatencyHistogram()
+        self.models: Dict[str, int] = {}  # {模型: 调用次数}
+
+    def add(self, record: CallRecord):
+        """累加一条调用记录"""
+        self.calls += 1
+        self.total_tokens += record.total_tokens
+        self.prompt_tokens += record.prompt_tokens
+        self.completion_tokens += record.completion_tokens
+        self.cached_tokens += record.cached_tokens
+        if record.token_source == "estimate":
+            self.estimated_token_calls += 1
+        if record.latency > 0:
+            self.latency.add(record.latency)
+        if record.ttft is not None:
+            self.ttft.add(record.ttft)
+        self.models[record.model] = self.models.get(record.model, 0) + 1
+
+    def merge(self, other: "UsageAggregate"):
+        """合并另一组统计"""
+        self.calls += other.calls
+        self.total_tokens += other.total_tokens
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.cached_tokens += other.cached_tokens
+        self.estimated_token_calls += other.estimated_token_calls
+        self.latency.merge(other.latency)
+        self.ttft.merge(other.ttft)
+        for model, calls in other.models.items():
+            self.models[model] = self.models.get(model, 0) + calls
+
+    def usage(self) -> Dict:
+        """调用次数、token 和平均延迟"""
+        return {
+            "calls": self.calls,
+            "total_tokens": self.total_tokens,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "average_latency": self.latency.mean,
+            "latency": self.latency.to_dict()
+        }
+
+    def prompt_cache(self) -> Dict:
+        """提示词前缀缓存命中情况"""
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "uncached_tokens": self.prompt_tokens - self.cached_tokens,
+            "hit_ratio": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+        }
+
+
+class ColumnarRecords:
+    """
+    按列保存的调用记录
+    数值列使用 array，字符串标签（模型、阶段、Agent 等）编码为整数，
+    每条记录约占 80 字节，远小于 CallRecord 对象
+    """
+
+    _FLOAT_COLUMNS = ("timestamp", "latency", "ttft")
+    _INT_COLUMNS = ("prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens", "round_num")
+    _LABEL_COLUMNS = ("model", "phase", "agent", "route", "token_source", "game_id")
+
+    def __init__(self):
+        self.columns: Dict[str, array] = {}
+        for name in self._FLOAT_COLUMNS:
+            self.columns[name] = array("d")
+        for name in self._INT_COLUMNS + self._LABEL_COLUMNS:
+            self.columns[name] = array("q")
+        # 标签编码：0 表示 None
+        self.labels: List[Optional[str]] = [None]
+        self._label_ids: Dict[Optional[str], int] = {None: 0}
+
+    def _encode(self, label: Optional[str]) -> int:
+        code = self._label_ids.get(label)
+        if code is None:
+            code = len(self.labels)
+            self.labels.append(label)
+            self._label_ids[label] = code
+        return code
+
+    def append(self, record: CallRecord):
+        """追加一条记录（None 的数值字段编码为 NaN / -1）"""
+        columns = self.columns
+        columns["timestamp"].append(record.timestamp)
+        columns["latency"].append(record.latency)
+        columns["ttft"].append(math.nan if record.ttft is None else record.ttft)
+        columns["prompt_tokens"].append(record.prompt_tokens)
+        columns["completion_tokens"].append(record.completion_tokens)
+        columns["total_tokens"].append(record.total_tokens)
+        columns["cached_tokens"].append(record.cached_tokens)
+        columns["round_num"].append(-1 if record.round_num is None else record.round_num)
+        for name in self._LABEL_COLUMNS:
+            columns[name].append(self._encode(getattr(record, name)))
+
+    def extend(self, records):
+        """追加多条记录"""
+        for record in records:
+            self.append(record)
+
+    def row(self, index: int) -> CallRecord:
+        """还原第 index 条记录"""
+        columns = self.columns
+        ttft = columns["ttft"][index]
+        round_num = columns["round_num"][index]
+        labels = {name: self.labels[columns[name][index]] for name in self._LABEL_COLUMNS}
+        return CallRecord(
+            timestamp=columns["timestamp"][index],
+            prompt_tokens=columns["prompt_tokens"][index],
+            completion_tokens=columns["completion_tokens"][index],
+            total_tokens=columns["total_tokens"][index],
+            latency=columns["latency"][index],
+            cached_tokens=columns["cached_tokens"][index],
+            ttft=None if math.isnan(ttft) else ttft,
+            round_num=None if round_num < 0 else round_num,
+            **labels
+        )
+
+    def to_dict(self) -> Dict[str, List[Any]]:
+        """解码为 {列名: 值列表}（可直接构造 pandas.DataFrame）"""
+        data: Dict[str, List[Any]] = {}
+        for name in self._FLOAT_COLUMNS + self._INT_COLUMNS:
+            data[name] = self.columns[name].tolist()
+        for name in self._LABEL_COLUMNS:
+            data[name] = [self.labels[code] for code in self.columns[name]]
+        return data
+
+    def __len__(self) -> int:
+        return len(self.columns["timestamp"])
+
+    def __iter__(self) -> Iterator[CallRecord]:
+        for index in range(len(self)):
+            yield self.row(index)
+
+
+class CostTracker:
+    """成本追踪器（线程安全，可合并其他进程的追踪器）"""
+
+    RETAIN_MODES = ("list", "columnar", None)
+
+    def __init__(self, game_id: Optional[str] = None, retain_records: Optional[str] = "list"):
+        """
+        初始化成本追踪器
+
+        Args:
+            game_id: 对局 ID（写入每条记录）
+            retain_records: 原始调用记录的保留方式：
+                "list"（CallRecord 列表）、"columnar"（按列的紧凑数组）或 None（只保留统计）。
+                统计和摘要不依赖原始记录，长时间运行的批量对局建议使用 None 或 "columnar"
+        """
+        if retain_records not in self.RETAIN_MODES:
+            raise ValueError(f"Unsupported retain_records: {retain_records}")
+        self.game_id = game_id
+        self.retain_records = retain_records
+        self._lock = threading.RLock()
+        self.reset()
+
+    def __getstate__(self) -> Dict:
+        # 锁不能序列化（进程池返回追踪器时需要 pickle）
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    @property
+    def records(self) -> List[CallRecord]:
+        """保留的调用记录（retain_records 为 None 时为空列表）"""
+        with self._lock:
+            return list(self._records) if self._records is not None else []
+
+    @property
+    def columns(self) -> Optional[ColumnarRecords]:
+        """按列保存的调用记录（仅 retain_records 为 "columnar" 时）"""
+        return self._records if self.retain_records == "columnar" else None
+
     def record_call(
         self,
         model: str,
         tokens: int,
         prompt_tokens: int,
         completion_tokens: int,
-        latency: Optional[float] = None
+        latency: Optional[float] = None,
+        cached_tokens: int = 0,
+        phase: Optional[str] = None,
+        agent: Optional[str] = None,
+        route: Optional[str] = None,
+        ttft: Optional[float] = None,
+        token_source: str = "provider",
+        round_num: Optional[int] = None,
+        game_id: Optional[str] = None
     ):
         """
         记录 API 调用
-        
+
         Args:
             model: 模型名称
             tokens: 总 token 数
             prompt_tokens: Prompt token 数
             completion_tokens: Completion token 数
             latency: 响应延迟（秒）
+            cached_tokens: 命中提示词前缀缓存的 prompt token 数
+            phase: 调用所属阶段
+            agent: 发起调用的 Agent 名称
+            route: 模型路由名
+            ttft: 首 token 时间（秒，流式调用）
+            token_source: token 数来源（provider / estimate）
+            round_num: 轮次（默认为当前轮次）
+            game_id: 对局 ID（默认为追踪器的对局 ID）
         """
-        if self.start_time is None:
-            self.start_time = time.time()
-        
         record = CallRecord(
             timestamp=time.time(),
             model=model,
             prompt_tokens=prompt_tokens,
             completion_tokens=completion_tokens,
             total_tokens=tokens,
-            latency=latency or 0.0
+            latency=latency or 0.0,
+            cached_tokens=cached_tokens,
+            phase=phase,
+            agent=agent,
+            route=route,
+            ttft=ttft,
+            token_source=token_source,
+            round_num=round_num if round_num is not None else self.current_round,
+            game_id=game_id or self.game_id
         )
-        self.records.append(record)
-    
+        with self._lock:
+            if self.start_time is None:
+                self.start_time = record.timestamp
+            self._aggregate(record)
+            if self._records is not None:
+                self._records.append(record)
+
+    def _aggregate(self, record: CallRecord):
+        """把一条记录累加到总体和各维度的统计中"""
+        self.totals.add(record)
+        route = record.route or "default"
+        for groups, key in (
+            (self.by_model, record.model),
+            (self.by_route, route),
+            (self.by_model_route, (record.model, route)),
+            (self.by_phase, record.phase or "unknown"),
+            (self.by_agent, record.agent or "unknown")
+        ):
+            aggregate = groups.get(key)
+            if aggregate is None:
+                aggregate = groups[key] = UsageAggregate()
+            aggregate.add(record)
+
+    def set_round(self, round_num: int):
+        """设置当前轮次（之后的记录都带上该轮次）"""
+        self.current_round = round_num
+
+    def record_embedding(self, model: str, texts: int, tokens: int, latency: float):
+        """
+        记录一次嵌入调用
+
+        Args:
+            model: 嵌入模型名称
+            texts: 文本条数
+            tokens: 估算的输入 token 数
+            latency: 耗时（秒）
+        """
+        with self._lock:
+            if self.start_time is None:
+                self.start_time = time.time()
+            self.embedding_calls += 1
+            self.embedding_texts += texts
+            self.embedding_tokens += tokens
+            self.embedding_latency.add(latency)
+            if self.retain_records is not None:
+                self.embedding_records.append(EmbeddingRecord(
+                    timestamp=time.time(),
+                    model=model,
+                    texts=texts,
+                    tokens=tokens,
+                    latency=latency,
+                    round_num=self.current_round,
+                    game_id=self.game_id
+                ))
+
+    def get_embedding_stats(self) -> Dict:
+        """获取嵌入调用统计"""
+        with self._lock:
+            return {
+                "calls": self.embedding_calls,
+                "texts": self.embedding_texts,
+                "tokens": self.embedding_tokens,
+                "total_latency": self.embedding_latency.total,
+                "average_latency": self.embedding_latency.mean,
+                "latency": self.embedding_latency.to_dict()
+            }
+
+    def get_latency_stats(self) -> Dict:
+        """获取 LLM 调用的延迟统计（平均值、直方图估算的分位数、流式调用的平均首 token 时间）"""
+        with self._lock:
+            latency = self.totals.latency
+            ttft = self.totals.ttft
+            return {
+                "average": latency.mean,
+                "p50": latency.percentile(0.5),
+                "p90": latency.percentile(0.9),
+                "p95": latency.percentile(0.95),
+                "p99": latency.percentile(0.99),
+                "max": latency.max or 0.0,
+                "average_ttft": ttft.mean if ttft.count else None,
+                "estimated_token_calls": self.totals.estimated_token_calls,
+                "by_phase": {phase: agg.latency.to_dict() for phase, agg in self.by_phase.items()},
+                "by_agent": {agent: agg.latency.to_dict() for agent, agg in self.by_agent.items()}
+            }
+
+    def record_cache_hit(self, model: str, source: str, saved_tokens: int = 0):
+        """
+        记录一次响应缓存命中
+
+        Args:
+            model: 模型名称
+            source: 命中来源（memory / disk / coalesced）
+            saved_tokens: 本次命中节省的 token 数
+        """
+        with self._lock:
+            self.cache_hits[source] = self.cache_hits.get(source, 0) + 1
+            self.cache_saved_tokens += saved_tokens
+
+    def record_cache_miss(self, model: str):
+        """记录一次响应缓存未命中（随后会有一次真实调用）"""
+        with self._lock:
+            self.cache_misses += 1
+
+    def record_stream(
+        self,
+        model: str,
+        ttft: Optional[float],
+        time_to_decision: float,
+        stopped_early: bool
+    ):
+        """
+        记录一次流式调用
+
+        Args:
+            model: 模型名称
+            ttft: 首 token 时间（秒），没有收到内容时为 None
+            time_to_decision: 从请求开始到 JSON 决策完整的时间（秒）
+            stopped_early: 是否在 JSON 闭合后提前终止了生成
+        """
+        with self._lock:
+            if ttft is not None:
+                self.stream_ttfts.add(ttft)
+            self.stream_decision_times.add(time_to_decision)
+            if stopped_early:
+                self.stream_early_stops += 1
+
+    def get_stream_stats(self) -> Dict:
+        """获取流式调用统计"""
+        with self._lock:
+            return {
+                "calls": self.stream_decision_times.count,
+                "average_ttft": self.stream_ttfts.mean,
+                "average_time_to_decision": self.stream_decision_times.mean,
+                "ttft": self.stream_ttfts.to_dict(),
+                "early_stops": self.stream_early_stops
+            }
+
+    def record_parse(self, phase: str, ok: bool, repaired: bool, reasks: int = 0, fallback: bool = False):
+        """
+        记录一次决策解析
+
+        Args:
+            phase: 阶段
+            ok: 最终是否得到有效决策
+            repaired: 是否经过了本地修复（代码块、尾逗号、名称模糊匹配等）
+            reasks: 重新询问的次数
+            fallback: 是否因 LLM 调用失败（重试耗尽）而使用了兜底决策
+        """
+        with self._lock:
+            stats = self.parse_stats.setdefault(phase, {
+                "attempts": 0,
+                "success": 0,
+                "repaired": 0,
+                "reasks": 0,
+                "failures": 0,
+                "fallbacks": 0
+            })
+            stats["attempts"] += 1
+            if fallback:
+                stats["fallbacks"] += 1
+            stats["reasks"] += reasks
+            if ok:
+                stats["success"] += 1
+                if repaired:
+                    stats["repaired"] += 1
+            else:
+                stats["failures"] += 1
+
+    def record_escalation(self, phase: str, from_route: str, to_route: str):
+        """记录一次级联升级（便宜模型的结果不可用，改用更强的模型）"""
+        key = f"{from_route}->{to_route}"
+        with self._lock:
+            stats = self.escalations.setdefault(phase, {})
+            stats[key] = stats.get(key, 0) + 1
+
+    def get_parse_stats(self) -> Dict[str, Dict]:
+        """获取各阶段的解析统计（含成功率）"""
+        result = {}
+        with self._lock:
+            for phase, stats in self.parse_stats.items():
+                result[phase] = {
+                    **stats,
+                    "success_rate": stats["success"] / stats["attempts"] if stats["attempts"] else 0.0
+                }
+        return result
+
+    def get_cache_stats(self) -> Dict:
+        """获取响应缓存统计"""
+        with self._lock:
+            hits = sum(self.cache_hits.values())
+            lookups = hits + self.cache_misses
+            return {
+                "hits": hits,
+                "misses": self.cache_misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "hits_by_source": dict(self.cache_hits),
+                "saved_tokens": self.cache_saved_tokens
+            }
+
+    def get_prompt_cache_stats(self) -> Dict:
+        """获取提示词前缀缓存统计（总体、按阶段、按 Agent 的命中率）"""
+        with self._lock:
+            return {
+                **self.totals.prompt_cache(),
+                "by_phase": {phase: agg.prompt_cache() for phase, agg in self.by_phase.items()},
+                "by_agent": {agent: agg.prompt_cache() for agent, agg in self.by_agent.items()}
+            }
+
     def get_total_tokens(self) -> int:
         """获取总 token 数"""
-        return sum(r.total_tokens for r in self.records)
-    
+        return self.totals.total_tokens
+
     def get_prompt_tokens(self) -> int:
         """获取总 prompt token 数"""
-        return sum(r.prompt_tokens for r in self.records)
-    
+        return self.totals.prompt_tokens
+
     def get_completion_tokens(self) -> int:
         """获取总 completion token 数"""
-        return sum(r.completion_tokens for r in self.records)
-    
+        return self.totals.completion_tokens
+
     def get_average_latency(self) -> float:
         """获取平均响应延迟"""
-        if not self.records:
-            return 0.0
-        
-        latencies = [r.latency for r in self.records if r.latency > 0]
-        if not latencies:
-            return 0.0
-        
-        return sum(latencies) / len(latencies)
-    
+        return self.totals.latency.mean
+
     def get_total_time(self) -> float:
         """获取总运行时间"""
         if self.start_time is None:
             return 0.0
         return time.time() - self.start_time
-    
+
     def get_model_usage(self) -> Dict[str, Dict]:
-        """获取各模型的使用统计"""
-        model_stats = {}
-        
-        for record in self.records:
-            if record.model not in model_stats:
-                model_stats[record.model] = {
-                    "calls": 0,
-                    "total_tokens": 0,
-                    "prompt_tokens": 0,
-                    "completion_tokens": 0
-                }
-            
-            stats = model_stats[record.model]
-            stats["calls"] += 1
-            stats["total_tokens"] += record.total_tokens
-            stats["prompt_tokens"] += record.prompt_tokens
-            stats["completion_tokens"] += record.completion_tokens
-        
+        """获取各模型的使用统计（含按模型路由细分的调用、token 和延迟）"""
+        with self._lock:
+            model_stats = {model: {**agg.usage(), "routes": {}} for model, agg in self.by_model.items()}
+            for (model, route), agg in self.by_model_route.items():
+                model_stats[model]["routes"][route] = agg.usage()
         return model_stats
-    
+
+    def get_route_usage(self) -> Dict[str, Dict]:
+        """获取各模型路由的使用统计（调用、token、延迟和使用过的模型）"""
+        with self._lock:
+            return {
+                route: {**agg.usage(), "models": sorted(agg.models)}
+                for route, agg in self.by_route.items()
+            }
+
+    def get_phase_usage(self) -> Dict[str, Dict]:
+        """获取各阶段的使用统计"""
+        with self._lock:
+            return {phase: agg.usage() for phase, agg in self.by_phase.items()}
+
+    def get_agent_usage(self) -> Dict[str, Dict]:
+        """获取各 Agent 的使用统计"""
+        with self._lock:
+            return {agent: agg.usage() for agent, agg in self.by_agent.items()}
+
+    def estimate_route_cost(self, price_per_1k_tokens: Dict[str, float]) -> Dict[str, float]:
+        """
+        按模型路由估算成本
+
+        Args:
+            price_per_1k_tokens: {model: price_per_1k_tokens}
+
+        Returns:
+            各路由的成本估算
+        """
+        costs: Dict[str, float] = {}
+        with self._lock:
+            for (model, route), agg in self.by_model_route.items():
+                price = price_per_1k_tokens.get(model, 0.0)
+                costs[route] = costs.get(route, 0.0) + agg.total_tokens / 1000 * price
+        return costs
+
     def estimate_cost(self, price_per_1k_tokens: Dict[str, float]) -> Dict[str, float]:
         """
         估算成本（需要提供各模型的每 1K token 价格）
-        
+
         Args:
             price_per_1k_tokens: {model: price_per_1k_tokens}
-            
+
         Returns:
             各模型的成本估算
         """
         model_usage = self.get_model_usage()
         costs = {}
-        
+
         for model, stats in model_usage.items():
             price = price_per_1k_tokens.get(model, 0.0)
             cost = (stats["total_tokens"] / 1000) * price
             costs[model] = cost
-        
+
         return costs
-    
+
     def estimate_gpu_resources(self) -> Dict[str, any]:
         """
         估算 GPU 资源需求（基于 token 数和模型）
-        
+
         Returns:
             GPU 资源估算
         """
         # 简单的估算逻辑
         total_tokens = self.get_total_tokens()
         total_time = self.get_total_time()
-        
+
         # 假设每个 token 需要一定的计算量
         # 这里使用简化的估算
         estimated_flops = total_tokens * 1000  # 假设每个 token 需要 1000 FLOPS
-        
+
         return {
             "estimated_flops": estimated_flops,
             "total_time_seconds": total_time,
             "tokens_per_second": total_tokens / total_time if total_time > 0 else 0,
             "note": "这是基于 token 数的简化估算，实际 GPU 使用取决于模型大小和推理配置"
         }
-    
+
     def get_summary(self) -> Dict:
         """获取成本统计摘要"""
-        return {
-            "total_calls": len(self.records),
-            "total_tokens": self.get_total_tokens(),
-            "prompt_tokens": self.get_prompt_tokens(),
-            "completion_tokens": self.get_completion_tokens(),
-            "average_latency": self.get_average_latency(),
-            "total_time": self.get_total_time(),
-            "model_usage": self.get_model_usage(),
-            "gpu_estimate": self.estimate_gpu_resources()
-        }
-    
+        with self._lock:
+            return {
+                "total_calls": self.totals.calls,
+                "total_tokens": self.get_total_tokens(),
+                "prompt_tokens": self.get_prompt_tokens(),
+                "completion_tokens": self.get_completion_tokens(),
+                "average_latency": self.get_average_latency(),
+                "latency": self.get_latency_stats(),
+                "total_time": self.get_total_time(),
+                "model_usage": self.get_model_usage(),
+                "route_usage": self.get_route_usage(),
+                "phase_usage": self.get_phase_usage(),
+                "agent_usage": self.get_agent_usage(),
+                "escalations": {phase: dict(stats) for phase, stats in self.escalations.items()},
+                "cache": self.get_cache_stats(),
+                "prompt_cache": self.get_prompt_cache_stats(),
+                "streaming": self.get_stream_stats(),
+                "parsing": self.get_parse_stats(),
+                "embeddings": self.get_embedding_stats(),
+                "game_id": self.game_id,
+                "gpu_estimate": self.estimate_gpu_resources()
+            }
+
+    def merge(self, other: "CostTracker") -> "CostTracker":
+        """
+        合并另一个追踪器的统计（如进程池中各局游戏的追踪器）
+
+        原始记录按本追踪器的 retain_records 方式保留；总运行时间从两者中较早的开始时间算起。
+
+        Args:
+            other: 要合并的追踪器
+
+        Returns:
+            self
+        """
+        if other is self:
+            raise ValueError("Cannot merge a CostTracker into itself")
+        # 按固定顺序加锁，两个追踪器互相合并时不会死锁
+        first, second = sorted((self, other), key=id)
+        with first._lock, second._lock:
+            self._merge_locked(other)
+        return self
+
+    def _merge_locked(self, other: "CostTracker"):
+        """合并统计（调用方持有两个追踪器的锁）"""
+        self.totals.merge(other.totals)
+        for name in ("by_model", "by_route", "by_model_route", "by_phase", "by_agent"):
+            groups = getattr(self, name)
+            for key, aggregate in getattr(other, name).items():
+                if key not in groups:
+                    groups[key] = UsageAggregate()
+                groups[key].merge(aggregate)
+
+        if self._records is not None:
+            self._records.extend(other.records)
+        if self.retain_records is not None:
+            self.embedding_records.extend(other.embedding_records)
+        self.embedding_calls += other.embedding_calls
+        self.embedding_texts += other.embedding_texts
+        self.embedding_tokens += other.embedding_tokens
+        self.embedding_latency.merge(other.embedding_latency)
+
+        for source, hits in other.cache_hits.items():
+            self.cache_hits[source] = self.cache_hits.get(source, 0) + hits
+        self.cache_misses += other.cache_misses
+        self.cache_saved_tokens += other.cache_saved_tokens
+
+        self.stream_ttfts.merge(other.stream_ttfts)
+        self.stream_decision_times.merge(other.stream_decision_times)
+        self.stream_early_stops += other.stream_early_stops
+
+        for phase, stats in other.parse_stats.items():
+            target = self.parse_stats.setdefault(phase, dict.fromkeys(stats, 0))
+            for key, value in stats.items():
+                target[key] = target.get(key, 0) + value
+        for phase, stats in other.escalations.items():
+            target = self.escalations.setdefault(phase, {})
+            for key, value in stats.items():
+                target[key] = target.get(key, 0) + value
+
+        if other.start_time is not None:
+            self.start_time = (
+                other.start_time if self.start_time is None
+                else min(self.start_time, other.start_time)
+            )
+
     def reset(self):
         """重置统计"""
-        self.records = []
-        self.start_time = None
+        with self._lock:
+            self.current_round: Optional[int] = None  # 当前轮次（由 GameFlow 在每轮开始时设置）
+            self.start_time: Optional[float] = None
+
+            # 调用统计（总体和各维度）
+            self.totals = UsageAggregate()
+            self.by_model: Dict[str, UsageAggregate] = {}
+            self.by_route: Dict[str, UsageAggregate] = {}
+            self.by_model_route: Dict[Tuple[str, str], UsageAggregate] = {}
+            self.by_phase: Dict[str, UsageAggregate] = {}
+            self.by_agent: Dict[str, UsageAggregate] = {}
+            if self.retain_records == "columnar":
+                self._records = ColumnarRecords()
+            elif self.retain_records == "list":
+                self._records = []
+            else:
+                self._records = None
+
+            # 嵌入调用统计
+            self.embedding_records: List[EmbeddingRecord] = []
+            self.embedding_calls = 0
+            self.embedding_texts = 0
+            self.embedding_tokens = 0
+            self.embedding_latency = LatencyHistogram()
+
+            # 响应缓存统计
+            self.cache_hits: Dict[str, int] = {}  # {命中来源: 次数}
+            self.cache_misses = 0
+            self.cache_saved_tokens = 0
+
+            # 流式调用统计
+            self.stream_ttfts = LatencyHistogram()  # 首 token 时间（秒）
+            self.stream_decision_times = LatencyHistogram()  # 决策完成时间（秒）
+            self.stream_early_stops = 0
+
+            # 结构化输出解析统计 {阶段: {...}}
+            self.parse_stats: Dict[str, Dict[str, int]] = {}
 
+            # 模型级联升级次数 {阶段: {"from->to": 次数}}
+            self.escalations: Dict[str, Dict[str, int]] = {}
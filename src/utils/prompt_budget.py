@@ -0,0 +1,266 @@
+"""
+提示词 token 预算
+使用 tiktoken 计算 token 数（编码器和计数结果均有缓存），按阶段为记忆、RAG 证据、
+本轮发言等分节分配预算，超出预算时截断或丢弃价值最低的条目，使每次调用的 prompt 长度可预测
+"""
+
+import functools
+from typing import Dict, List, Optional
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+
+# 无法按模型名找到编码器时使用的编码
+DEFAULT_ENCODING = "cl100k_base"
+
+# 各阶段的默认预算：max_prompt_tokens 为整个 prompt 的上限，其余为各分节的上限
+DEFAULT_PROMPT_BUDGETS = {
+    "night_action": {
+        "max_prompt_tokens": 1600,
+        "memory": 300
+    },
+    "discussion": {
+        "max_prompt_tokens": 2400,
+        "memory": 400,
+        "rag": 500,
+        "speeches": 1000
+    },
+    "voting": {
+        "max_prompt_tokens": 2400,
+        "memory": 300,
+        "speeches": 1000
+    }
+}
+
+# 超出总上限时削减分节的顺序（价值从低到高）
+SECTION_DROP_ORDER = ["rag", "memory", "speeches"]
+
+# 截断时追加的省略标记
+ELLIPSIS = "…"
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model: Optional[str] = None):
+    """获取并缓存编码器；tiktoken 不可用或编码文件无法下载时返回 None"""
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding(DEFAULT_ENCODING)
+        except KeyError:
+            # 非 OpenAI 模型（如 deepseek-chat）使用默认编码近似
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception:
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数（中文约 1 字 1 token，英文约 4 字符 1 token）"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+@functools.lru_cache(maxsize=8192)
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    计算文本的 token 数（结果会缓存，重复出现的发言和记忆只编码一次）
+
+    Args:
+        text: 文本
+        model: 模型名称（用于选择编码器）
+
+    Returns:
+        token 数
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """
+    将文本截断到不超过 max_tokens 个 token（含省略标记）
+
+    Args:
+        text: 文本
+        max_tokens: token 上限
+        model: 模型名称
+
+    Returns:
+        截断后的文本
+    """
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+
+    limit = max(0, max_tokens - count_tokens(ELLIPSIS, model))
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        head = encoding.decode(encoding.encode(text, disallowed_special=())[:limit])
+        return head.rstrip("�") + ELLIPSIS
+
+    # 没有编码器时按估算值二分查找截断位置
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= limit:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + ELLIPSIS
+
+
+class PromptAssembler:
+    """按阶段预算裁剪提示词分节"""
+
+    def __init__(
+        self,
+        budgets: Optional[Dict[str, Dict[str, int]]] = None,
+        model: Optional[str] = None,
+        item_max_tokens: int = 200
+    ):
+        """
+        初始化提示词裁剪器
+
+        Args:
+            budgets: 各阶段预算 {phase: {"max_prompt_tokens": n, section: n}}，与默认值合并
+            model: 模型名称（用于选择编码器）
+            item_max_tokens: 单个条目（一条发言或记忆）的 token 上限
+        """
+        self.budgets = {phase: dict(budget) for phase, budget in DEFAULT_PROMPT_BUDGETS.items()}
+        for phase, budget in (budgets or {}).items():
+            self.budgets.setdefault(phase, {}).update(budget)
+        self.model = model
+        self.item_max_tokens = item_max_tokens
+        self.stats = {
+            "calls": 0,
+            "trimmed_calls": 0,
+            "dropped_items": 0,
+            "truncated_items": 0
+        }
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict], model: Optional[str] = None) -> Optional["PromptAssembler"]:
+        """
+        根据配置（game_config.yaml 中的 prompt_budget 段）创建
+
+        Args:
+            config: prompt_budget 配置，None 使用默认预算
+            model: 模型名称
+
+        Returns:
+            PromptAssembler 实例；配置中 enabled 为 false 时返回 None
+        """
+        config = config or {}
+        if not config.get("enabled", True):
+            return None
+        return cls(
+            budgets=config.get("phases"),
+            model=model,
+            item_max_tokens=config.get("item_max_tokens", 200)
+        )
+
+    def count_tokens(self, text: str) -> int:
+        """计算文本的 token 数"""
+        return count_tokens(text, self.model)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """将文本截断到 max_tokens 以内"""
+        return truncate_tokens(text, max_tokens, self.model)
+
+    def section_budget(self, phase: str, section: str) -> Optional[int]:
+        """获取某个阶段某个分节的预算（未配置时返回 None，表示不限制）"""
+        return self.budgets.get(phase, {}).get(section)
+
+    def fit_items(self, items: List[str], max_tokens: Optional[int]) -> List[str]:
+        """
+        在预算内保留条目
+
+        条目按价值从高到低排列，保留的总是一个前缀：第一个放不下的条目及其之后的都被丢弃，
+        第一条本身超出预算时截断保留。
+
+        Args:
+            items: 按价值从高到低排列的条目
+            max_tokens: 预算（None 表示不限制）
+
+        Returns:
+            保留的条目（与输入一一对应的前缀，单条可能被截断）
+        """
+        capped = []
+        for item in items:
+            if self.count_tokens(item) > self.item_max_tokens:
+                item = self.truncate(item, self.item_max_tokens)
+                self.stats["truncated_items"] += 1
+            capped.append(item)
+
+        if max_tokens is None:
+            return capped
+
+        kept = []
+        used = 0
+        for item in capped:
+            tokens = self.count_tokens(item) + 1  # 换行符
+            if used + tokens > max_tokens:
+                if not kept and max_tokens > 1:
+                    kept.append(self.truncate(item, max_tokens - 1))
+                    self.stats["truncated_items"] += 1
+                break
+            kept.append(item)
+            used += tokens
+
+        self.stats["dropped_items"] += len(capped) - len(kept)
+        return kept
+
+    def fit_section(self, phase: str, section: str, items: List[str]) -> List[str]:
+        """按阶段配置的分节预算保留条目"""
+        return self.fit_items(items, self.section_budget(phase, section))
+
+    def assemble(self, phase: str, fixed_text: str, sections: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """
+        裁剪一次调用的所有可变分节
+
+        先按各分节预算裁剪，若加上固定部分仍超过 max_prompt_tokens，
+        再按 SECTION_DROP_ORDER 依次丢弃价值最低分节中的末尾条目。
+
+        Args:
+            phase: 阶段
+            fixed_text: 不可裁剪的部分（系统提示词、阶段说明、公共局势）
+            sections: 可裁剪的分节 {section: 按价值从高到低排列的条目}
+
+        Returns:
+            裁剪后的分节 {section: 保留的条目前缀}
+        """
+        self.stats["calls"] += 1
+        truncated_before = self.stats["truncated_items"]
+        original_count = sum(len(items) for items in sections.values())
+        fitted = {name: self.fit_section(phase, name, items) for name, items in sections.items()}
+
+        max_prompt_tokens = self.section_budget(phase, "max_prompt_tokens")
+        if max_prompt_tokens is not None:
+            total = self.count_tokens(fixed_text) + sum(
+                self.count_tokens(item) + 1 for items in fitted.values() for item in items
+            )
+            order = [name for name in SECTION_DROP_ORDER if name in fitted]
+            order += [name for name in fitted if name not in order]
+            for name in order:
+                while total > max_prompt_tokens and fitted[name]:
+                    dropped = fitted[name].pop()
+                    total -= self.count_tokens(dropped) + 1
+                    self.stats["dropped_items"] += 1
+
+        kept_count = sum(len(items) for items in fitted.values())
+        if kept_count < original_count or self.stats["truncated_items"] > truncated_before:
+            self.stats["trimmed_calls"] += 1
+        return fitted
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取裁剪统计"""
+        return dict(self.stats)